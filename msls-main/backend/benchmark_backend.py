@@ -0,0 +1,216 @@
+"""
+Micro-benchmarks for the speed test endpoints.
+
+Usage:
+    python benchmark_backend.py download
+    python benchmark_backend.py concurrency
+    python benchmark_backend.py serializers
+"""
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mystarlinkstats.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from tester import admission
+from tester.models import SpeedTestResult, StarlinkKit
+from tester.serializers import SpeedTestResultSerializer, ValuesListSerializer
+from tester.views import DownloadTestView
+
+factory = APIRequestFactory()
+
+# Admission control would turn most benchmark requests into 429s; these
+# limits admit everything, in process and in the spawned servers alike.
+UNLIMITED_ADMISSION = {'RATE_PER_IP': 1e9, 'BURST_PER_IP': 10 ** 9, 'MAX_CONCURRENT_STREAMS': 10 ** 9}
+UNLIMITED_ADMISSION_ENV = {
+    'SPEEDTEST_RATE_PER_IP': str(UNLIMITED_ADMISSION['RATE_PER_IP']),
+    'SPEEDTEST_BURST_PER_IP': str(UNLIMITED_ADMISSION['BURST_PER_IP']),
+    'SPEEDTEST_MAX_CONCURRENT_STREAMS': str(UNLIMITED_ADMISSION['MAX_CONCURRENT_STREAMS']),
+}
+
+
+def legacy_download_iterator(file_size):
+    # The DownloadTestView generator before the shared payload pool.
+    chunk_size = 1024 * 1024
+    static_chunk = os.urandom(chunk_size)
+    bytes_generated = 0
+    while bytes_generated < file_size:
+        needed = file_size - bytes_generated
+        if needed >= chunk_size:
+            yield static_chunk
+            bytes_generated += chunk_size
+        else:
+            yield static_chunk[:needed]
+            bytes_generated += needed
+
+
+def drain(response):
+    assert response.status_code == 200, f'download answered {response.status_code}'
+    total = 0
+    for chunk in response.streaming_content:
+        total += len(chunk)
+    return total
+
+
+def report(label, total_bytes, elapsed):
+    print(f"{label:<28} {total_bytes / elapsed / 1e9:8.2f} GB/s  ({total_bytes * 8 / elapsed / 1e9:.1f} Gbit/s)")
+
+
+def bench_download(requests_count=200, size=10 * 1024 * 1024 + 12345):
+    """
+    Bytes/sec a single worker can push through DownloadTestView.
+    """
+    print(f"Download: {requests_count} requests x {size} bytes, single worker")
+
+    start = time.perf_counter()
+    total = 0
+    for _ in range(requests_count):
+        response = StreamingHttpResponse(legacy_download_iterator(size), content_type='application/octet-stream')
+        total += drain(response)
+    report('before (urandom/request)', total, time.perf_counter() - start)
+
+    view = DownloadTestView.as_view()
+    with override_settings(SPEEDTEST_ADMISSION={**admission.DEFAULTS, **UNLIMITED_ADMISSION}):
+        admission._controller = None
+        try:
+            drain(view(factory.get('/api/download/', {'size': size})))  # build the pool outside the timed loop
+            start = time.perf_counter()
+            total = 0
+            for _ in range(requests_count):
+                total += drain(view(factory.get('/api/download/', {'size': size})))
+            report('after (shared pool)', total, time.perf_counter() - start)
+        finally:
+            admission._controller = None
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+async def _fetch(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    started = time.perf_counter()
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    head = await reader.read(65536)
+    first_byte = time.perf_counter() - started
+    total = len(head)
+    while chunk := await reader.read(1024 * 1024):
+        total += len(chunk)
+    writer.close()
+    return first_byte, total, head.split(b' ', 2)[1:2] == [b'200']
+
+
+async def _storm(port, path, clients):
+    started = time.perf_counter()
+    results = await asyncio.gather(*(_fetch(port, path) for _ in range(clients)))
+    return time.perf_counter() - started, results
+
+
+def bench_concurrency(clients=500, size=1024 * 1024):
+    """
+    Concurrent downloads against one worker: gunicorn sync (WSGI fallback)
+    versus uvicorn serving the native ASGI endpoints.
+    """
+    print(f"Concurrency: {clients} simultaneous downloads x {size} bytes, one worker")
+    servers = {
+        'gunicorn sync (WSGI)': [sys.executable, '-m', 'gunicorn', '-w', '1', '--backlog', '4096',
+                                 '-b', '127.0.0.1:{port}', 'mystarlinkstats.wsgi:application'],
+        'uvicorn (native ASGI)': [sys.executable, '-m', 'uvicorn', '--workers', '1', '--backlog', '4096',
+                                  '--log-level', 'warning', '--port', '{port}', 'mystarlinkstats.asgi:application'],
+    }
+    for label, command in servers.items():
+        port = _free_port()
+        proc = subprocess.Popen([arg.format(port=port) for arg in command], env={**os.environ, **UNLIMITED_ADMISSION_ENV},
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_for_port(port)
+            elapsed, results = asyncio.run(_storm(port, f"/api/download/?size={size}", clients))
+        finally:
+            proc.terminate()
+            proc.wait()
+        refused = sum(1 for r in results if not r[2])
+        assert not refused, f'{label}: {refused} of {clients} downloads were not answered with 200'
+        first_bytes = sorted(r[0] for r in results)
+        total = sum(r[1] for r in results)
+        print(f"{label:<24} wall {elapsed:6.2f}s  {total / elapsed / 1e6:8.1f} MB/s  "
+              f"TTFB p50 {statistics.median(first_bytes) * 1000:7.1f}ms  max {first_bytes[-1] * 1000:7.1f}ms")
+
+
+def bench_serializers(sizes=(1000, 10000, 100000)):
+    """
+    Result list serialization to JSON: SpeedTestResultSerializer over model
+    instances versus ValuesListSerializer over values_list() rows. Runs
+    against a throwaway test database.
+    """
+    print("Serializers: result list rows -> JSON bytes, query included")
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = User.objects.create_user('bench', email='bench@example.com')
+        kit = StarlinkKit.objects.create(kit_id='BENCH', nickname='Bench', assigned_user=user)
+        renderer = JSONRenderer()
+        read_serializer = ValuesListSerializer(SpeedTestResultSerializer)
+        for size in sizes:
+            missing = size - SpeedTestResult.objects.count()
+            SpeedTestResult.objects.bulk_create([
+                SpeedTestResult(
+                    starlink_kit=kit, download_speed_mbps=100 + i % 97, upload_speed_mbps=10 + i % 13,
+                    latency_ms=25 + i % 31, jitter_ms=i % 7, isp_name='SpaceX Starlink', is_starlink=True,
+                    client_ip='203.0.113.7', idle_latency_p50_ms=24.5,
+                )
+                for i in range(missing)
+            ], batch_size=5000)
+            queryset = SpeedTestResult.objects.filter(starlink_kit=kit).order_by('-created_at', '-id')[:size]
+
+            start = time.perf_counter()
+            before = renderer.render(SpeedTestResultSerializer(queryset, many=True).data)
+            model_elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            after = renderer.render(read_serializer.to_representation(read_serializer.values(queryset)))
+            values_elapsed = time.perf_counter() - start
+
+            assert before == after, 'read paths disagree'
+            print(f"{size:>7} rows  ModelSerializer {model_elapsed * 1000:8.1f}ms  "
+                  f"ValuesListSerializer {values_elapsed * 1000:8.1f}ms  ({model_elapsed / values_elapsed:.1f}x)")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+BENCHMARKS = {
+    'download': bench_download,
+    'concurrency': bench_concurrency,
+    'serializers': bench_serializers,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+        print()
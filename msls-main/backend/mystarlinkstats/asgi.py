@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Serve with an event-loop server to get the non-blocking speed test
+endpoints, e.g. ``uvicorn mystarlinkstats.asgi:application`` or
+``gunicorn -k uvicorn.workers.UvicornWorker mystarlinkstats.asgi:application``.
 """
 
 import os
@@ -13,4 +17,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mystarlinkstats.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up: the speed test fast path reads settings
+# and reverses URLs at construction time.
+from tester.streaming import SpeedTestASGIMiddleware  # noqa: E402
+
+application = SpeedTestASGIMiddleware(django_application)
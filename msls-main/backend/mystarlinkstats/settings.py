@@ -125,6 +125,17 @@ else:
         }
     }
 
+# --- CACHE CONFIGURATION ---
+# Speed test sessions, stream stats and admission limits live in the default cache.
+# Multi-worker deploys should point REDIS_URL at a shared Redis instance.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -166,3 +177,119 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
 }
+
+# --- SPEED TEST CONFIGURATION ---
+# Optional pre-generated random file (e.g. `head -c 128M /dev/urandom > payload.bin`).
+# When set it is memory-mapped and served with sendfile where the server supports it;
+# otherwise each worker builds an in-memory pool of SPEEDTEST_PAYLOAD_POOL_BYTES.
+SPEEDTEST_PAYLOAD_FILE = os.environ.get('SPEEDTEST_PAYLOAD_FILE')
+SPEEDTEST_PAYLOAD_POOL_BYTES = int(os.environ.get('SPEEDTEST_PAYLOAD_POOL_BYTES', 4 * 1024 * 1024))
+# Serve ping/download/upload directly on the event loop when running under ASGI.
+SPEEDTEST_ASGI_FAST_PATH = os.environ.get('SPEEDTEST_ASGI_FAST_PATH', 'True') == 'True'
+# Throughput curves: bucket width and the share of buckets discarded as warm-up/tail
+# when computing steady_state_mbps. Per-stream download stats live in the default
+# cache, so multi-worker deploys need a shared backend (Redis) for download/stats/.
+SPEEDTEST_SAMPLE_INTERVAL_SECONDS = float(os.environ.get('SPEEDTEST_SAMPLE_INTERVAL_SECONDS', 0.1))
+SPEEDTEST_WARMUP_FRACTION = 0.25
+SPEEDTEST_TAIL_FRACTION = 0.1
+SPEEDTEST_STREAM_STATS_TTL = 300
+# WebSocket latency probe (ASGI only): default and maximum frames per second and per probe,
+# the longest an idle-mode probe may run, and how long to wait for outstanding echoes before
+# counting them as lost. Probes count against SPEEDTEST_ADMISSION like bandwidth streams.
+SPEEDTEST_PROBE_PATH = '/api/probe/'
+SPEEDTEST_PROBE_RATE = 50
+SPEEDTEST_PROBE_MAX_RATE = 500
+SPEEDTEST_PROBE_COUNT = 100
+SPEEDTEST_PROBE_MAX_COUNT = 5000
+SPEEDTEST_PROBE_MAX_SECONDS = 60
+SPEEDTEST_PROBE_GRACE_SECONDS = 2
+# Loaded-latency mode keeps a low-rate probe running through the download/upload phases.
+SPEEDTEST_LOADED_PROBE_RATE = 10
+SPEEDTEST_LOADED_PROBE_MAX_SECONDS = 300
+# Server-coordinated test sessions expire if not finalized within this many seconds.
+SPEEDTEST_SESSION_TTL = 300
+# Duration-bounded tests (?duration=): longest allowed run, per-stream byte cap, the
+# amount of transfer time each adaptive chunk targets, and the stream count ceiling
+# suggested to clients from the measured ramp.
+SPEEDTEST_MAX_DURATION_SECONDS = 15
+SPEEDTEST_MAX_DURATION_BYTES = 2 * 1024 * 1024 * 1024
+SPEEDTEST_CHUNK_SECONDS = 0.05
+SPEEDTEST_MAX_STREAMS = 8
+# Admission control for the public bandwidth test endpoints (see tester/admission.py).
+# Keep MAX_CONCURRENT_STREAMS below the number of sync workers so the API stays responsive.
+SPEEDTEST_ADMISSION = {
+    'BACKEND': (
+        'tester.admission.CacheAdmissionController' if os.environ.get('REDIS_URL')
+        else 'tester.admission.LocalAdmissionController'
+    ),
+    'RATE_PER_IP': float(os.environ.get('SPEEDTEST_RATE_PER_IP', 1.0)),
+    'BURST_PER_IP': int(os.environ.get('SPEEDTEST_BURST_PER_IP', 16)),
+    'MAX_CONCURRENT_STREAMS': int(os.environ.get('SPEEDTEST_MAX_CONCURRENT_STREAMS', 64)),
+    'EGRESS_BYTES_PER_SECOND': int(os.environ['SPEEDTEST_EGRESS_BYTES_PER_SECOND']) if os.environ.get('SPEEDTEST_EGRESS_BYTES_PER_SECOND') else None,
+}
+# Largest batch accepted by POST /api/results/bulk/.
+SPEEDTEST_BULK_MAX_ITEMS = 5000
+
+# Per-user list versions behind ETag/304 on the kit/result lists (see tester/versions.py).
+# They must live in a cache every worker shares, so by default they are only on with
+# REDIS_URL set; LIST_VERSIONS_ENABLED=True forces them on (single-process setups).
+LIST_VERSIONS = {
+    'ENABLED': {'True': True, 'False': False}.get(os.environ.get('LIST_VERSIONS_ENABLED')),
+    'CACHE_ALIAS': 'default',
+    'TTL': 24 * 60 * 60,
+}
+# Serialized kit/result list pages, cached per user and data version (see
+# tester/listcache.py) for at most TTL seconds; only active while LIST_VERSIONS is.
+# Stats at /api/list-cache/stats/.
+LIST_CACHE = {
+    'ENABLED': os.environ.get('LIST_CACHE_ENABLED', 'True') == 'True',
+    'CACHE_ALIAS': 'default',
+    'TTL': 10 * 60,
+}
+# Raw results are downsampled into the rollups/sketches and deleted after RAW_DAYS;
+# summaries expire after their own horizon (None keeps them). Run
+# `manage.py apply_retention` from cron, or Celery beat runs it daily.
+SPEEDTEST_RETENTION = {
+    'RAW_DAYS': int(os.environ.get('SPEEDTEST_RAW_RETENTION_DAYS', 90)),
+    'HOURLY_DAYS': 2 * 365,
+    'DAILY_DAYS': None,
+    'SKETCH_DAYS': None,
+    'BATCH_SIZE': 1000,
+    'BATCH_PAUSE': 0.05,
+}
+
+# --- ISP DETECTION ---
+# IP range -> ASN dataset in the ip2asn TSV layout (https://iptoasn.com); defaults to a
+# small bundled fixture. The file is reloaded when it changes. Addresses it doesn't
+# cover fall back to ip-api.com unless ISP_REMOTE_LOOKUP is False.
+ISP_DATASET_PATH = os.environ.get('ISP_DATASET_PATH')
+ISP_DATASET_RELOAD_SECONDS = 30
+ISP_REMOTE_LOOKUP = os.environ.get('ISP_REMOTE_LOOKUP', 'True') == 'True'
+# Cache for remote ISP lookups: per-process LRU in front of the default cache, keyed
+# by network prefix. Failures are cached for NEGATIVE_TTL seconds.
+ISP_CACHE = {
+    'LRU_SIZE': 4096,
+    'TTL': 24 * 60 * 60,
+    'NEGATIVE_TTL': 60,
+    'IPV4_PREFIX': 24,
+    'IPV6_PREFIX': 48,
+}
+# Results are saved without ISP info and enriched in the background (see
+# tester/enrichment.py): on a Celery worker when CELERY_BROKER_URL is set, otherwise on
+# in-process threads. Run a worker with `celery -A mystarlinkstats worker`.
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL')
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_BEAT_SCHEDULE = {
+    'apply-retention': {'task': 'tester.tasks.apply_retention_task', 'schedule': 24 * 60 * 60},
+}
+ISP_ENRICHMENT = {
+    'BACKEND': (
+        'tester.enrichment.CeleryEnrichmentBackend' if CELERY_BROKER_URL
+        else 'tester.enrichment.ThreadPoolEnrichmentBackend'
+    ),
+    'WORKERS': 2,
+    'BATCH_SIZE': 100,
+    'BATCH_WAIT': 0.05,
+    'MAX_RETRIES': 5,
+    'RETRY_DELAY': 90,
+}
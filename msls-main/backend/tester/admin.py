@@ -9,5 +9,5 @@ class StarlinkKitAdmin(admin.ModelAdmin):
 @admin.register(SpeedTestResult)
 class SpeedTestResultAdmin(admin.ModelAdmin):
     list_display = ('isp_name', 'download_speed_mbps', 'upload_speed_mbps', 'starlink_kit', 'created_at')
-    list_filter = ('is_starlink', 'created_at')
+    list_filter = ('is_starlink', 'enrichment_status', 'created_at')
     search_fields = ('isp_name', 'starlink_kit__nickname')
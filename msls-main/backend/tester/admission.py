@@ -0,0 +1,316 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+# --- Admission Control for Bandwidth Tests ---
+#
+# The download/upload endpoints are public and each stream can hold a worker
+# for seconds. Before a stream starts, the controller checks three limits:
+# a per-IP token bucket, a cap on concurrent streams, and a total egress
+# budget in bytes/second. The cap keeps enough workers free for the
+# authenticated API. Rejected clients get 429 with Retry-After.
+#
+# LocalAdmissionController keeps its state per process. CacheAdmissionController
+# keeps it in the Django cache (Redis in production) so every worker shares one
+# set of limits. Pick one with SPEEDTEST_ADMISSION['BACKEND']. Both offer
+# a/-prefixed coroutine variants for the ASGI endpoints, which must not
+# block the event loop on cache round-trips, and tickets hand egress to
+# the controller in EGRESS_FLUSH_BYTES batches rather than per chunk.
+
+DEFAULTS = {
+    'BACKEND': 'tester.admission.LocalAdmissionController',
+    'RATE_PER_IP': 1.0,            # streams per second, refilled continuously
+    'BURST_PER_IP': 16,            # bucket size: one full multi-stream test
+    'MAX_CONCURRENT_STREAMS': 64,
+    'EGRESS_BYTES_PER_SECOND': None,
+    'EGRESS_FLUSH_BYTES': 1024 * 1024,
+    'BUSY_RETRY_AFTER': 2,
+}
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+class AdmissionDenied(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """
+    Returned by a successful admit(). Streams report the bytes they send and
+    must release() exactly once when they finish; extra calls are ignored.
+    Egress is passed on once EGRESS_FLUSH_BYTES have built up, and on release.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.released = False
+        self.unflushed = 0
+
+    def _buffer_egress(self, nbytes):
+        if not self.controller.config['EGRESS_BYTES_PER_SECOND']:
+            return False
+        self.unflushed += nbytes
+        return self.unflushed >= self.controller.config['EGRESS_FLUSH_BYTES']
+
+    def _take_egress(self):
+        nbytes, self.unflushed = self.unflushed, 0
+        return nbytes
+
+    def record_egress(self, nbytes):
+        if self._buffer_egress(nbytes):
+            self.controller.record_egress(self._take_egress())
+
+    async def arecord_egress(self, nbytes):
+        if self._buffer_egress(nbytes):
+            await self.controller.arecord_egress(self._take_egress())
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            if self.unflushed:
+                self.controller.record_egress(self._take_egress())
+            self.controller.release()
+
+    async def arelease(self):
+        if not self.released:
+            self.released = True
+            if self.unflushed:
+                await self.controller.arecord_egress(self._take_egress())
+            await self.controller.arelease()
+
+
+def get_admission_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'SPEEDTEST_ADMISSION', {}))
+    return config
+
+
+class LocalAdmissionController:
+    """
+    In-process admission state guarded by a lock.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.active = 0
+        self.egress_tokens = config['EGRESS_BYTES_PER_SECOND'] or 0
+        self.egress_updated = time.monotonic()
+
+    def _refill_egress(self, now):
+        rate = self.config['EGRESS_BYTES_PER_SECOND']
+        self.egress_tokens = min(rate, self.egress_tokens + (now - self.egress_updated) * rate)
+        self.egress_updated = now
+
+    def admit(self, client_ip):
+        rate = self.config['RATE_PER_IP']
+        burst = self.config['BURST_PER_IP']
+        egress_rate = self.config['EGRESS_BYTES_PER_SECOND']
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated = self.buckets.get(client_ip, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self.buckets[client_ip] = (tokens, now)
+                raise AdmissionDenied('rate', (1 - tokens) / rate)
+            if self.active >= self.config['MAX_CONCURRENT_STREAMS']:
+                raise AdmissionDenied('busy', self.config['BUSY_RETRY_AFTER'])
+            if egress_rate:
+                self._refill_egress(now)
+                if self.egress_tokens <= 0:
+                    raise AdmissionDenied('egress', -self.egress_tokens / egress_rate + 1)
+            self.buckets[client_ip] = (tokens - 1, now)
+            self.active += 1
+            # Forget idle clients whose buckets have refilled completely.
+            if len(self.buckets) > 10000:
+                horizon = burst / rate
+                self.buckets = {ip: b for ip, b in self.buckets.items() if now - b[1] < horizon}
+        return AdmissionTicket(self)
+
+    def release(self):
+        with self.lock:
+            self.active = max(0, self.active - 1)
+
+    def record_egress(self, nbytes):
+        if not self.config['EGRESS_BYTES_PER_SECOND']:
+            return
+        with self.lock:
+            self._refill_egress(time.monotonic())
+            self.egress_tokens -= nbytes
+
+    # No I/O and only brief lock holds, so the coroutines run inline.
+
+    async def aadmit(self, client_ip):
+        return self.admit(client_ip)
+
+    async def arelease(self):
+        self.release()
+
+    async def arecord_egress(self, nbytes):
+        self.record_egress(nbytes)
+
+
+class CacheAdmissionController:
+    """
+    Admission state in the Django cache, shared by every worker.
+
+    Cache backends only offer atomic add/incr/decr, so the per-IP bucket and
+    the egress budget are approximated by fixed windows: each IP may start
+    BURST_PER_IP streams per BURST_PER_IP / RATE_PER_IP seconds, and the
+    egress counter covers one-second windows. The concurrency counter
+    expires after an hour, so counts leaked by a crashed worker clear up.
+    """
+
+    ACTIVE_KEY = 'speedtest:admission:active'
+    IP_KEY = 'speedtest:admission:ip:{}:{}'
+    EGRESS_KEY = 'speedtest:admission:egress:{}'
+
+    def __init__(self, config):
+        self.config = config
+
+    def _incr(self, key, delta, timeout):
+        cache.add(key, 0, timeout)
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            # Expired between add() and incr().
+            cache.set(key, delta, timeout)
+            return delta
+
+    def admit(self, client_ip):
+        window = self.config['BURST_PER_IP'] / self.config['RATE_PER_IP']
+        now = time.time()
+        window_index = int(now // window)
+        ip_key = self.IP_KEY.format(client_ip, window_index)
+        if self._incr(ip_key, 1, math.ceil(window)) > self.config['BURST_PER_IP']:
+            raise AdmissionDenied('rate', (window_index + 1) * window - now)
+
+        egress_rate = self.config['EGRESS_BYTES_PER_SECOND']
+        if egress_rate and (cache.get(self.EGRESS_KEY.format(int(now))) or 0) >= egress_rate:
+            raise AdmissionDenied('egress', 1)
+
+        if self._incr(self.ACTIVE_KEY, 1, 3600) > self.config['MAX_CONCURRENT_STREAMS']:
+            self.release()
+            raise AdmissionDenied('busy', self.config['BUSY_RETRY_AFTER'])
+        return AdmissionTicket(self)
+
+    def release(self):
+        try:
+            if cache.decr(self.ACTIVE_KEY) < 0:
+                cache.set(self.ACTIVE_KEY, 0, 3600)
+        except ValueError:
+            pass
+
+    def record_egress(self, nbytes):
+        if self.config['EGRESS_BYTES_PER_SECOND']:
+            self._incr(self.EGRESS_KEY.format(int(time.time())), nbytes, 5)
+
+    # Coroutine twins of the above on the async cache API.
+
+    async def _aincr(self, key, delta, timeout):
+        await cache.aadd(key, 0, timeout)
+        try:
+            return await cache.aincr(key, delta)
+        except ValueError:
+            await cache.aset(key, delta, timeout)
+            return delta
+
+    async def aadmit(self, client_ip):
+        window = self.config['BURST_PER_IP'] / self.config['RATE_PER_IP']
+        now = time.time()
+        window_index = int(now // window)
+        ip_key = self.IP_KEY.format(client_ip, window_index)
+        if await self._aincr(ip_key, 1, math.ceil(window)) > self.config['BURST_PER_IP']:
+            raise AdmissionDenied('rate', (window_index + 1) * window - now)
+
+        egress_rate = self.config['EGRESS_BYTES_PER_SECOND']
+        if egress_rate and (await cache.aget(self.EGRESS_KEY.format(int(now))) or 0) >= egress_rate:
+            raise AdmissionDenied('egress', 1)
+
+        if await self._aincr(self.ACTIVE_KEY, 1, 3600) > self.config['MAX_CONCURRENT_STREAMS']:
+            await self.arelease()
+            raise AdmissionDenied('busy', self.config['BUSY_RETRY_AFTER'])
+        return AdmissionTicket(self)
+
+    async def arelease(self):
+        try:
+            if await cache.adecr(self.ACTIVE_KEY) < 0:
+                await cache.aset(self.ACTIVE_KEY, 0, 3600)
+        except ValueError:
+            pass
+
+    async def arecord_egress(self, nbytes):
+        if self.config['EGRESS_BYTES_PER_SECOND']:
+            await self._aincr(self.EGRESS_KEY.format(int(time.time())), nbytes, 5)
+
+
+def get_admission_controller():
+    """
+    Process-wide controller built from SPEEDTEST_ADMISSION.
+    """
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                config = get_admission_config()
+                _controller = import_string(config['BACKEND'])(config)
+    return _controller
+
+
+class AdmittedStream:
+    """
+    Response iterator wrapper that counts bytes against the egress budget
+    and frees the stream's slot on close(). A class rather than a generator
+    so the slot is freed even if the server closes the response before the
+    first chunk (HEAD requests, early disconnects).
+    """
+
+    def __init__(self, chunks, ticket):
+        self.chunks = iter(chunks)
+        self.ticket = ticket
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.ticket.release()
+            raise
+        self.ticket.record_egress(len(chunk))
+        return chunk
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+        self.ticket.release()
+
+
+class SpeedTestAdmissionThrottle(BaseThrottle):
+    """
+    DRF throttle front-end for the admission controller. On success the
+    ticket is left on ``request.admission`` for the view to hand to the
+    response; DRF turns a refusal into 429 with Retry-After.
+    """
+
+    def allow_request(self, request, view):
+        try:
+            request.admission = get_admission_controller().admit(self.get_ident(request))
+        except AdmissionDenied as denied:
+            self.retry_after = denied.retry_after
+            return False
+        return True
+
+    def wait(self):
+        return self.retry_after
@@ -0,0 +1,98 @@
+from django.db.backends.signals import connection_created
+from django.db.models import Aggregate, Avg, Count, FloatField, Max, Min
+from django.db.models.functions import Trunc
+from django.dispatch import receiver
+
+from .latency import percentile
+
+# --- Time-Series Aggregation ---
+#
+# Buckets results per kit and hour/day/week in a single GROUP BY query.
+# Postgres computes percentiles with percentile_cont ... WITHIN GROUP.
+# SQLite has no percentile function, so one with the same interpolation is
+# registered on every SQLite connection.
+
+BUCKETS = ('hour', 'day', 'week')
+METRICS = {
+    'download': 'download_speed_mbps',
+    'upload': 'upload_speed_mbps',
+    'latency': 'latency_ms',
+    'jitter': 'jitter_ms',
+}
+PERCENTILES = (50, 95)
+
+
+class PercentileCont(Aggregate):
+    """
+    Linearly interpolated percentile (``fraction`` between 0 and 1) of a
+    numeric column.
+    """
+    function = 'percentile_cont'
+    name = 'PercentileCont'
+    output_field = FloatField()
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='%(function)s(%(expressions)s, %(fraction)s)', **extra_context)
+
+
+class SQLitePercentile:
+    """
+    ``percentile_cont(value, fraction)`` aggregate for SQLite connections.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.fraction = None
+
+    def step(self, value, fraction):
+        if value is not None:
+            self.values.append(value)
+        self.fraction = fraction
+
+    def finalize(self):
+        self.values.sort()
+        return percentile(self.values, self.fraction * 100) if self.values else None
+
+
+@receiver(connection_created)
+def register_sqlite_functions(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        connection.connection.create_aggregate('percentile_cont', 2, SQLitePercentile)
+
+
+def aggregate_results(queryset, bucket):
+    """
+    Per-kit, per-bucket count and mean/min/max/percentiles of every metric.
+    Returns one dict per (kit, bucket), oldest bucket first.
+    """
+    annotations = {'count': Count('id')}
+    for name, field in METRICS.items():
+        annotations[f'{name}_mean'] = Avg(field)
+        annotations[f'{name}_min'] = Min(field)
+        annotations[f'{name}_max'] = Max(field)
+        for q in PERCENTILES:
+            annotations[f'{name}_p{q}'] = PercentileCont(field, q / 100)
+
+    rows = (
+        queryset.order_by()
+        .annotate(bucket=Trunc('created_at', bucket))
+        .values('starlink_kit', 'bucket')
+        .annotate(**annotations)
+        .order_by('starlink_kit', 'bucket')
+    )
+    results = []
+    for row in rows:
+        entry = {'starlink_kit': row['starlink_kit'], 'bucket': row['bucket'], 'count': row['count']}
+        for name in METRICS:
+            entry[name] = {
+                'mean': row[f'{name}_mean'],
+                'min': row[f'{name}_min'],
+                'max': row[f'{name}_max'],
+                **{f'p{q}': row[f'{name}_p{q}'] for q in PERCENTILES},
+            }
+        results.append(entry)
+    return results
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class TesterConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "tester"
+
+    def ready(self):
+        # Registers the SQLite percentile_cont aggregate on new connections
+        # and the signal handlers that maintain the rollup tables and the
+        # list versions behind conditional GET.
+        from . import aggregates, rollups, versions  # noqa: F401
@@ -0,0 +1,233 @@
+import ast
+import datetime
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+from array import array
+
+from django.db.models import Count, Max
+from django.db.models.functions import TruncDate
+
+from .models import SpeedTestResult
+
+# --- Columnar Export ---
+#
+# Results are written as one directory per UTC day, each column a NumPy
+# .npy file (format 1.0: magic, little-endian header length, a dict
+# header padded to 64 bytes, then the raw little-endian values), so
+#
+#     numpy.load('results/day=2024-03-01/download_speed_mbps.npy', mmap_mode='r')
+#
+# maps a column without copying or parsing it. String columns are
+# dictionary encoded: <name>.npy holds int32 codes into the JSON list in
+# <name>.json. Missing floats are NaN and unassigned kits are -1.
+#
+#     results/
+#       manifest.json             columns, dtypes and {day: {rows, max_id, updated}}
+#       day=2024-03-01/
+#         id.npy  starlink_kit.npy  created_at.npy (datetime64[us])  ...
+#         isp_name.npy  isp_name.json
+#
+# A run compares each day's row count, highest id and latest updated_at
+# with the manifest and only rewrites days that changed, so a nightly
+# export writes yesterday's partition plus any day that received late
+# uploads or had rows enriched or edited in place.
+
+FORMAT_NAME = 'msls-columnar'
+FORMAT_VERSION = 1
+NPY_MAGIC = b'\x93NUMPY'
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+NAN = float('nan')
+
+# name: (npy descr, array typecode)
+COLUMNS = {
+    'id': ('<i8', 'q'),
+    'starlink_kit': ('<i8', 'q'),
+    'created_at': ('<M8[us]', 'q'),
+    'download_speed_mbps': ('<f4', 'f'),
+    'upload_speed_mbps': ('<f4', 'f'),
+    'latency_ms': ('<f4', 'f'),
+    'jitter_ms': ('<f4', 'f'),
+    'is_starlink': ('|b1', 'b'),
+    'idle_latency_p50_ms': ('<f4', 'f'),
+    'idle_latency_p95_ms': ('<f4', 'f'),
+    'download_latency_p50_ms': ('<f4', 'f'),
+    'download_latency_p95_ms': ('<f4', 'f'),
+    'upload_latency_p50_ms': ('<f4', 'f'),
+    'upload_latency_p95_ms': ('<f4', 'f'),
+}
+DICTIONARY_COLUMNS = ('isp_name', 'enrichment_status')
+CODE_DTYPE = ('<i4', 'i')
+MEMORYVIEW_FORMATS = {'<i8': 'q', '<M8[us]': 'q', '<f4': 'f', '|b1': '?', '<i4': 'i'}
+
+
+def npy_header(descr, length):
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({length},), }}"
+    # magic + version + header length + header + newline, to a multiple of 64
+    padding = -(len(NPY_MAGIC) + 4 + len(header) + 1) % 64
+    header = header + ' ' * padding + '\n'
+    return NPY_MAGIC + b'\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def write_npy(path, descr, values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    with open(path, 'wb') as f:
+        f.write(npy_header(descr, len(values)))
+        values.tofile(f)
+
+
+def load_column(path):
+    """
+    Memory-map one .npy column and return it as a typed memoryview, for
+    readers without NumPy. Values are little endian.
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapped[:len(NPY_MAGIC)] != NPY_MAGIC:
+        raise ValueError(f'{path} is not a .npy file')
+    (header_length,) = struct.unpack_from('<H', mapped, len(NPY_MAGIC) + 2)
+    offset = len(NPY_MAGIC) + 4
+    header = ast.literal_eval(mapped[offset:offset + header_length].decode('latin1'))
+    return memoryview(mapped)[offset + header_length:].cast(MEMORYVIEW_FORMATS[header['descr']])
+
+
+def day_stats(queryset):
+    """
+    {day: {rows, max_id, updated}} for every UTC day with results in
+    ``queryset``, in the manifest's partition format.
+    """
+    rows = (
+        queryset.order_by()
+        .annotate(day=TruncDate('created_at', tzinfo=datetime.timezone.utc))
+        .values_list('day')
+        .annotate(rows=Count('id'), max_id=Max('id'), updated=Max('updated_at'))
+    )
+    return {
+        day: {'rows': count, 'max_id': max_id, 'updated': updated.isoformat()}
+        for day, count, max_id, updated in rows
+    }
+
+
+def write_partition(path, rows):
+    """
+    Write ``rows`` (tuples of COLUMNS then DICTIONARY_COLUMNS) into the
+    partition directory ``path``, replacing it. Returns (rows, max_id).
+    """
+    columns = {name: array(typecode) for name, (_, typecode) in COLUMNS.items()}
+    codes = {name: array(CODE_DTYPE[1]) for name in DICTIONARY_COLUMNS}
+    dictionaries = {name: {} for name in DICTIONARY_COLUMNS}
+    appends = [columns[name].append for name in COLUMNS]
+    count, max_id = 0, None
+    for row in rows:
+        (pk, kit_id, created_at, *values), strings = row[:len(COLUMNS)], row[len(COLUMNS):]
+        appends[0](pk)
+        appends[1](-1 if kit_id is None else kit_id)
+        appends[2]((created_at - EPOCH) // MICROSECOND)
+        for append, value in zip(appends[3:], values):
+            append(NAN if value is None else value)
+        for name, value in zip(DICTIONARY_COLUMNS, strings):
+            dictionary = dictionaries[name]
+            code = dictionary.get(value)
+            if code is None:
+                code = dictionary[value] = len(dictionary)
+            codes[name].append(code)
+        count += 1
+        max_id = pk if max_id is None else max(max_id, pk)
+
+    staging = path + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name, (descr, _) in COLUMNS.items():
+        write_npy(os.path.join(staging, f'{name}.npy'), descr, columns[name])
+    for name in DICTIONARY_COLUMNS:
+        write_npy(os.path.join(staging, f'{name}.npy'), CODE_DTYPE[0], codes[name])
+        with open(os.path.join(staging, f'{name}.json'), 'w') as f:
+            json.dump(list(dictionaries[name]), f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(staging, path)
+    return count, max_id
+
+
+def read_manifest(root):
+    try:
+        with open(os.path.join(root, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {'partitions': {}}
+    if manifest.get('format') != FORMAT_NAME or manifest.get('version') != FORMAT_VERSION:
+        raise ValueError(f'{root} holds an incompatible export')
+    return manifest
+
+
+def write_manifest(root, partitions):
+    manifest = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'partitioning': 'day',
+        'columns': {name: descr for name, (descr, _) in COLUMNS.items()},
+        'dictionary_columns': {name: CODE_DTYPE[0] for name in DICTIONARY_COLUMNS},
+        'partitions': dict(sorted(partitions.items())),
+    }
+    staging = os.path.join(root, 'manifest.json.tmp')
+    with open(staging, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(staging, os.path.join(root, 'manifest.json'))
+
+
+def export_columnar(root, queryset=None, since=None, until=None, chunk_size=5000, progress=None):
+    """
+    Bring the export in ``root`` up to date with ``queryset`` (default all
+    results) for UTC days in [since, until). Days whose row count, highest
+    id or latest update changed are rewritten, days that no longer have
+    results are dropped, and the rest are left alone. Returns the days
+    written.
+    """
+    if queryset is None:
+        queryset = SpeedTestResult.objects.all()
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=datetime.datetime.combine(since, datetime.time.min, datetime.timezone.utc))
+    if until is not None:
+        queryset = queryset.filter(created_at__lt=datetime.datetime.combine(until, datetime.time.min, datetime.timezone.utc))
+
+    os.makedirs(root, exist_ok=True)
+    partitions = read_manifest(root)['partitions']
+    current = day_stats(queryset)
+
+    for key in list(partitions):
+        day = datetime.date.fromisoformat(key)
+        in_range = (since is None or day >= since) and (until is None or day < until)
+        if in_range and day not in current:
+            shutil.rmtree(os.path.join(root, f'day={key}'), ignore_errors=True)
+            del partitions[key]
+
+    fields = [*COLUMNS, *DICTIONARY_COLUMNS]
+    written = []
+    for day, stats in sorted(current.items()):
+        key = day.isoformat()
+        if partitions.get(key) == stats:
+            continue
+        start = datetime.datetime.combine(day, datetime.time.min, datetime.timezone.utc)
+        rows = (
+            queryset.filter(created_at__gte=start, created_at__lt=start + datetime.timedelta(days=1))
+            .order_by('created_at', 'id')
+            .values_list(*fields)
+            .iterator(chunk_size=chunk_size)
+        )
+        count, max_id = write_partition(os.path.join(root, f'day={key}'), rows)
+        # A row written since day_stats() ran leaves a stale 'updated', so the
+        # next run rewrites the day once more rather than missing the change.
+        partitions[key] = {**stats, 'rows': count, 'max_id': max_id}
+        # Saved after every day so an interrupted run resumes where it stopped.
+        write_manifest(root, partitions)
+        written.append(day)
+        if progress:
+            progress(day, count)
+
+    write_manifest(root, partitions)
+    return written
@@ -0,0 +1,194 @@
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .isp import UNRESOLVED, classify_isp, get_isp_info
+from .ispcache import is_success
+from .models import SpeedTestResult
+from .versions import bump_kit_owners
+
+logger = logging.getLogger(__name__)
+
+# --- Asynchronous ISP Enrichment ---
+#
+# Results are saved straight away with enrichment_status=Pending and an empty
+# isp_name, so a slow ISP lookup never holds up the request that submits them.
+# Afterwards a background worker fills in isp_name/is_starlink. It resolves
+# each distinct client IP in a batch once, and retries lookups that failed
+# transiently with exponential backoff.
+#
+# CeleryEnrichmentBackend hands batches to a Celery worker (see tasks.py).
+# ThreadPoolEnrichmentBackend runs them on in-process daemon threads for
+# deployments without a broker. Pick one with ISP_ENRICHMENT['BACKEND'].
+
+DEFAULTS = {
+    'BACKEND': 'tester.enrichment.ThreadPoolEnrichmentBackend',
+    'WORKERS': 2,
+    'BATCH_SIZE': 100,
+    'BATCH_WAIT': 0.05,      # seconds a worker waits to fill up a batch
+    'MAX_RETRIES': 5,
+    'RETRY_DELAY': 90,       # seconds, doubled on every retry; keep above ISP_CACHE NEGATIVE_TTL
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_enrichment_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'ISP_ENRICHMENT', {}))
+    return config
+
+
+def is_transient_failure(isp_data):
+    """
+    A remote lookup that errored (timeout, non-200) comes back without a
+    status; a definitive answer, even "fail", always has one.
+    """
+    return 'status' not in isp_data
+
+
+def enrich_results(result_ids, final=False):
+    """
+    Resolve ISP info for the pending results among ``result_ids``, looking
+    each distinct IP up once. Returns the ids whose lookup failed
+    transiently and should be retried; with ``final=True`` those are marked
+    Failed instead.
+    """
+    by_ip = defaultdict(list)
+    kits = {}
+    pending = SpeedTestResult.objects.filter(
+        pk__in=result_ids, enrichment_status=SpeedTestResult.ENRICHMENT_PENDING
+    ).values_list('pk', 'client_ip', 'starlink_kit')
+    for pk, client_ip, kit_id in pending:
+        by_ip[client_ip].append(pk)
+        kits[pk] = kit_id
+
+    retry = []
+    for client_ip, pks in by_ip.items():
+        isp_data = get_isp_info(client_ip) if client_ip else UNRESOLVED
+        if is_transient_failure(isp_data) and not final:
+            retry.extend(pks)
+            continue
+        isp_name, is_starlink = classify_isp(isp_data)
+        SpeedTestResult.objects.filter(
+            pk__in=pks, enrichment_status=SpeedTestResult.ENRICHMENT_PENDING
+        ).update(
+            isp_name=isp_name,
+            is_starlink=is_starlink,
+            enrichment_status=(
+                SpeedTestResult.ENRICHMENT_COMPLETE if is_success(isp_data) else SpeedTestResult.ENRICHMENT_FAILED
+            ),
+            updated_at=timezone.now(),
+        )
+    # .update() sends no signals; the owners' result lists changed.
+    retried = set(retry)
+    bump_kit_owners(kit_id for pk, kit_id in kits.items() if pk not in retried)
+    return retry
+
+
+class ThreadPoolEnrichmentBackend:
+    """
+    In-process fallback. Ids go on a queue; each worker thread takes up to
+    BATCH_SIZE of them at a time, so a burst of submissions from one
+    address costs a single lookup. Retries are re-queued by a timer.
+    Pending ids are lost if the process exits; the rows keep their Pending
+    status and ``manage.py reenrich_results --pending`` picks them up.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.workers = []
+
+    def submit(self, result_ids, attempt=0):
+        for pk in result_ids:
+            self.queue.put((pk, attempt))
+        with self.lock:
+            while len(self.workers) < self.config['WORKERS']:
+                worker = threading.Thread(target=self.run, name='isp-enrichment', daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.config['BATCH_WAIT']
+        while len(batch) < self.config['BATCH_SIZE']:
+            try:
+                batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            close_old_connections()
+            by_attempt = defaultdict(list)
+            for pk, attempt in batch:
+                by_attempt[attempt].append(pk)
+            for attempt, pks in by_attempt.items():
+                final = attempt >= self.config['MAX_RETRIES']
+                try:
+                    retry = enrich_results(pks, final=final)
+                except Exception:
+                    logger.exception('ISP enrichment failed for results %s', pks)
+                    retry = [] if final else pks
+                if retry:
+                    timer = threading.Timer(self.config['RETRY_DELAY'] * 2 ** attempt, self.submit, (retry, attempt + 1))
+                    timer.daemon = True
+                    timer.start()
+            close_old_connections()
+
+
+class CeleryEnrichmentBackend:
+    """
+    Hands each batch to the enrich_results_task Celery task, which does its
+    own retries.
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    def submit(self, result_ids):
+        from .tasks import enrich_results_task
+
+        size = self.config['BATCH_SIZE']
+        for i in range(0, len(result_ids), size):
+            enrich_results_task.delay(list(result_ids[i:i + size]))
+
+
+def get_enrichment_backend():
+    """
+    Process-wide backend built from ISP_ENRICHMENT.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = get_enrichment_config()
+                _backend = import_string(config['BACKEND'])(config)
+    return _backend
+
+
+def schedule_enrichment(result_ids):
+    """
+    Queue results for enrichment once the current transaction commits, so
+    the worker never looks for rows that aren't visible yet.
+    """
+    def submit():
+        try:
+            get_enrichment_backend().submit(list(result_ids))
+        except Exception:
+            # Broker down: the results stay Pending rather than failing the request.
+            logger.exception('Could not queue ISP enrichment for results %s', result_ids)
+
+    transaction.on_commit(submit)
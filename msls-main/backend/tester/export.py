@@ -0,0 +1,117 @@
+import csv
+import json
+import zlib
+
+from django.utils import timezone
+
+# --- Result Export ---
+#
+# Streams results as CSV or NDJSON without building the list in memory:
+# rows come from values_list(...).iterator(), so the database driver hands
+# them over a chunk at a time (a server-side cursor on Postgres), and are
+# encoded and optionally gzipped as they arrive. Used by the
+# /api/results/export/ endpoint and `manage.py export_results`.
+
+EXPORT_FIELDS = (
+    'id', 'starlink_kit', 'download_speed_mbps', 'upload_speed_mbps', 'latency_ms', 'jitter_ms',
+    'isp_name', 'is_starlink', 'client_ip', 'enrichment_status',
+    'idle_latency_p50_ms', 'idle_latency_p95_ms', 'download_latency_p50_ms', 'download_latency_p95_ms',
+    'upload_latency_p50_ms', 'upload_latency_p95_ms',
+    'created_at',
+)
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+CHUNK_SIZE = 2000
+OUTPUT_CHUNK_BYTES = 64 * 1024
+
+
+class Echo:
+    """
+    File-like object whose write() hands the line back, so csv.writer can
+    format one row at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def format_datetime(value):
+    # Same representation as the API's DateTimeField output
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def export_rows(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Tuples of EXPORT_FIELDS, fetched chunk_size rows at a time.
+    """
+    created_at = EXPORT_FIELDS.index('created_at')
+    for row in queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        row = list(row)
+        row[created_at] = format_datetime(row[created_at])
+        yield row
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    for row in rows:
+        yield dumps(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+def encode_chunks(lines, chunk_bytes=OUTPUT_CHUNK_BYTES):
+    """
+    Join text lines into byte chunks of about chunk_bytes. The first line
+    goes out on its own so the response starts straight away.
+    """
+    buffer, size = [], 0
+    first = True
+    for line in lines:
+        data = line.encode()
+        if first:
+            yield data
+            first = False
+            continue
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_bytes:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    first = True
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if first:
+            # Push the gzip header and first line out instead of waiting
+            # for the compressor to fill its window.
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(queryset, export_format='csv', compress=False, chunk_size=CHUNK_SIZE):
+    """
+    Byte chunks of ``queryset`` exported as ``export_format`` (a FORMATS
+    key), gzipped when ``compress`` is set.
+    """
+    rows = export_rows(queryset, chunk_size=chunk_size)
+    lines = csv_lines(rows) if export_format == 'csv' else ndjson_lines(rows)
+    chunks = encode_chunks(lines)
+    return gzip_chunks(chunks) if compress else chunks
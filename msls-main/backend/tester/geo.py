@@ -0,0 +1,216 @@
+import math
+
+from django.db.models import Avg, Count, Max, Min, Q
+from django.db.models.functions import Substr
+from rest_framework.exceptions import ValidationError
+
+# --- Kit Locations ---
+#
+# Every kit with coordinates stores its geohash (StarlinkKit.geohash,
+# indexed). Kits sharing a geohash prefix lie in the same cell of a
+# lat/lng grid, and all geohashes with a prefix form one contiguous range
+# of the index, so a viewport becomes a few index range scans over the
+# cells covering it, nearest-kit search widens a 3x3 block of cells until
+# it holds enough kits, and clustering is a GROUP BY on a prefix.
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 12
+MAX_COVER_CELLS = 16
+EARTH_RADIUS_KM = 6371.0088
+# Geohash length per map zoom level (index = zoom, capped at the last)
+ZOOM_PRECISION = (1, 1, 2, 2, 3, 3, 3, 4, 4, 5, 5, 5, 6, 6, 7, 7, 8)
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        if coordinate >= middle:
+            value = value * 2 + 1
+            interval[0] = middle
+        else:
+            value = value * 2
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def decode(geohash):
+    """
+    Bounds of the geohash's cell as (south, west, north, east).
+    """
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lng_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def cell_size(precision):
+    """
+    (height, width) in degrees of a geohash cell of ``precision`` chars.
+    """
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def parse_bbox(value, name='bbox'):
+    """
+    ``west,south,east,north`` in degrees (the GeoJSON bbox order) as
+    (south, west, north, east). west may exceed east across the antimeridian.
+    """
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValidationError({name: 'Expected west,south,east,north in degrees.'})
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValidationError({name: 'Coordinates out of range or south above north.'})
+    return south, west, north, east
+
+
+def prefix_filter(prefixes, field='geohash'):
+    # Everything starting with a prefix sorts in [prefix, prefix + '~'),
+    # an index range on any backend (unlike LIKE on SQLite).
+    condition = Q()
+    for prefix in prefixes:
+        condition |= Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '~'})
+    return condition
+
+
+def covering_cells(south, west, north, east, max_cells=MAX_COVER_CELLS):
+    """
+    Geohash prefixes whose cells cover the box, at the finest precision
+    that needs no more than ``max_cells`` of them. ``west > east`` means
+    the box crosses the antimeridian.
+    """
+    boxes = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+    best = {''}
+    for precision in range(1, PRECISION + 1):
+        height, width = cell_size(precision)
+        rows = math.floor((north + 90) / height) - math.floor((south + 90) / height) + 1
+        columns = sum(math.floor((e + 180) / width) - math.floor((w + 180) / width) + 1 for w, e in boxes)
+        if rows * columns > max_cells:
+            break
+        cells = set()
+        for w, e in boxes:
+            lat = south
+            while True:
+                lng = w
+                while True:
+                    cells.add(encode(min(lat, 90.0), min(lng, 180.0), precision))
+                    if lng >= e:
+                        break
+                    lng = min(lng + width, e)
+                if lat >= north:
+                    break
+                lat = min(lat + height, north)
+        best = cells
+    return best
+
+
+def in_bbox(queryset, south, west, north, east):
+    """
+    Kits inside the box: an index range per covering cell, then the exact
+    coordinates to trim the cells' overhang.
+    """
+    queryset = queryset.filter(prefix_filter(covering_cells(south, west, north, east)))
+    queryset = queryset.filter(latitude__gte=south, latitude__lte=north)
+    if west <= east:
+        return queryset.filter(longitude__gte=west, longitude__lte=east)
+    return queryset.filter(Q(longitude__gte=west) | Q(longitude__lte=east))
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def neighbourhood(latitude, longitude, precision):
+    """
+    The cell holding the point and its eight neighbours.
+    """
+    height, width = cell_size(precision)
+    cells = set()
+    for dlat in (-height, 0, height):
+        lat = latitude + dlat
+        if not -90 <= lat <= 90:
+            continue
+        for dlng in (-width, 0, width):
+            lng = (longitude + dlng + 180) % 360 - 180
+            cells.add(encode(lat, lng, precision))
+    return cells
+
+
+def nearest(queryset, latitude, longitude, count, fields):
+    """
+    The ``count`` kits closest to the point as (distance_km, row) pairs,
+    ``row`` being a values_list tuple of ``fields`` (which must include
+    latitude and longitude). Starts from a small 3x3 block of cells and
+    widens it until the block holds ``count`` kits that are provably the
+    nearest: anything outside the block is at least one cell away.
+    """
+    located = queryset.exclude(geohash='')
+    lat_index, lng_index = fields.index('latitude'), fields.index('longitude')
+
+    def rank(rows):
+        ranked = ((haversine_km(latitude, longitude, row[lat_index], row[lng_index]), row) for row in rows)
+        return sorted(ranked, key=lambda pair: pair[0])[:count]
+
+    for precision in range(8, 0, -1):
+        candidates = list(located.filter(prefix_filter(neighbourhood(latitude, longitude, precision))).values_list(*fields))
+        if len(candidates) < count:
+            continue
+        ranked = rank(candidates)
+        height, width = cell_size(precision)
+        # Kilometres per degree: latitude is constant, longitude shrinks with cos(latitude)
+        reach = min(height * 111.2, width * 111.2 * max(math.cos(math.radians(min(abs(latitude) + height, 90))), 0))
+        if ranked[-1][0] <= reach:
+            return ranked
+    return rank(located.values_list(*fields))
+
+
+def clusters(queryset, zoom):
+    """
+    Kits grouped by geohash cell at the precision for ``zoom``: count,
+    mean position and extent per cell, and the kit id for lone kits.
+    """
+    precision = ZOOM_PRECISION[min(max(zoom, 0), len(ZOOM_PRECISION) - 1)]
+    rows = (
+        queryset.exclude(geohash='')
+        .order_by()
+        .annotate(cell=Substr('geohash', 1, precision))
+        .values('cell')
+        .annotate(
+            count=Count('id'), mean_lat=Avg('latitude'), mean_lng=Avg('longitude'), kit=Min('id'),
+            south=Min('latitude'), north=Max('latitude'), west=Min('longitude'), east=Max('longitude'),
+        )
+        .order_by('cell')
+    )
+    markers = []
+    for row in rows:
+        marker = {
+            'geohash': row['cell'], 'count': row['count'],
+            'latitude': row['mean_lat'], 'longitude': row['mean_lng'],
+        }
+        if row['count'] == 1:
+            marker['kit'] = row['kit']
+        else:
+            marker['bounds'] = [row['south'], row['west'], row['north'], row['east']]
+        markers.append(marker)
+    return precision, markers
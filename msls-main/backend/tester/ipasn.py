@@ -0,0 +1,188 @@
+import bisect
+import csv
+import ipaddress
+import logging
+import os
+import threading
+import time
+from array import array
+
+from django.conf import settings
+
+# --- Offline IP-to-ASN Resolver ---
+#
+# Loads an IP range -> ASN/organisation dataset in the ip2asn layout
+# (https://iptoasn.com, tab separated) or the same five columns as CSV:
+#
+#     range_start, range_end, as_number, country_code, as_description
+#
+# Ranges are kept in sorted parallel arrays per address family and looked up
+# with a binary search, so a lookup costs microseconds and needs no network.
+# The file is re-read when its modification time changes; a file that fails
+# to load is logged and the previous snapshot stays in service.
+
+logger = logging.getLogger(__name__)
+
+BUNDLED_DATASET = os.path.join(os.path.dirname(__file__), 'data', 'ip2asn-fixture.tsv')
+
+
+class IPRangeIndex:
+    """
+    Immutable sorted-range index for one dataset snapshot.
+
+    IPv4 bounds live in 32-bit arrays. IPv6 bounds need 128 bits, so they
+    are plain int lists; the ASN and organisation columns are shared arrays
+    with organisation names interned once.
+    """
+
+    def __init__(self, rows):
+        v4, v6 = [], []
+        for start, end, asn, country, org in rows:
+            (v4 if start.version == 4 else v6).append((int(start), int(end), asn, country, org))
+        v4.sort()
+        v6.sort()
+
+        self.orgs = []
+        org_ids = {}
+
+        def columns(ranges, typecode):
+            starts = array(typecode) if typecode else []
+            ends = array(typecode) if typecode else []
+            asns = array('L')
+            org_refs = array('L')
+            for start, end, asn, country, org in ranges:
+                key = (org, country)
+                if key not in org_ids:
+                    org_ids[key] = len(self.orgs)
+                    self.orgs.append(key)
+                starts.append(start)
+                ends.append(end)
+                asns.append(asn)
+                org_refs.append(org_ids[key])
+            return starts, ends, asns, org_refs
+
+        self.v4 = columns(v4, 'I')
+        self.v6 = columns(v6, None)
+
+    def __len__(self):
+        return len(self.v4[0]) + len(self.v6[0])
+
+    def lookup(self, ip):
+        """
+        ``(asn, org, country)`` for an address, or None if no range covers it.
+        """
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        starts, ends, asns, org_refs = self.v4 if address.version == 4 else self.v6
+        value = int(address)
+        i = bisect.bisect_right(starts, value) - 1
+        if i < 0 or value > ends[i] or asns[i] == 0:
+            return None
+        org, country = self.orgs[org_refs[i]]
+        return asns[i], org, country
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, newline='', encoding='utf-8') as f:
+            first = f.readline()
+            f.seek(0)
+            reader = csv.reader(f, delimiter='\t' if '\t' in first else ',')
+            rows = []
+            for record in reader:
+                if not record or record[0].startswith('#') or len(record) < 5:
+                    continue
+                try:
+                    start = ipaddress.ip_address(record[0].strip())
+                    end = ipaddress.ip_address(record[1].strip())
+                    asn = int(record[2])
+                except ValueError:
+                    continue  # header row or malformed line
+                if start.version != end.version or end < start or not 0 <= asn < 2 ** 32:
+                    continue
+                rows.append((start, end, asn, record[3].strip(), record[4].strip()))
+        return cls(rows)
+
+
+class IPResolver:
+    """
+    Holds the current index for a dataset path and swaps in a fresh one
+    when the file changes. The file's mtime is checked at most once every
+    ISP_DATASET_RELOAD_SECONDS, so the hot path is a single time comparison.
+    """
+
+    def __init__(self, path, reload_interval):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.index = None
+        self.mtime = None
+        self.checked_at = 0
+        self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self.mtime:
+            return
+        try:
+            index = IPRangeIndex.from_file(self.path)
+            if not len(index):
+                raise ValueError('no usable ranges')
+        except Exception:
+            # Runs on the request path: a corrupt or half-written file must
+            # not fail lookups. It is not retried until it changes again.
+            logger.exception('Could not load IP dataset %s; keeping the previous one', self.path)
+            self.mtime = mtime
+            return
+        self.index, self.mtime = index, mtime
+
+    def lookup(self, ip):
+        now = time.monotonic()
+        if now - self.checked_at > self.reload_interval and self.lock.acquire(blocking=False):
+            try:
+                self.checked_at = now
+                self.reload()
+            finally:
+                self.lock.release()
+        index = self.index
+        return index.lookup(ip) if index is not None else None
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_ip_resolver():
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = IPResolver(
+                    getattr(settings, 'ISP_DATASET_PATH', None) or BUNDLED_DATASET,
+                    getattr(settings, 'ISP_DATASET_RELOAD_SECONDS', 30),
+                )
+    return _resolver
+
+
+def lookup_isp_offline(ip_address):
+    """
+    ISP info in the same shape as the ip-api.com response, or None when the
+    dataset has no range for the address.
+    """
+    match = get_ip_resolver().lookup(ip_address)
+    if match is None:
+        return None
+    asn, org, country = match
+    return {
+        "query": ip_address,
+        "status": "success",
+        "isp": org,
+        "org": org,
+        "as": f"AS{asn} {org}",
+        "countryCode": country,
+        "source": "offline",
+    }
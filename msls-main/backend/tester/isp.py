@@ -0,0 +1,60 @@
+import requests
+from django.conf import settings
+
+from .ipasn import lookup_isp_offline
+from .ispcache import get_isp_cache
+
+# --- ISP Detection ---
+
+# Returned when an address can't be resolved at all. The "fail" status marks it
+# as final, unlike a remote lookup that errored and is worth retrying.
+UNRESOLVED = {"status": "fail", "isp": "Unknown", "org": "Unknown"}
+
+
+def get_isp_info(ip_address):
+    """
+    Detects ISP from the offline IP-to-ASN dataset (see ipasn.py), falling
+    back to an external service for addresses the dataset doesn't cover.
+    Note: For local development (127.0.0.1), this will return mock data.
+    """
+    if ip_address in ('127.0.0.1', '::1'):
+        return {
+            "query": ip_address,
+            "status": "success",
+            "isp": "Localhost Development",
+            "org": "SpaceX Starlink (Mock)", # Mocking for dev verification
+            "as": "AS14593 SpaceX Starlink"  # Mocking ASN
+        }
+
+    offline = lookup_isp_offline(ip_address)
+    if offline is not None:
+        return offline
+    if not getattr(settings, 'ISP_REMOTE_LOOKUP', True):
+        return dict(UNRESOLVED)
+    return get_isp_cache().get_or_fetch(ip_address, fetch_remote_isp_info)
+
+
+def fetch_remote_isp_info(ip_address):
+    """
+    Uncached ip-api.com lookup; get_isp_info wraps it in ISPCache.
+    """
+    # Use a free API for demo purposes (e.g., ip-api.com).
+    # In production, use a paid/reliable db (MaxMind).
+    try:
+        response = requests.get(f"http://ip-api.com/json/{ip_address}", timeout=3)
+        if response.status_code == 200:
+            return response.json()
+    except Exception:
+        pass
+
+    return {"isp": "Unknown", "org": "Unknown"}
+
+
+def classify_isp(isp_data):
+    """
+    Returns (isp_name, is_starlink) for an ISP lookup result.
+    """
+    isp_name = isp_data.get('isp', '') or isp_data.get('org', '')
+    is_starlink = "Starlink" in isp_name or "SpaceX" in isp_name or "14593" in isp_data.get('as', '')
+    return isp_name, is_starlink
+
@@ -0,0 +1,126 @@
+import copy
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+# --- ISP Lookup Cache ---
+#
+# Two tiers in front of the remote ISP lookup: a per-process LRU, then the
+# shared Django cache (Redis when REDIS_URL is set). Entries are keyed by
+# network prefix rather than by address, since every client in a /24 (or
+# IPv6 /48), such as a Starlink CGNAT pool, resolves to the same ISP.
+# Failed lookups are cached too, briefly, so an unreachable provider isn't
+# hammered on every request.
+
+DEFAULTS = {
+    'LRU_SIZE': 4096,
+    'TTL': 24 * 60 * 60,
+    'NEGATIVE_TTL': 60,
+    'IPV4_PREFIX': 24,
+    'IPV6_PREFIX': 48,
+}
+
+CACHE_KEY = 'isp:{}'
+
+
+def is_success(isp_data):
+    return isp_data.get('status') == 'success'
+
+
+class ISPCache:
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'negative_hits': 0, 'evictions': 0}
+
+    def prefix_key(self, ip_address):
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+        bits = self.config['IPV4_PREFIX'] if address.version == 4 else self.config['IPV6_PREFIX']
+        return str(ipaddress.ip_network(f'{address}/{bits}', strict=False))
+
+    def _count(self, name, value=None):
+        self.stats[name] += 1
+        if value is not None and not is_success(value):
+            self.stats['negative_hits'] += 1
+
+    def _remember(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.config['LRU_SIZE']:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def get_or_fetch(self, ip_address, fetch):
+        """
+        Cached ``fetch(ip_address)``. The returned dict is a copy with
+        ``query`` set to the caller's address, whichever address filled it.
+        """
+        key = self.prefix_key(ip_address)
+        if key is None:
+            return fetch(ip_address)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self._count('local_hits', entry[1])
+                return self._for(ip_address, entry[1])
+
+        # The shared entry carries its wall-clock expiry, so a worker that
+        # picks it up late only keeps it for the time it has left.
+        shared = cache.get(CACHE_KEY.format(key))
+        if shared is not None:
+            value, expires_at = shared
+            remaining = expires_at - time.time()
+            if remaining > 0:
+                with self.lock:
+                    self._count('shared_hits', value)
+                self._remember(key, value, remaining)
+                return self._for(ip_address, value)
+
+        with self.lock:
+            self._count('misses')
+        value = fetch(ip_address)
+        ttl = self.config['TTL'] if is_success(value) else self.config['NEGATIVE_TTL']
+        cache.set(CACHE_KEY.format(key), (value, time.time() + ttl), ttl)
+        self._remember(key, value, ttl)
+        return self._for(ip_address, value)
+
+    def _for(self, ip_address, value):
+        value = copy.copy(value)
+        if 'query' in value:
+            value['query'] = ip_address
+        return value
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['local_entries'] = len(self.entries)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else None
+        stats['config'] = self.config
+        return stats
+
+
+_isp_cache = None
+_isp_cache_lock = threading.Lock()
+
+
+def get_isp_cache():
+    global _isp_cache
+    if _isp_cache is None:
+        with _isp_cache_lock:
+            if _isp_cache is None:
+                config = dict(DEFAULTS)
+                config.update(getattr(settings, 'ISP_CACHE', {}))
+                _isp_cache = ISPCache(config)
+    return _isp_cache
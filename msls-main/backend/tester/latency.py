@@ -0,0 +1,125 @@
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+
+# --- Latency Statistics ---
+
+PROBE_SUMMARY_KEY = 'speedtest:probe:{}'
+LOAD_PHASES = ('idle', 'download', 'upload')
+
+
+def percentile(sorted_values, q):
+    """
+    Linear-interpolated percentile (0-100) of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * q / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return sorted_values[low]
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+class LatencyStats:
+    """
+    Accumulates round-trip times for a probe and summarises RTT, jitter and
+    loss. Jitter is the mean absolute difference between consecutive RTTs
+    (the RFC 3550 interarrival definition without smoothing).
+    """
+
+    def __init__(self):
+        self.rtts = []
+        self.sent = 0
+
+    @classmethod
+    def from_samples(cls, samples):
+        """
+        Build from ``(sent_at, rtt_ms)`` pairs, where a ``None`` RTT is a lost frame.
+        """
+        stats = cls()
+        for _, rtt in samples:
+            stats.sent += 1
+            if rtt is not None:
+                stats.add(rtt)
+        return stats
+
+    def add(self, rtt_ms):
+        self.rtts.append(rtt_ms)
+
+    def jitter_ms(self):
+        if len(self.rtts) < 2:
+            return 0.0 if self.rtts else None
+        diffs = [abs(b - a) for a, b in zip(self.rtts, self.rtts[1:])]
+        return sum(diffs) / len(diffs)
+
+    def summary(self):
+        ordered = sorted(self.rtts)
+        received = len(ordered)
+        lost = max(self.sent - received, 0)
+        return {
+            "sent": self.sent,
+            "received": received,
+            "loss_percent": (lost * 100 / self.sent) if self.sent else 0.0,
+            "latency_ms": (sum(ordered) / received) if received else None,
+            "min_ms": ordered[0] if ordered else None,
+            "p50_ms": percentile(ordered, 50),
+            "p95_ms": percentile(ordered, 95),
+            "p99_ms": percentile(ordered, 99),
+            "max_ms": ordered[-1] if ordered else None,
+            "jitter_ms": self.jitter_ms(),
+        }
+
+
+def split_by_load(samples, windows):
+    """
+    Attribute probe samples to the load that was running when they were sent.
+
+    ``samples`` are ``(sent_at, rtt_ms)`` pairs and ``windows`` the download/
+    upload stream windows recorded by throughput.record_load_window, both in
+    wall-clock seconds. Samples outside every window count as idle. Each
+    loaded phase also reports the throughput its streams achieved together.
+    """
+    grouped = {phase: [] for phase in LOAD_PHASES}
+    for sample in samples:
+        phase = 'idle'
+        for window in windows:
+            if window['start'] <= sample[0] <= window['end']:
+                phase = window['direction']
+                break
+        grouped[phase].append(sample)
+
+    phases = {}
+    for phase, phase_samples in grouped.items():
+        summary = LatencyStats.from_samples(phase_samples).summary()
+        phase_windows = [w for w in windows if w['direction'] == phase]
+        if phase_windows:
+            span = max(w['end'] for w in phase_windows) - min(w['start'] for w in phase_windows)
+            total = sum(w['bytes'] for w in phase_windows)
+            summary['throughput_mbps'] = (total * 8) / (span * 1000000) if span > 0 else None
+        phases[phase] = summary
+    return phases
+
+
+def store_probe_summary(test_id, summary):
+    timeout = getattr(settings, 'SPEEDTEST_STREAM_STATS_TTL', 300)
+    cache.set(PROBE_SUMMARY_KEY.format(test_id), summary, timeout)
+
+
+def get_probe_summary(test_id):
+    return cache.get(PROBE_SUMMARY_KEY.format(test_id))
+
+
+def loaded_latency_fields(summary):
+    """
+    SpeedTestResult latency percentile fields from a loaded probe summary.
+    """
+    fields = {}
+    phases = (summary or {}).get('phases', {})
+    for phase in LOAD_PHASES:
+        stats = phases.get(phase, {})
+        fields[f'{phase}_latency_p50_ms'] = stats.get('p50_ms')
+        fields[f'{phase}_latency_p95_ms'] = stats.get('p95_ms')
+    return fields
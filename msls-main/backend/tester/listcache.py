@@ -0,0 +1,107 @@
+import hashlib
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .versions import ConditionalListMixin, get_versions_config
+
+# --- List Response Cache ---
+#
+# Read-through cache of serialized kit/result list pages. Keys carry the
+# version token from versions.py, so a signal bump on commit makes every
+# cached page of that user (or of the staff fleet list) unreachable at once
+# and nothing has to be deleted; stale entries just age out after TTL.
+# Staff and regular users never share an entry. Works with any Django cache
+# backend, but only runs while list versions are on (a shared version cache,
+# see versions.py): keys built from one worker's private tokens would keep
+# serving a page that another worker changed. Entries always expire after
+# TTL, which bounds how long an unnoticed change can be served.
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'TTL': 10 * 60,
+}
+
+CACHE_KEY = 'listcache:{}:{}:{}'
+
+
+class ListResponseCache:
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    @property
+    def cache(self):
+        return caches[self.config['CACHE_ALIAS']]
+
+    def key(self, scope, version, request):
+        variant = f'{request.user.pk}|{request.user.is_staff}|{request.build_absolute_uri()}|{request.META.get("HTTP_ACCEPT", "")}'
+        return CACHE_KEY.format(scope, version, hashlib.md5(variant.encode()).hexdigest())
+
+    def get(self, name, key):
+        data = self.cache.get(key)
+        with self.lock:
+            self.stats[name]['hits' if data is not None else 'misses'] += 1
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data, self.config['TTL'])
+
+    def snapshot(self):
+        with self.lock:
+            lists = {name: dict(counts) for name, counts in self.stats.items()}
+        for counts in lists.values():
+            lookups = counts['hits'] + counts['misses']
+            counts['hit_ratio'] = counts['hits'] / lookups if lookups else None
+        hits = sum(counts['hits'] for counts in lists.values())
+        lookups = hits + sum(counts['misses'] for counts in lists.values())
+        return {
+            'hits': hits,
+            'misses': lookups - hits,
+            'hit_ratio': hits / lookups if lookups else None,
+            'lists': lists,
+            'config': self.config,
+        }
+
+
+_list_cache = None
+_list_cache_lock = threading.Lock()
+
+
+def get_list_cache():
+    global _list_cache
+    if _list_cache is None:
+        with _list_cache_lock:
+            if _list_cache is None:
+                config = dict(DEFAULTS)
+                config.update(getattr(settings, 'LIST_CACHE', {}))
+                if not config['TTL']:
+                    config['TTL'] = DEFAULTS['TTL']
+                _list_cache = ListResponseCache(config)
+    return _list_cache
+
+
+class CachedListMixin(ConditionalListMixin):
+    """
+    Conditional GET plus a cache of the serialized list, keyed by the same
+    version: a client without a matching ETag still skips the query and
+    serializer while the data is unchanged.
+    """
+
+    def build_list_response(self, request, *args, **kwargs):
+        list_cache = get_list_cache()
+        if not list_cache.config['ENABLED'] or not get_versions_config()['ENABLED']:
+            return super().build_list_response(request, *args, **kwargs)
+        key = list_cache.key(self.get_list_version_scope(), self.get_list_version(), request)
+        data = list_cache.get(self.basename, key)
+        if data is not None:
+            return Response(data)
+        response = super().build_list_response(request, *args, **kwargs)
+        if response.status_code == 200:
+            list_cache.set(key, response.data)
+        return response
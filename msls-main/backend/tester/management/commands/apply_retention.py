@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from tester.retention import apply_retention, get_retention_config
+
+def days(value):
+    return None if value in ('none', 'forever') else int(value)
+
+class Command(BaseCommand):
+    help = 'Downsamples and deletes raw speed test results (and old summaries) past their retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be downsampled and deleted without writing')
+        parser.add_argument('--raw-days', type=days, help="Keep raw results this many days ('none' keeps them forever)")
+        parser.add_argument('--hourly-days', type=days, help='Keep hourly rollups this many days')
+        parser.add_argument('--daily-days', type=days, help='Keep daily rollups this many days')
+        parser.add_argument('--sketch-days', type=days, help='Keep daily quantile sketches this many days')
+        parser.add_argument('--batch-size', type=int, help='Rows deleted per transaction')
+        parser.add_argument('--pause', type=float, help='Seconds to sleep between delete batches')
+
+    def handle(self, *args, **options):
+        config = get_retention_config()
+        overrides = {
+            'RAW_DAYS': 'raw_days', 'HOURLY_DAYS': 'hourly_days', 'DAILY_DAYS': 'daily_days',
+            'SKETCH_DAYS': 'sketch_days', 'BATCH_SIZE': 'batch_size', 'BATCH_PAUSE': 'pause',
+        }
+        for key, option in overrides.items():
+            if options[option] is not None:
+                config[key] = options[option]
+        if config['BATCH_SIZE'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        started = time.monotonic()
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+
+        def progress(stage, day, rows, downsampled):
+            elapsed = time.monotonic() - started
+            if stage == 'raw':
+                note = f', downsampled {downsampled} kit-days first' if downsampled else ''
+                self.stdout.write(f'  {day}: {verb.lower()} {rows} raw results{note} ({elapsed:.1f}s)')
+            else:
+                self.stdout.write(f"  {verb} {rows} {stage.replace('_', ' ')} ({elapsed:.1f}s)")
+
+        policy = ', '.join(f"{key.lower()}={config[key] if config[key] is not None else 'forever'}" for key in ('RAW_DAYS', 'HOURLY_DAYS', 'DAILY_DAYS', 'SKETCH_DAYS'))
+        self.stdout.write(f"{'Dry run: ' if options['dry_run'] else ''}Applying retention ({policy})")
+        stats = apply_retention(dry_run=options['dry_run'], progress=progress, config=config)
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {stats.get('deleted', 0)} raw results over {stats.get('days', 0)} days "
+            f"({stats.get('downsampled_kit_days', 0)} kit-days downsampled) in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,42 @@
+import datetime
+import time
+from django.core.management.base import BaseCommand, CommandError
+from tester.columnar import export_columnar
+
+class Command(BaseCommand):
+    help = 'Writes or updates a day-partitioned columnar (.npy) export of speed test results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Export root; created if missing, updated in place if not')
+        parser.add_argument('--since', type=datetime.date.fromisoformat, help='First UTC day to export (YYYY-MM-DD)')
+        parser.add_argument('--until', type=datetime.date.fromisoformat, help='UTC day to stop before (YYYY-MM-DD)')
+        parser.add_argument('--include-today', action='store_true', help='Also write the current, still growing day')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        until = options['until']
+        if until is None and not options['include_today']:
+            # Today's partition would be rewritten by every run until midnight
+            until = datetime.datetime.now(datetime.timezone.utc).date()
+
+        started = time.monotonic()
+        total = 0
+
+        def progress(day, rows):
+            nonlocal total
+            total += rows
+            self.stdout.write(f'  {day}: {rows} rows ({time.monotonic() - started:.1f}s)')
+
+        self.stdout.write(f"Updating columnar export in {options['directory']}...")
+        try:
+            written = export_columnar(
+                options['directory'], since=options['since'], until=until,
+                chunk_size=options['chunk_size'], progress=progress,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(written)} partitions ({total} rows) in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,58 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from tester.export import CHUNK_SIZE, FORMATS, stream_export
+from tester.models import SpeedTestResult
+from tester.pagination import parse_time_bound
+
+class Command(BaseCommand):
+    help = 'Streams speed test results to a CSV or NDJSON file (or stdout) in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv', dest='export_format')
+        parser.add_argument('--output', '-o', help='File to write; stdout when omitted')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--kit', type=int, action='append', dest='kit_ids', help='Only this kit id (repeatable)')
+        parser.add_argument('--user', help='Only kits assigned to this username')
+        parser.add_argument('--since', help='Results at or after this ISO date/datetime')
+        parser.add_argument('--until', help='Results before this ISO date/datetime')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        queryset = SpeedTestResult.objects.order_by('created_at', 'id')
+        if options['kit_ids']:
+            queryset = queryset.filter(starlink_kit_id__in=options['kit_ids'])
+        if options['user']:
+            queryset = queryset.filter(starlink_kit__assigned_user__username=options['user'])
+        try:
+            if options['since']:
+                queryset = queryset.filter(created_at__gte=parse_time_bound(options['since'], 'since'))
+            if options['until']:
+                queryset = queryset.filter(created_at__lt=parse_time_bound(options['until'], 'until'))
+        except ValidationError as exc:
+            raise CommandError(f'Invalid time bound: {exc.detail}')
+
+        chunks = stream_export(
+            queryset, options['export_format'], compress=options['gzip'], chunk_size=options['chunk_size']
+        )
+        started = time.monotonic()
+        written = 0
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {written / 1e6:.1f} MB to {options['output']} in {time.monotonic() - started:.1f}s"
+            ))
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from tester.rollups import rebuild_rollups
+from tester.sketches import rebuild_sketches
+
+class Command(BaseCommand):
+    help = 'Recomputes the hourly/daily speed test rollups and daily quantile sketches from the raw results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kit', type=int, action='append', dest='kit_ids', help='Only rebuild this kit id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rollup rows written per insert')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        scope = f"kits {', '.join(map(str, options['kit_ids']))}" if options['kit_ids'] else 'all kits'
+        self.stdout.write(f'Rebuilding rollups for {scope}...')
+        written = rebuild_rollups(options['kit_ids'], batch_size=options['batch_size'])
+        self.stdout.write(f'Wrote {written} rollup rows in {time.monotonic() - started:.1f}s')
+        written = rebuild_sketches(options['kit_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} sketch rows in {time.monotonic() - started:.1f}s'))
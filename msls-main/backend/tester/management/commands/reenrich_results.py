@@ -0,0 +1,141 @@
+import time
+from collections import OrderedDict, defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from tester.ipasn import lookup_isp_offline
+from tester.isp import UNRESOLVED, classify_isp, get_isp_info
+from tester.ispcache import is_success
+from tester.enrichment import is_transient_failure
+from tester.models import SpeedTestResult
+from tester.versions import bump_kit_owners
+
+class Command(BaseCommand):
+    help = 'Re-resolves isp_name/is_starlink for existing speed test results from their client_ip'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows read and written per chunk')
+        parser.add_argument('--start-after', type=int, default=None, help='Resume after this result id')
+        parser.add_argument('--checkpoint', help='File holding the last processed id; read on start, updated after every chunk')
+        parser.add_argument('--pending', action='store_true', help='Only rows still waiting for enrichment (Pending/Failed)')
+        parser.add_argument('--offline', action='store_true', help='Use only the offline IP dataset; rows it cannot resolve are left as they are')
+        parser.add_argument('--ip-cache-size', type=int, default=100000, help='Resolved addresses remembered across chunks')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive')
+        last_pk = options['start_after']
+        if last_pk is None:
+            last_pk = self.read_checkpoint(options['checkpoint'])
+
+        queryset = SpeedTestResult.objects.order_by('pk')
+        if options['pending']:
+            queryset = queryset.exclude(enrichment_status=SpeedTestResult.ENRICHMENT_COMPLETE)
+
+        self.offline = options['offline']
+        self.resolved = OrderedDict()
+        self.resolved_limit = options['ip_cache_size']
+        stats = {'rows': 0, 'updated': 0, 'lookups': 0, 'unresolved': 0}
+        started = time.monotonic()
+
+        self.stdout.write(f'Re-enriching results after id {last_pk}' if last_pk else 'Re-enriching all results')
+        while True:
+            # Keyset pagination on the primary key: each chunk is one indexed
+            # range scan and memory stays at one chunk however large the table.
+            rows = list(
+                queryset.filter(pk__gt=last_pk or 0).values_list(
+                    'pk', 'client_ip', 'isp_name', 'is_starlink', 'enrichment_status', 'starlink_kit'
+                )[:chunk_size]
+            )
+            if not rows:
+                break
+
+            by_ip = defaultdict(list)
+            for row in rows:
+                by_ip[row[1]].append(row)
+
+            changed, changed_kits, now = [], set(), timezone.now()
+            for client_ip, ip_rows in by_ip.items():
+                resolved = self.resolve(client_ip, stats)
+                if resolved is None:
+                    stats['unresolved'] += len(ip_rows)
+                    continue
+                for pk, _, isp_name, is_starlink, enrichment_status, kit_id in ip_rows:
+                    if (isp_name, is_starlink, enrichment_status) != resolved:
+                        changed.append(SpeedTestResult(
+                            pk=pk, isp_name=resolved[0], is_starlink=resolved[1], enrichment_status=resolved[2],
+                            updated_at=now,
+                        ))
+                        changed_kits.add(kit_id)
+
+            if changed and not options['dry_run']:
+                with transaction.atomic():
+                    SpeedTestResult.objects.bulk_update(
+                        changed, ['isp_name', 'is_starlink', 'enrichment_status', 'updated_at'], batch_size=1000
+                    )
+                    bump_kit_owners(changed_kits)
+            stats['rows'] += len(rows)
+            stats['updated'] += len(changed)
+            last_pk = rows[-1][0]
+            if not options['dry_run']:
+                self.write_checkpoint(options['checkpoint'], last_pk)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"{stats['rows']} rows, {stats['updated']} {'to update' if options['dry_run'] else 'updated'}, "
+                f"{stats['lookups']} lookups, {stats['unresolved']} unresolved, "
+                f"{stats['rows'] / elapsed if elapsed else 0:.0f} rows/s, last id {last_pk}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {stats['rows']} rows checked, {stats['updated']} {'would change' if options['dry_run'] else 'updated'} "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
+
+    def resolve(self, client_ip, stats):
+        """
+        (isp_name, is_starlink, enrichment_status) for an address, looked up
+        at most once per run while it stays in the bounded cache. None means
+        the lookup failed transiently and the rows should be left alone.
+        """
+        if client_ip in self.resolved:
+            self.resolved.move_to_end(client_ip)
+            return self.resolved[client_ip]
+
+        stats['lookups'] += 1
+        if not client_ip:
+            isp_data = UNRESOLVED
+        elif self.offline:
+            isp_data = lookup_isp_offline(client_ip)
+            if isp_data is None:
+                return None
+        else:
+            isp_data = get_isp_info(client_ip)
+        if is_transient_failure(isp_data):
+            return None
+
+        isp_name, is_starlink = classify_isp(isp_data)
+        status = SpeedTestResult.ENRICHMENT_COMPLETE if is_success(isp_data) else SpeedTestResult.ENRICHMENT_FAILED
+        resolved = (isp_name, is_starlink, status)
+        self.resolved[client_ip] = resolved
+        if len(self.resolved) > self.resolved_limit:
+            self.resolved.popitem(last=False)
+        return resolved
+
+    def read_checkpoint(self, path):
+        if not path:
+            return None
+        try:
+            with open(path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            raise CommandError(f'Checkpoint file {path} does not contain a result id')
+
+    def write_checkpoint(self, path, last_pk):
+        if path:
+            with open(path, 'w') as f:
+                f.write(str(last_pk))
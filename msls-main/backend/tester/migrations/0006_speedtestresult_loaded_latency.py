@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-17 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tester", "0005_userprofile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="speedtestresult",
+            name="download_latency_p50_ms",
+            field=models.FloatField(
+                blank=True, help_text="Median RTT while downloading", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="speedtestresult",
+            name="download_latency_p95_ms",
+            field=models.FloatField(
+                blank=True, help_text="95th percentile RTT while downloading", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="speedtestresult",
+            name="idle_latency_p50_ms",
+            field=models.FloatField(
+                blank=True, help_text="Median RTT with the link idle", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="speedtestresult",
+            name="idle_latency_p95_ms",
+            field=models.FloatField(
+                blank=True,
+                help_text="95th percentile RTT with the link idle",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="speedtestresult",
+            name="upload_latency_p50_ms",
+            field=models.FloatField(
+                blank=True, help_text="Median RTT while uploading", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="speedtestresult",
+            name="upload_latency_p95_ms",
+            field=models.FloatField(
+                blank=True, help_text="95th percentile RTT while uploading", null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-17 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tester", "0006_speedtestresult_loaded_latency"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="speedtestresult",
+            name="enrichment_status",
+            field=models.CharField(
+                choices=[
+                    ("Pending", "Pending"),
+                    ("Complete", "Complete"),
+                    ("Failed", "Failed"),
+                ],
+                default="Complete",
+                help_text="Whether isp_name/is_starlink have been resolved from client_ip yet",
+                max_length=20,
+            ),
+        ),
+    ]
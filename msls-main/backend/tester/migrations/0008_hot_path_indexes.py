@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-17 14:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tester", "0007_speedtestresult_enrichment_status"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="activationrequest",
+            index=models.Index(
+                fields=["user", "-created_at"], name="activation_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="activationrequest",
+            index=models.Index(
+                fields=["user", "status", "-created_at"],
+                name="activation_user_status_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="speedtestresult",
+            index=models.Index(
+                fields=["starlink_kit", "-created_at", "-id"],
+                name="result_kit_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(
+                fields=["user", "-created_at"], name="ticket_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(
+                fields=["user", "status", "-created_at"],
+                name="ticket_user_status_created_idx",
+            ),
+        ),
+    ]
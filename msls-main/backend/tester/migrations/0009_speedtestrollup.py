@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-17 14:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tester", "0008_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SpeedTestRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("hour", "Hour"), ("day", "Day")], max_length=10
+                    ),
+                ),
+                ("bucket_start", models.DateTimeField()),
+                ("count", models.IntegerField(default=0)),
+                ("download_sum", models.FloatField(default=0)),
+                ("download_sum_sq", models.FloatField(default=0)),
+                ("upload_sum", models.FloatField(default=0)),
+                ("upload_sum_sq", models.FloatField(default=0)),
+                ("latency_sum", models.FloatField(default=0)),
+                ("latency_sum_sq", models.FloatField(default=0)),
+                ("jitter_sum", models.FloatField(default=0)),
+                ("jitter_sum_sq", models.FloatField(default=0)),
+                (
+                    "starlink_kit",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rollups",
+                        to="tester.starlinkkit",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("starlink_kit", "period", "bucket_start"),
+                        name="rollup_kit_period_bucket_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
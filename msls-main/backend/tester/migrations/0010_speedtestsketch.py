@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-17 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tester", "0009_speedtestrollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SpeedTestSketch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("count", models.IntegerField(default=0)),
+                ("download", models.BinaryField(default=b"")),
+                ("upload", models.BinaryField(default=b"")),
+                ("latency", models.BinaryField(default=b"")),
+                (
+                    "starlink_kit",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sketches",
+                        to="tester.starlinkkit",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("starlink_kit", "day"), name="sketch_kit_day_uniq"
+                    )
+                ],
+            },
+        ),
+    ]
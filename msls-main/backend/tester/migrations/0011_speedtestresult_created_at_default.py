@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-17 14:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tester", "0010_speedtestsketch"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="speedtestresult",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                help_text="When the measurement was taken",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 14:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tester", "0011_speedtestresult_created_at_default"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="speedtestresult",
+            index=models.Index(fields=["created_at", "id"], name="result_created_idx"),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-17 14:56
+
+from django.db import migrations, models
+
+# A frozen copy of tester.geo.encode as of this migration, so later changes
+# to geo.py cannot change what it wrote.
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(latitude, longitude, precision=12):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        if coordinate >= middle:
+            value = value * 2 + 1
+            interval[0] = middle
+        else:
+            value = value * 2
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def fill_geohashes(apps, schema_editor):
+    StarlinkKit = apps.get_model("tester", "StarlinkKit")
+    kits = StarlinkKit.objects.filter(latitude__isnull=False, longitude__isnull=False).only(
+        "id", "latitude", "longitude"
+    )
+    batch = []
+    for kit in kits.iterator(chunk_size=1000):
+        kit.geohash = encode(kit.latitude, kit.longitude)
+        batch.append(kit)
+        if len(batch) >= 1000:
+            StarlinkKit.objects.bulk_update(batch, ["geohash"])
+            batch = []
+    StarlinkKit.objects.bulk_update(batch, ["geohash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tester", "0012_speedtestresult_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="starlinkkit",
+            name="geohash",
+            field=models.CharField(
+                blank=True, db_index=True, default="", editable=False, max_length=12
+            ),
+        ),
+        migrations.RunPython(fill_geohashes, migrations.RunPython.noop),
+    ]
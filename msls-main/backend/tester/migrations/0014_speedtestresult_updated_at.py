@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-17 16:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tester", "0013_starlinkkit_geohash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="speedtestresult",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                help_text="When the row was last written",
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -1,7 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from .geo import encode as encode_geohash
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -33,11 +35,22 @@ class StarlinkKit(models.Model):
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
     slug = models.SlugField(max_length=150, unique=True, blank=True, null=True)
+    # Derived from latitude/longitude on save; indexed for map queries (see geo.py)
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.nickname} ({self.kit_id})"
 
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        if kwargs.get('update_fields') is not None and {'latitude', 'longitude'} & set(kwargs['update_fields']):
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'geohash'}
+        super().save(*args, **kwargs)
+
 class Ticket(models.Model):
     """
     Support tickets for the user.
@@ -56,6 +69,12 @@ class Ticket(models.Model):
     def __str__(self):
         return f"{self.subject} ({self.status})"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='ticket_user_created_idx'),
+            models.Index(fields=['user', 'status', '-created_at'], name='ticket_user_status_created_idx'),
+        ]
+
 class ActivationRequest(models.Model):
     """
     Pending hardware activation requests.
@@ -74,10 +93,24 @@ class ActivationRequest(models.Model):
     def __str__(self):
         return f"Activation Request for {self.kit_id} ({self.status})"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='activation_user_created_idx'),
+            models.Index(fields=['user', 'status', '-created_at'], name='activation_user_status_idx'),
+        ]
+
 class SpeedTestResult(models.Model):
     """
     Stores the results of a network speed test.
     """
+    ENRICHMENT_PENDING = 'Pending'
+    ENRICHMENT_COMPLETE = 'Complete'
+    ENRICHMENT_FAILED = 'Failed'
+    ENRICHMENT_CHOICES = [
+        (ENRICHMENT_PENDING, 'Pending'),
+        (ENRICHMENT_COMPLETE, 'Complete'),
+        (ENRICHMENT_FAILED, 'Failed'),
+    ]
     starlink_kit = models.ForeignKey(StarlinkKit, on_delete=models.CASCADE, related_name="speed_tests", null=True, blank=True)
     download_speed_mbps = models.FloatField(help_text="Download speed in Megabits per second (Mbps)")
     upload_speed_mbps = models.FloatField(help_text="Upload speed in Megabits per second (Mbps)")
@@ -86,10 +119,88 @@ class SpeedTestResult(models.Model):
     isp_name = models.CharField(max_length=255, help_text="Detected Internet Service Provider")
     is_starlink = models.BooleanField(default=False, help_text="True if the ISP is identified as Starlink")
     client_ip = models.GenericIPAddressField(null=True, blank=True, help_text="Public IP address of the client")
-    created_at = models.DateTimeField(auto_now_add=True)
+    enrichment_status = models.CharField(max_length=20, choices=ENRICHMENT_CHOICES, default=ENRICHMENT_COMPLETE, help_text="Whether isp_name/is_starlink have been resolved from client_ip yet")
+    # Loaded latency (bufferbloat), measured server-side by the loaded probe
+    idle_latency_p50_ms = models.FloatField(null=True, blank=True, help_text="Median RTT with the link idle")
+    idle_latency_p95_ms = models.FloatField(null=True, blank=True, help_text="95th percentile RTT with the link idle")
+    download_latency_p50_ms = models.FloatField(null=True, blank=True, help_text="Median RTT while downloading")
+    download_latency_p95_ms = models.FloatField(null=True, blank=True, help_text="95th percentile RTT while downloading")
+    upload_latency_p50_ms = models.FloatField(null=True, blank=True, help_text="Median RTT while uploading")
+    upload_latency_p95_ms = models.FloatField(null=True, blank=True, help_text="95th percentile RTT while uploading")
+    # A default rather than auto_now_add so bulk uploads can keep the time a buffered measurement was taken
+    created_at = models.DateTimeField(default=timezone.now, help_text="When the measurement was taken")
+    # Writes that bypass save() (queryset.update, bulk_update) set it themselves;
+    # the columnar export compares it to find days changed in place.
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the row was last written")
 
     def __str__(self):
         return f"{self.isp_name} - D:{self.download_speed_mbps} U:{self.upload_speed_mbps} ({self.created_at.strftime('%Y-%m-%d %H:%M')})"
 
+    def save(self, *args, **kwargs):
+        # post_save updates the rollup tables (see rollups.py); run it in the
+        # same transaction as the row itself.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Per-kit history, newest first; id is the keyset tie-breaker.
+            models.Index(fields=['starlink_kit', '-created_at', '-id'], name='result_kit_created_idx'),
+            # Fleet-wide time ranges (columnar export partitions).
+            models.Index(fields=['created_at', 'id'], name='result_created_idx'),
+        ]
+
+
+class SpeedTestRollup(models.Model):
+    """
+    Running totals over one kit's results for one hour or one day, kept in
+    step with SpeedTestResult by tester/rollups.py. Count, sum and sum of
+    squares are enough to derive mean and standard deviation, and they can
+    be added together for longer ranges.
+    """
+    PERIOD_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    starlink_kit = models.ForeignKey(StarlinkKit, on_delete=models.CASCADE, related_name="rollups")
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    bucket_start = models.DateTimeField()
+    count = models.IntegerField(default=0)
+    download_sum = models.FloatField(default=0)
+    download_sum_sq = models.FloatField(default=0)
+    upload_sum = models.FloatField(default=0)
+    upload_sum_sq = models.FloatField(default=0)
+    latency_sum = models.FloatField(default=0)
+    latency_sum_sq = models.FloatField(default=0)
+    jitter_sum = models.FloatField(default=0)
+    jitter_sum_sq = models.FloatField(default=0)
+
+    def __str__(self):
+        return f"{self.starlink_kit_id} {self.period} {self.bucket_start:%Y-%m-%d %H:%M} ({self.count})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['starlink_kit', 'period', 'bucket_start'], name='rollup_kit_period_bucket_uniq'),
+        ]
+
+
+class SpeedTestSketch(models.Model):
+    """
+    DDSketch quantile summaries (see tester/sketches.py) of one kit's
+    download, upload and latency results for one UTC day.
+    """
+    starlink_kit = models.ForeignKey(StarlinkKit, on_delete=models.CASCADE, related_name="sketches")
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+    download = models.BinaryField(default=b'')
+    upload = models.BinaryField(default=b'')
+    latency = models.BinaryField(default=b'')
+
+    def __str__(self):
+        return f"{self.starlink_kit_id} {self.day} ({self.count})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['starlink_kit', 'day'], name='sketch_kit_day_uniq'),
+        ]
@@ -0,0 +1,181 @@
+import base64
+import binascii
+import datetime
+import heapq
+import itertools
+import operator
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# --- Keyset Pagination ---
+#
+# Pages are cut on (created_at, id), newest first. A cursor records the
+# boundary row and a direction, and each page asks for the rows strictly
+# after that row. The database seeks straight to it on an index ending in
+# (created_at, id), so page 10,000 costs the same as page 1, unlike OFFSET.
+# The id breaks ties between results saved in the same microsecond.
+
+
+def parse_time_bound(value, name):
+    """
+    ``since``/``until`` query value as an aware datetime. A bare date means
+    midnight UTC.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: 'Expected an ISO 8601 date or datetime.'})
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+    return parsed
+
+
+def filter_time_window(queryset, query_params, field='created_at'):
+    """
+    Apply ``?since=`` (inclusive) and ``?until=`` (exclusive) to a queryset.
+    """
+    since = query_params.get('since')
+    if since:
+        queryset = queryset.filter(**{f'{field}__gte': parse_time_bound(since, 'since')})
+    until = query_params.get('until')
+    if until:
+        queryset = queryset.filter(**{f'{field}__lt': parse_time_bound(until, 'until')})
+    return queryset
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a compound (created_at, id) key. Responses look
+    like ``{"next": url, "previous": url, "results": [...]}`` and the
+    cursors inside the urls are opaque.
+
+    ``?page_size=`` picks the page length (``?limit=`` is kept as an alias
+    for older clients) up to ``max_page_size``. Rows are model instances
+    unless the view's ``get_keyset_row_key()`` says how to read
+    (created_at, id) from its rows.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    legacy_page_size_query_param = 'limit'
+    page_size = 50
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param) or request.query_params.get(self.legacy_page_size_query_param)
+        if value == 'all':
+            return self.max_page_size
+        try:
+            size = int(value)
+        except (TypeError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, row, reverse):
+        created_at, pk = self.row_key(row)
+        raw = f"{created_at.isoformat()}|{pk}|{'p' if reverse else 'n'}"
+        token = base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+            created_at, pk, direction = raw.split('|')
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None or direction not in ('n', 'p'):
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk, direction == 'p'
+
+    def fetch(self, queryset, cursor, limit):
+        """
+        Up to ``limit`` rows past the cursor in walk order: newest first
+        going forward, oldest first when walking back. The plain
+        ``created_at`` bound duplicates the keyset condition so the
+        database can use it as an index range.
+        """
+        if cursor is None:
+            return list(queryset.order_by('-created_at', '-id')[:limit])
+        created_at, pk, reverse = cursor
+        if reverse:
+            queryset = queryset.filter(created_at__gte=created_at).filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            ).order_by('created_at', 'id')
+        else:
+            queryset = queryset.filter(created_at__lte=created_at).filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            ).order_by('-created_at', '-id')
+        return list(queryset[:limit])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.legacy_page_size_query_param)
+        size = self.get_page_size(request)
+        self.base_url = replace_query_param(self.base_url, self.page_size_query_param, size)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor[2]
+        self.row_key = view.get_keyset_row_key() if hasattr(view, 'get_keyset_row_key') else operator.attrgetter('created_at', 'id')
+
+        # A view can split the queryset into partitions that each have their
+        # own (.., created_at, id) index, e.g. one per kit. Each is paged on
+        # its index and the runs are merged here, instead of the database
+        # sorting every matching row to find the page.
+        partitions = view.get_keyset_partitions(queryset) if hasattr(view, 'get_keyset_partitions') else None
+        if partitions is None:
+            rows = self.fetch(queryset, cursor, size + 1)
+        else:
+            runs = [self.fetch(partition, cursor, size + 1) for partition in partitions]
+            merged = heapq.merge(*runs, key=self.row_key, reverse=not reverse)
+            rows = list(itertools.islice(merged, size + 1))
+
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if reverse:
+            # Walked back towards newer rows; flip into display order.
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,213 @@
+import mmap
+import os
+import re
+import time
+
+from django.conf import settings
+
+# --- Download Test Payload ---
+#
+# Every download stream serves bytes from one incompressible pool that is
+# built once per worker process. Position ``i`` of any response is
+# ``pool[i % pool_size]``, so Range requests always get consistent bytes.
+# The pool is also split once into immutable ``bytes`` blocks, and streams
+# yield those same objects: the server writes them out as they are, where a
+# memoryview or slice would be copied into a fresh bytes object per chunk.
+
+DEFAULT_POOL_BYTES = 4 * 1024 * 1024
+STREAM_CHUNK_BYTES = 1024 * 1024
+DEFAULT_DOWNLOAD_BYTES = 10 * 1024 * 1024
+MAX_DOWNLOAD_BYTES = 100 * 1024 * 1024
+MIN_STREAM_CHUNK_BYTES = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+_pool = None
+
+
+class PayloadPool:
+    """
+    Read-only buffer of random bytes shared by every download stream.
+    """
+
+    def __init__(self, buffer, path=None):
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.size = len(self.view)
+        self.path = path
+        self._blocks = {}
+
+    @classmethod
+    def from_random(cls, size):
+        return cls(os.urandom(size))
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Memory-map a pre-generated payload file so workers share the
+        same pages through the OS page cache.
+        """
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, path=path)
+
+    def blocks(self, block_size):
+        """
+        The pool as consecutive ``bytes`` objects of ``block_size`` (the
+        last may be shorter), split on first use and kept for the life of
+        the process. Built lazily so a worker that only ever sendfile()s
+        the payload file keeps sharing its pages instead of copying them.
+        """
+        blocks = self._blocks.get(block_size)
+        if blocks is None:
+            blocks = tuple(bytes(self.view[i:i + block_size]) for i in range(0, self.size, block_size))
+            self._blocks[block_size] = blocks
+        return blocks
+
+    def chunks(self, start, length, block_size=STREAM_CHUNK_BYTES):
+        """
+        Yield ``length`` bytes starting at ``start`` as the pool's
+        ``block_size`` blocks. Only a window edge that cuts a block (an
+        unaligned Range start or the final partial block) is sliced, so a
+        response allocates at most two chunks however long it is.
+        """
+        block_size = min(block_size, self.size)
+        blocks = self.blocks(block_size)
+        offset = start % self.size
+        remaining = length
+        while remaining > 0:
+            index, skip = divmod(offset, block_size)
+            block = blocks[index]
+            n = min(len(block) - skip, remaining)
+            yield block if n == len(block) else block[skip:skip + n]
+            remaining -= n
+            offset = (offset + n) % self.size
+
+    def timed_chunks(self, deadline, max_bytes, next_size):
+        """
+        Yield pool blocks until the monotonic ``deadline`` passes or
+        ``max_bytes`` have been produced. ``next_size()`` picks how many
+        bytes go out between deadline checks, so a slow link isn't handed a
+        megabyte that would take it far past the deadline to drain. It is
+        rounded down to whole MIN_STREAM_CHUNK_BYTES blocks, which keeps
+        every chunk aligned and shared.
+        """
+        offset = 0
+        while offset < max_bytes and time.monotonic() < deadline:
+            n = min(max(next_size() // MIN_STREAM_CHUNK_BYTES, 1) * MIN_STREAM_CHUNK_BYTES, max_bytes - offset)
+            yield from self.chunks(offset, n, block_size=MIN_STREAM_CHUNK_BYTES)
+            offset += n
+
+    def covers(self, start, length):
+        """
+        True if the backing file holds the requested window verbatim, so it
+        can be handed to ``wsgi.file_wrapper`` / sendfile.
+        """
+        return self.path is not None and start + length <= self.size
+
+
+class PayloadFile:
+    """
+    Bounded file-like window over the payload file.
+
+    Servers that implement ``wsgi.file_wrapper`` with sendfile (gunicorn)
+    read from the descriptor's current offset for ``Content-Length`` bytes;
+    everything else falls back to ``read()``, which stops at the window end.
+    """
+
+    def __init__(self, path, start, length, on_close=None):
+        self._file = open(path, 'rb', buffering=0)
+        self._file.seek(start)
+        self._remaining = length
+        self._on_close = on_close
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+
+
+def get_payload_pool():
+    """
+    Return the process-wide payload pool, building it on first use.
+    """
+    global _pool
+    if _pool is None:
+        path = getattr(settings, 'SPEEDTEST_PAYLOAD_FILE', None)
+        if path and os.path.exists(path):
+            _pool = PayloadPool.from_file(path)
+        else:
+            size = getattr(settings, 'SPEEDTEST_PAYLOAD_POOL_BYTES', DEFAULT_POOL_BYTES)
+            _pool = PayloadPool.from_random(size)
+    return _pool
+
+
+def parse_download_size(value):
+    """
+    Requested download size in bytes, capped at MAX_DOWNLOAD_BYTES.
+    """
+    if value is None:
+        return DEFAULT_DOWNLOAD_BYTES
+    try:
+        return max(0, min(int(value), MAX_DOWNLOAD_BYTES))
+    except ValueError:
+        return DEFAULT_DOWNLOAD_BYTES
+
+
+def parse_duration(value):
+    """
+    Requested test duration in seconds for duration-bounded mode, capped at
+    SPEEDTEST_MAX_DURATION_SECONDS, or None for the fixed-size mode.
+    """
+    if not value:
+        return None
+    try:
+        duration = float(value)
+    except ValueError:
+        return None
+    if not duration > 0:
+        return None
+    return min(duration, getattr(settings, 'SPEEDTEST_MAX_DURATION_SECONDS', 15))
+
+
+def parse_range_header(header, total_size):
+    """
+    Parse a single-range ``Range: bytes=...`` header.
+
+    Returns ``(start, length)``, ``None`` if the header should be ignored
+    (absent or multi-range), or raises ``ValueError`` if it is unsatisfiable.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes.
+        suffix = int(last)
+        if suffix == 0:
+            raise ValueError('Empty suffix range')
+        start = max(total_size - suffix, 0)
+        return start, total_size - start
+    start = int(first)
+    end = int(last) if last else total_size - 1
+    if start >= total_size or end < start:
+        raise ValueError('Range not satisfiable')
+    end = min(end, total_size - 1)
+    return start, end - start + 1
@@ -0,0 +1,170 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import SpeedTestResult, SpeedTestRollup, SpeedTestSketch
+from .rollups import rebuild_rollups
+from .sketches import rebuild_sketches
+from .versions import bump_kit_owners
+
+# --- Retention ---
+#
+# Raw results are kept for RAW_DAYS; older ones survive only in their
+# summaries, the hourly/daily rollups and the daily quantile sketches that
+# are maintained as results arrive. Expired raw rows are handled one UTC
+# day at a time: kit-days whose summaries count fewer rows than the raw
+# table (results from before the rollups existed) are downsampled from the
+# raw rows first, then the day's rows are deleted in small transactions.
+# Deletes bypass the model signals, which would otherwise subtract the
+# rows from the very summaries they are being retained in. Summaries have
+# their own horizons; None keeps them forever.
+
+DEFAULTS = {
+    'RAW_DAYS': 90,
+    'HOURLY_DAYS': 2 * 365,
+    'DAILY_DAYS': None,
+    'SKETCH_DAYS': None,
+    'BATCH_SIZE': 1000,
+    'BATCH_PAUSE': 0.05,
+}
+
+DAY = datetime.timedelta(days=1)
+
+
+def get_retention_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'SPEEDTEST_RETENTION', {}))
+    return config
+
+
+def utc_midnight(value):
+    value = value.astimezone(datetime.timezone.utc)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def cutoff(now, days):
+    return None if days is None else utc_midnight(now) - datetime.timedelta(days=days)
+
+
+def delete_in_batches(queryset, batch_size, pause, dry_run=False, fields=('pk',)):
+    """
+    Delete ``queryset`` ``batch_size`` rows per transaction, pausing
+    between batches so other writers get the table. Yields the
+    ``fields`` values of each deleted batch (just the count on a dry run).
+
+    Rows go with QuerySet._raw_delete (private, but stable since Django
+    1.x): one DELETE with no instance fetching, no cascade collection and
+    no signals. That suits the tables retention deletes from: nothing
+    references a result, rollup or sketch, and the result signals must not
+    run. Their post_delete receivers would subtract each expired result
+    from the rollups and sketches that are meant to keep it (rollups.py)
+    and bump the owners' list versions one row at a time, which callers do
+    once per batch instead.
+    """
+    if dry_run:
+        yield queryset.count()
+        return
+    while True:
+        rows = list(queryset.order_by().values_list(*fields)[:batch_size])
+        if not rows:
+            return
+        with transaction.atomic():
+            queryset.model.objects.filter(pk__in=[row[0] for row in rows])._raw_delete(queryset.db)
+        yield rows
+        if len(rows) < batch_size:
+            return
+        if pause:
+            time.sleep(pause)
+
+
+def under_summarized_kits(start, end):
+    """
+    Kits whose day rollup or sketch for [start, end) counts fewer results
+    than are still stored raw. A day that was partly purged before has
+    more summarized than raw rows and is left alone.
+    """
+    raw = dict(
+        SpeedTestResult.objects.filter(created_at__gte=start, created_at__lt=end, starlink_kit__isnull=False)
+        .order_by().values_list('starlink_kit').annotate(count=Count('id'))
+    )
+    rollups = dict(SpeedTestRollup.objects.filter(period='day', bucket_start=start).values_list('starlink_kit', 'count'))
+    sketches = dict(SpeedTestSketch.objects.filter(day=start.date()).values_list('starlink_kit', 'count'))
+    return sorted(
+        kit_id for kit_id, count in raw.items()
+        if rollups.get(kit_id, 0) < count or sketches.get(kit_id, 0) < count
+    )
+
+
+def expire_raw_results(before, config, dry_run=False, progress=None):
+    stats = {'days': 0, 'downsampled_kit_days': 0, 'deleted': 0}
+    results = SpeedTestResult.objects.filter(created_at__lt=before)
+    oldest = results.order_by('created_at').values_list('created_at', flat=True).first()
+    start = utc_midnight(oldest) if oldest else before
+    while start < before:
+        end = start + DAY
+        stale = under_summarized_kits(start, end)
+        if stale and not dry_run:
+            with transaction.atomic():
+                rebuild_rollups(stale, start=start, end=end)
+                rebuild_sketches(stale, start=start, end=end)
+        stats['downsampled_kit_days'] += len(stale)
+
+        deleted = 0
+        day_rows = SpeedTestResult.objects.filter(created_at__gte=start, created_at__lt=end)
+        for batch in delete_in_batches(day_rows, config['BATCH_SIZE'], config['BATCH_PAUSE'], dry_run, ('pk', 'starlink_kit')):
+            if dry_run:
+                deleted += batch
+            else:
+                deleted += len(batch)
+                bump_kit_owners({kit_id for _, kit_id in batch})
+        stats['days'] += 1
+        stats['deleted'] += deleted
+        if progress:
+            progress('raw', start.date(), deleted, len(stale))
+
+        # Jump over days without results instead of walking them one by one.
+        following = results.filter(created_at__gte=end).order_by('created_at').values_list('created_at', flat=True).first()
+        start = utc_midnight(following) if following else before
+    return stats
+
+
+def expire_summaries(queryset, label, config, dry_run=False, progress=None):
+    deleted = 0
+    for batch in delete_in_batches(queryset, config['BATCH_SIZE'], config['BATCH_PAUSE'], dry_run):
+        deleted += batch if dry_run else len(batch)
+    if progress:
+        progress(label, None, deleted, 0)
+    return deleted
+
+
+def apply_retention(now=None, dry_run=False, progress=None, config=None):
+    """
+    Apply the SPEEDTEST_RETENTION policies. ``progress(stage, day, rows,
+    downsampled)`` is called after each raw day and each summary table.
+    Returns counts of what was (or, on a dry run, would be) removed.
+    """
+    config = config or get_retention_config()
+    now = now or timezone.now()
+    stats = {'dry_run': dry_run}
+
+    raw_before = cutoff(now, config['RAW_DAYS'])
+    if raw_before is not None:
+        stats.update(expire_raw_results(raw_before, config, dry_run, progress))
+
+    summaries = {
+        'hourly_rollups': (SpeedTestRollup.objects.filter(period='hour'), 'bucket_start__lt', config['HOURLY_DAYS']),
+        'daily_rollups': (SpeedTestRollup.objects.filter(period='day'), 'bucket_start__lt', config['DAILY_DAYS']),
+        'sketches': (SpeedTestSketch.objects.all(), 'day__lt', config['SKETCH_DAYS']),
+    }
+    for label, (queryset, lookup, days) in summaries.items():
+        before = cutoff(now, days)
+        if before is None:
+            continue
+        if lookup == 'day__lt':
+            before = before.date()
+        stats[label] = expire_summaries(queryset.filter(**{lookup: before}), label, config, dry_run, progress)
+    return stats
@@ -0,0 +1,185 @@
+import datetime
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, QuerySet, Sum
+from django.db.models.functions import Trunc
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .aggregates import METRICS
+from .models import SpeedTestResult, SpeedTestRollup
+from .sketches import apply_sketches
+
+# --- Result Rollups ---
+#
+# Per kit, per hour and per day: result count plus the sum and sum of squares
+# of each metric. Saving or deleting a result adjusts its two rollup rows with
+# F() increments in the same transaction, along with the kit's quantile
+# sketch for the day (sketches.py). bulk_create and queryset.update skip
+# the signals, so code writing results that way calls apply_results itself.
+# Deletes do send post_delete for every row, including rows removed by a
+# cascade; when a kit (or its owner) is deleted, its rollups and sketches
+# cascade away in one query per table, so cascaded results are not
+# subtracted one by one (is_cascade). `manage.py rebuild_rollups`
+# recomputes both from raw rows.
+
+PERIODS = ('hour', 'day')
+
+
+def bucket_start(value, period):
+    value = value.astimezone(datetime.timezone.utc)
+    if period == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def apply_results(results, sign=1):
+    """
+    Add (``sign=1``) or remove (``sign=-1``) results from their rollups.
+    Results in the same bucket are combined first, so a batch costs one
+    update per bucket touched rather than one per result.
+    """
+    results = list(results)
+    deltas = defaultdict(lambda: defaultdict(int))
+    for result in results:
+        if result.starlink_kit_id is None:
+            continue
+        for period in PERIODS:
+            delta = deltas[(result.starlink_kit_id, period, bucket_start(result.created_at, period))]
+            delta['count'] += sign
+            for name, field in METRICS.items():
+                value = getattr(result, field)
+                delta[f'{name}_sum'] += sign * value
+                delta[f'{name}_sum_sq'] += sign * value * value
+
+    with transaction.atomic():
+        # Only additions create rows: during a cascading kit delete the
+        # rollups may already be gone along with the kit.
+        if sign > 0:
+            SpeedTestRollup.objects.bulk_create([
+                SpeedTestRollup(starlink_kit_id=kit_id, period=period, bucket_start=start)
+                for kit_id, period, start in deltas
+            ], ignore_conflicts=True)
+        for (kit_id, period, start), delta in deltas.items():
+            rollups = SpeedTestRollup.objects.filter(starlink_kit_id=kit_id, period=period, bucket_start=start)
+            rollups.update(**{column: F(column) + amount for column, amount in delta.items()})
+            if sign < 0:
+                rollups.filter(count__lte=0).delete()
+        apply_sketches(results, sign)
+
+
+def rollup_key(result):
+    return (
+        result.starlink_kit_id, result.created_at,
+        *(getattr(result, field) for field in METRICS.values()),
+    )
+
+
+@receiver(pre_save, sender=SpeedTestResult)
+def remember_rollup_values(sender, instance, raw, **kwargs):
+    # An edited result has to leave its old bucket values behind.
+    instance._rollup_previous = None
+    if not raw and instance.pk and not instance._state.adding:
+        instance._rollup_previous = SpeedTestResult.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=SpeedTestResult)
+def add_to_rollups(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    if created or previous is None:
+        apply_results([instance])
+    elif rollup_key(previous) != rollup_key(instance):
+        apply_results([previous], sign=-1)
+        apply_results([instance])
+
+
+def is_cascade(origin):
+    """
+    True when a result is being deleted because its kit is: the delete
+    started from anything other than results.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin is not None and model is not SpeedTestResult
+
+
+@receiver(post_delete, sender=SpeedTestResult)
+def remove_from_rollups(sender, instance, origin=None, **kwargs):
+    if not is_cascade(origin):
+        apply_results([instance], sign=-1)
+
+
+def rebuild_rollups(kit_ids=None, batch_size=1000, start=None, end=None):
+    """
+    Recompute rollups from the raw results, for every kit or just
+    ``kit_ids``, optionally only for [start, end), which must fall on UTC
+    day boundaries. Returns the number of rollup rows written.
+    """
+    results = SpeedTestResult.objects.filter(starlink_kit__isnull=False).order_by()
+    rollups = SpeedTestRollup.objects.all()
+    if kit_ids:
+        results = results.filter(starlink_kit_id__in=kit_ids)
+        rollups = rollups.filter(starlink_kit_id__in=kit_ids)
+    if start is not None:
+        results = results.filter(created_at__gte=start)
+        rollups = rollups.filter(bucket_start__gte=start)
+    if end is not None:
+        results = results.filter(created_at__lt=end)
+        rollups = rollups.filter(bucket_start__lt=end)
+
+    sums = {'count': Count('id')}
+    for name, field in METRICS.items():
+        sums[f'{name}_sum'] = Sum(field)
+        sums[f'{name}_sum_sq'] = Sum(F(field) * F(field))
+
+    written = 0
+    with transaction.atomic():
+        rollups.delete()
+        for period in PERIODS:
+            rows = results.annotate(bucket=Trunc('created_at', period, tzinfo=datetime.timezone.utc)).values('starlink_kit', 'bucket').annotate(**sums)
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                kit_id, start = row.pop('starlink_kit'), row.pop('bucket')
+                batch.append(SpeedTestRollup(starlink_kit_id=kit_id, period=period, bucket_start=start, **row))
+                if len(batch) >= batch_size:
+                    SpeedTestRollup.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            SpeedTestRollup.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+def rollup_series(rollups, interval):
+    """
+    Per-kit count, mean and standard deviation of each metric from the
+    rollup tables. Hourly buckets read the hour rollups; day, week and
+    month buckets add up day rollups in the database. Buckets are UTC, like
+    bucket_start, whatever TIME_ZONE is.
+    """
+    sums = {'count': Sum('count')}
+    for name in METRICS:
+        sums[f'{name}_sum'] = Sum(f'{name}_sum')
+        sums[f'{name}_sum_sq'] = Sum(f'{name}_sum_sq')
+
+    rows = (
+        rollups.filter(period='hour' if interval == 'hour' else 'day')
+        .order_by()
+        .annotate(bucket=Trunc('bucket_start', interval, tzinfo=datetime.timezone.utc))
+        .values('starlink_kit', 'bucket')
+        .annotate(**sums)
+        .order_by('starlink_kit', 'bucket')
+    )
+    series = []
+    for row in rows:
+        count = row['count']
+        entry = {'starlink_kit': row['starlink_kit'], 'bucket': row['bucket'], 'count': count}
+        for name in METRICS:
+            mean = row[f'{name}_sum'] / count
+            variance = max(row[f'{name}_sum_sq'] / count - mean * mean, 0.0)
+            entry[name] = {'mean': mean, 'stddev': math.sqrt(variance)}
+        series.append(entry)
+    return series
@@ -1,5 +1,10 @@
+import datetime
+import operator
 from django.contrib.auth.models import User
-from rest_framework import serializers
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from .models import SpeedTestResult, StarlinkKit, Ticket, ActivationRequest, UserProfile
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -52,13 +57,141 @@ class ActivationRequestSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'created_at']
 
 class SpeedTestResultSerializer(serializers.ModelSerializer):
+    # Links the result to a loaded-latency probe run (see streaming.probe)
+    test_id = serializers.RegexField(r'^[\w-]{1,64}$', write_only=True, required=False)
+
+    class Meta:
+        model = SpeedTestResult
+        fields = [
+            'id', 'starlink_kit', 'download_speed_mbps', 'upload_speed_mbps', 'latency_ms', 'jitter_ms',
+            'isp_name', 'is_starlink', 'client_ip', 'enrichment_status',
+            'idle_latency_p50_ms', 'idle_latency_p95_ms', 'download_latency_p50_ms', 'download_latency_p95_ms',
+            'upload_latency_p50_ms', 'upload_latency_p95_ms',
+            'created_at', 'test_id'
+        ]
+        read_only_fields = [
+            'starlink_kit', 'client_ip', 'created_at', 'isp_name', 'is_starlink', 'enrichment_status',
+            'idle_latency_p50_ms', 'idle_latency_p95_ms', 'download_latency_p50_ms', 'download_latency_p95_ms',
+            'upload_latency_p50_ms', 'upload_latency_p95_ms'
+        ]
+
+class SpeedTestResultBulkItemSerializer(serializers.ModelSerializer):
+    """
+    One measurement in a bulk upload. The view checks kit ownership once for
+    the whole batch, so starlink_kit is a plain id here. created_at is the
+    time the measurement was taken and defaults to now.
+    """
+    starlink_kit = serializers.IntegerField()
+
     class Meta:
         model = SpeedTestResult
-        fields = ['id', 'starlink_kit', 'download_speed_mbps', 'upload_speed_mbps', 'latency_ms', 'jitter_ms', 'isp_name', 'is_starlink', 'client_ip', 'created_at']
-        read_only_fields = ['starlink_kit', 'client_ip', 'created_at', 'isp_name', 'is_starlink']
+        fields = [
+            'starlink_kit', 'download_speed_mbps', 'upload_speed_mbps', 'latency_ms', 'jitter_ms',
+            'client_ip', 'created_at'
+        ]
+        extra_kwargs = {'created_at': {'required': False}}
+
+    def validate_created_at(self, value):
+        if value > timezone.now() + datetime.timedelta(minutes=5):
+            raise serializers.ValidationError('Measurement time is in the future.')
+        return value
 
 class NetworkInfoSerializer(serializers.Serializer):
     ip = serializers.IPAddressField()
     isp = serializers.CharField()
     is_starlink = serializers.BooleanField()
     details = serializers.CharField(required=False)
+
+# --- Fast Read Path ---
+
+def _iso_datetime(field):
+    # DateTimeField.to_representation for aware values in ISO 8601 output
+    if getattr(field, 'format', api_settings.DATETIME_FORMAT) != ISO_8601:
+        return field.to_representation
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None:
+        return field.to_representation
+
+    def to_representation(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return to_representation
+
+
+# Fields whose representation is the value the database adapter already
+# returns (int, float, str, bool, a pk); everything else not special-cased
+# below falls back to field.to_representation.
+IDENTITY_FIELDS = (
+    serializers.IntegerField, serializers.FloatField, serializers.CharField, serializers.EmailField,
+    serializers.SlugField, serializers.IPAddressField, serializers.BooleanField, serializers.PrimaryKeyRelatedField,
+)
+
+
+class ValuesListSerializer:
+    """
+    Read-only, list-only counterpart of a ModelSerializer. Rows come from
+    values_list() instead of model instances, and each field's
+    to_representation is reduced to a plain callable per list (or skipped
+    where the database value already is the representation), producing the
+    same dicts as ``serializer_class(instances, many=True).data``. Dotted
+    sources such as ``assigned_user.email`` become joins in the query.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.names, self.lookups = [], []
+        for field in serializer_class().fields.values():
+            if field.write_only:
+                continue
+            if field.source == '*' or isinstance(field, (serializers.SerializerMethodField, serializers.BaseSerializer)):
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{field.field_name} has no single column to read')
+            self.names.append(field.field_name)
+            self.lookups.append('__'.join(field.source_attrs))
+
+    def compile(self):
+        # Built per call so the datetime mappers see the active timezone.
+        mappers = []
+        for field in self.serializer_class().fields.values():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.DateTimeField):
+                mappers.append(_iso_datetime(field))
+            elif isinstance(field, serializers.ChoiceField):
+                choices = field.choice_strings_to_values
+                mappers.append(lambda value, choices=choices: choices.get(str(value), value))
+            elif type(field) in IDENTITY_FIELDS:
+                mappers.append(None)
+            else:
+                mappers.append(field.to_representation)
+        return mappers
+
+    def values(self, queryset):
+        """
+        ``queryset`` as tuples of the serialized fields' columns.
+        """
+        return queryset.values_list(*self.lookups)
+
+    def row_getter(self, *names):
+        """
+        Callable picking the named fields out of a values() tuple.
+        """
+        return operator.itemgetter(*(self.names.index(name) for name in names))
+
+    def to_representation(self, rows):
+        names, mappers = self.names, self.compile()
+        mapped = [(i, mapper) for i, mapper in enumerate(mappers) if mapper is not None]
+        if not mapped:
+            return [dict(zip(names, row)) for row in rows]
+        data = []
+        for row in rows:
+            values = list(row)
+            for i, mapper in mapped:
+                value = values[i]
+                if value is not None:
+                    values[i] = mapper(value)
+            data.append(dict(zip(names, values)))
+        return data
@@ -0,0 +1,65 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .latency import get_probe_summary
+from .throughput import aggregate_windows, get_load_windows
+
+# --- Speed Test Sessions ---
+#
+# A session groups every parallel download/upload stream (and the optional
+# loaded-latency probe) of one test run. Streams join it by passing the
+# session id as ``test_id``; they already record their load windows under
+# that id, so finalizing only has to aggregate what the streams left behind.
+
+SESSION_KEY = 'speedtest:session:{}'
+
+
+def create_session(user, kit):
+    session_id = uuid.uuid4().hex
+    timeout = getattr(settings, 'SPEEDTEST_SESSION_TTL', 300)
+    cache.set(SESSION_KEY.format(session_id), {
+        "user_id": user.id,
+        "kit_id": kit.id,
+        "created": time.time(),
+    }, timeout)
+    return session_id, timeout
+
+
+def get_session(session_id):
+    return cache.get(SESSION_KEY.format(session_id))
+
+
+def claim_session(session_id):
+    """
+    Remove the session so it can only be finalized once. Returns False if
+    another request got there first.
+    """
+    return cache.delete(SESSION_KEY.format(session_id))
+
+
+def summarize_session(session_id):
+    """
+    Server-measured download/upload throughput and latency for a session.
+    """
+    windows = get_load_windows(session_id)
+    probe = get_probe_summary(session_id)
+    return {
+        "download": aggregate_windows([w for w in windows if w['direction'] == 'download']),
+        "upload": aggregate_windows([w for w in windows if w['direction'] == 'upload']),
+        "probe": probe,
+    }
+
+
+def headline_mbps(aggregate):
+    """
+    The figure we store on a result: steady state when the test ran long
+    enough to have one, otherwise the plain average.
+    """
+    if not aggregate:
+        return None
+    if aggregate['steady_state_mbps'] is not None:
+        return aggregate['steady_state_mbps']
+    return aggregate['calculated_mbps']
@@ -0,0 +1,239 @@
+import datetime
+import math
+import struct
+import sys
+from array import array
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import SpeedTestResult, SpeedTestSketch
+
+# --- Quantile Sketches ---
+#
+# DDSketch (Masson et al., VLDB 2019): values are counted in logarithmic
+# buckets whose width is a fixed fraction of the value, so any quantile read
+# back is within RELATIVE_ACCURACY of the true one. Two sketches merge by
+# adding bucket counts, and a value is removed by subtracting its count, so
+# the per-kit per-day sketches can follow inserts and deletes, and any range
+# of days or group of kits merges into one sketch to answer percentiles.
+
+RELATIVE_ACCURACY = 0.01
+MAX_BINS = 2048
+MIN_INDEXABLE = 1e-9
+METRICS = {
+    'download': 'download_speed_mbps',
+    'upload': 'upload_speed_mbps',
+    'latency': 'latency_ms',
+}
+
+# version, relative accuracy, total count, zero count, number of bins;
+# followed by the bin keys (int32) and their counts (uint64), little endian.
+HEADER = struct.Struct('<BdQQI')
+VERSION = 1
+
+
+class DDSketch:
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def key(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def add(self, value, weight=1):
+        """
+        Count ``value`` ``weight`` times; a negative weight removes it again.
+        """
+        self.count += weight
+        if value <= MIN_INDEXABLE:
+            self.zero_count += weight
+            return
+        key = self.key(value)
+        if weight < 0 and key not in self.bins:
+            # Its bin was collapsed into a higher one.
+            key = min((k for k in self.bins if k > key), default=key)
+        count = self.bins.get(key, 0) + weight
+        if count > 0:
+            self.bins[key] = count
+        else:
+            self.bins.pop(key, None)
+        if len(self.bins) > MAX_BINS:
+            self.collapse()
+
+    def collapse(self):
+        """
+        Fold the lowest bins together to stay within MAX_BINS, trading
+        accuracy at the bottom of the range for bounded size.
+        """
+        keys = sorted(self.bins)
+        excess = keys[:len(keys) - MAX_BINS + 1]
+        self.bins[keys[len(excess)]] += sum(self.bins.pop(k) for k in excess)
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different relative accuracy')
+        bins = self.bins
+        for key, count in other.bins.items():
+            bins[key] = bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if len(bins) > MAX_BINS:
+            self.collapse()
+
+    def quantile(self, q):
+        """
+        Value at quantile ``q`` (0-1), or None for an empty sketch.
+        """
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        running = self.zero_count
+        if running > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            running += self.bins[key]
+            if running > rank:
+                # Midpoint of the bucket (gamma^(k-1), gamma^k] in relative terms
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_bytes(self):
+        keys = array('i', self.bins.keys())
+        counts = array('Q', self.bins.values())
+        if sys.byteorder == 'big':
+            keys.byteswap()
+            counts.byteswap()
+        return HEADER.pack(VERSION, self.relative_accuracy, self.count, self.zero_count, len(keys)) + keys.tobytes() + counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data:
+            return cls()
+        data = bytes(data)
+        version, accuracy, count, zero_count, nbins = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ValueError(f'Unsupported sketch version {version}')
+        sketch = cls(accuracy)
+        sketch.count, sketch.zero_count = count, zero_count
+        keys, counts = array('i'), array('Q')
+        offset = HEADER.size
+        keys.frombytes(data[offset:offset + 4 * nbins])
+        counts.frombytes(data[offset + 4 * nbins:offset + 12 * nbins])
+        if sys.byteorder == 'big':
+            keys.byteswap()
+            counts.byteswap()
+        sketch.bins = dict(zip(keys, counts))
+        return sketch
+
+
+def apply_sketches(results, sign=1):
+    """
+    Add (``sign=1``) or remove (``sign=-1``) results from their kit's
+    sketch for the day. Called from rollups.apply_results, so every path
+    that maintains the rollups maintains the sketches too.
+    """
+    groups = defaultdict(list)
+    for result in results:
+        if result.starlink_kit_id is not None:
+            groups[(result.starlink_kit_id, result.created_at.astimezone(datetime.timezone.utc).date())].append(result)
+
+    if not groups:
+        return
+    with transaction.atomic():
+        if sign > 0:
+            SpeedTestSketch.objects.bulk_create([
+                SpeedTestSketch(starlink_kit_id=kit_id, day=day) for kit_id, day in groups
+            ], ignore_conflicts=True)
+        rows = SpeedTestSketch.objects.select_for_update().filter(
+            starlink_kit_id__in={kit_id for kit_id, _ in groups},
+            day__in={day for _, day in groups},
+        )
+        changed, emptied = [], []
+        for row in rows:
+            group = groups.get((row.starlink_kit_id, row.day))
+            if group is None:
+                continue
+            for name, field in METRICS.items():
+                sketch = DDSketch.from_bytes(getattr(row, name))
+                for result in group:
+                    sketch.add(getattr(result, field), sign)
+                setattr(row, name, sketch.to_bytes())
+            row.count += sign * len(group)
+            (changed if row.count > 0 else emptied).append(row)
+        SpeedTestSketch.objects.bulk_update(changed, ['count', *METRICS], batch_size=500)
+        if emptied:
+            SpeedTestSketch.objects.filter(pk__in=[row.pk for row in emptied]).delete()
+
+
+def rebuild_sketches(kit_ids=None, batch_size=500, start=None, end=None):
+    """
+    Recompute the sketches from the raw results, optionally only for
+    [start, end) on UTC day boundaries. Rows are read in (kit, created_at)
+    order so only one day's sketches are held at a time. Returns the
+    number of sketch rows written.
+    """
+    results = SpeedTestResult.objects.filter(starlink_kit__isnull=False)
+    sketches = SpeedTestSketch.objects.all()
+    if kit_ids:
+        results = results.filter(starlink_kit_id__in=kit_ids)
+        sketches = sketches.filter(starlink_kit_id__in=kit_ids)
+    if start is not None:
+        results = results.filter(created_at__gte=start)
+        sketches = sketches.filter(day__gte=start.date())
+    if end is not None:
+        results = results.filter(created_at__lt=end)
+        sketches = sketches.filter(day__lt=end.date())
+    rows = results.order_by('starlink_kit', 'created_at').values_list('starlink_kit', 'created_at', *METRICS.values())
+
+    written = 0
+    batch = []
+    current, count, day_sketches = None, 0, None
+
+    def flush():
+        batch.append(SpeedTestSketch(
+            starlink_kit_id=current[0], day=current[1], count=count,
+            **{name: sketch.to_bytes() for name, sketch in day_sketches.items()}
+        ))
+
+    with transaction.atomic():
+        sketches.delete()
+        for kit_id, created_at, *values in rows.iterator(chunk_size=2000):
+            key = (kit_id, created_at.astimezone(datetime.timezone.utc).date())
+            if key != current:
+                if current is not None:
+                    flush()
+                current, count, day_sketches = key, 0, {name: DDSketch() for name in METRICS}
+            count += 1
+            for name, value in zip(METRICS, values):
+                day_sketches[name].add(value)
+            if len(batch) >= batch_size:
+                SpeedTestSketch.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if current is not None:
+            flush()
+        SpeedTestSketch.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def merged_quantiles(sketch_rows, quantiles):
+    """
+    Merge ``(count, download, upload, latency)`` blob rows into one sketch
+    per metric and read the requested quantiles (0-1) from them.
+    """
+    merged = {name: DDSketch() for name in METRICS}
+    total = 0
+    for count, *blobs in sketch_rows:
+        total += count
+        for name, blob in zip(METRICS, blobs):
+            merged[name].merge(DDSketch.from_bytes(blob))
+    summary = {'count': total}
+    for name, sketch in merged.items():
+        summary[name] = {f'p{q * 100:g}': sketch.quantile(q) for q in quantiles}
+    return summary
@@ -0,0 +1,384 @@
+import asyncio
+import json
+import math
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.urls import reverse
+from corsheaders.conf import conf as cors_conf
+
+from .payload import get_payload_pool, parse_download_size, parse_duration, parse_range_header
+from .admission import AdmissionDenied, get_admission_controller
+from .latency import LatencyStats, split_by_load, store_probe_summary
+from .throughput import (
+    ThroughputSampler, download_complete_callback, get_load_windows, is_valid_stream_id, record_load_window
+)
+
+# --- Native ASGI Speed Test Endpoints ---
+#
+# Django's ASGI handler buffers the whole request body before a view runs
+# and ties a thread to every sync view, so a 100 MB transfer occupies a
+# worker for its full duration. SpeedTestASGIMiddleware answers ping,
+# download and upload directly on the event loop and hands every other
+# request (including CORS preflights) to Django unchanged. Under WSGI the
+# DRF views in views.py keep serving the same URLs.
+#
+# The latency probe is a WebSocket endpoint and therefore ASGI-only; clients
+# fall back to timing HTTP round-trips to PingView when it is unavailable.
+#
+# Nothing here may block the loop: admission goes through the controllers'
+# coroutine methods and the cache writes of finished streams run in a
+# worker thread (in_thread).
+
+
+def in_thread(func):
+    return sync_to_async(func, thread_sensitive=False)
+
+
+def _cors_headers(scope):
+    origin = None
+    for name, value in scope['headers']:
+        if name == b'origin':
+            origin = value.decode('latin-1')
+            break
+    headers = [(b'vary', b'origin')]
+    if origin is None:
+        return headers
+    if cors_conf.CORS_ALLOW_ALL_ORIGINS and not cors_conf.CORS_ALLOW_CREDENTIALS:
+        headers.append((b'access-control-allow-origin', b'*'))
+    elif cors_conf.CORS_ALLOW_ALL_ORIGINS or origin in cors_conf.CORS_ALLOWED_ORIGINS:
+        headers.append((b'access-control-allow-origin', origin.encode('latin-1')))
+        if cors_conf.CORS_ALLOW_CREDENTIALS:
+            headers.append((b'access-control-allow-credentials', b'true'))
+    return headers
+
+
+def _query_int(query, name, default, low, high):
+    try:
+        value = int(query.get(name, [default])[0])
+    except ValueError:
+        value = default
+    return max(low, min(value, high))
+
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _client_ip(scope):
+    forwarded = _header(scope, b'x-forwarded-for')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return scope['client'][0] if scope.get('client') else None
+
+
+async def _admit(scope, send):
+    """
+    Admission check shared by download, upload and the probe. Sends the
+    refusal itself (429, or a close before the WebSocket handshake
+    completes) and returns None when the stream is refused.
+    """
+    try:
+        return await get_admission_controller().aadmit(_client_ip(scope))
+    except AdmissionDenied as denied:
+        if scope['type'] == 'websocket':
+            # 1013: try again later. Servers answer the handshake with 403.
+            await send({'type': 'websocket.close', 'code': 1013})
+            return None
+        headers = _cors_headers(scope) + [
+            (b'retry-after', str(math.ceil(denied.retry_after)).encode()),
+            (b'content-type', b'application/json'),
+        ]
+        body = json.dumps({"detail": "Too many speed tests in progress, try again later."}).encode()
+        await send({'type': 'http.response.start', 'status': 429, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+        return None
+
+
+async def _watch_disconnect(receive, disconnected):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+
+async def ping(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 204, 'headers': _cors_headers(scope)})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def download(scope, receive, send):
+    ticket = await _admit(scope, send)
+    if ticket is None:
+        return
+    try:
+        await _download(scope, receive, send, ticket)
+    finally:
+        await ticket.arelease()
+
+
+async def _download(scope, receive, send, ticket):
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    size = parse_download_size(query.get('size', [None])[0])
+    duration = parse_duration(query.get('duration', [None])[0])
+    on_complete = download_complete_callback(
+        query.get('stream_id', [None])[0], query.get('test_id', [None])[0], _client_ip(scope)
+    )
+    pool = get_payload_pool()
+    headers = _cors_headers(scope) + [
+        (b'content-type', b'application/octet-stream'),
+        (b'cache-control', b'no-cache, no-store, must-revalidate'),
+    ]
+
+    if duration is not None:
+        # Duration-bounded mode: no Content-Length, the server chunks it.
+        sampler = ThroughputSampler()
+        chunks = pool.timed_chunks(
+            sampler.started_at + duration,
+            getattr(settings, 'SPEEDTEST_MAX_DURATION_BYTES', 2 * 1024 * 1024 * 1024),
+            sampler.adaptive_chunk_size
+        )
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    else:
+        try:
+            byte_range = parse_range_header(_header(scope, b'range'), size)
+        except ValueError:
+            headers = _cors_headers(scope) + [(b'content-range', f'bytes */{size}'.encode())]
+            await send({'type': 'http.response.start', 'status': 416, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        start, length = byte_range or (0, size)
+        headers += [
+            (b'content-length', str(length).encode()),
+            (b'accept-ranges', b'bytes'),
+        ]
+        if byte_range:
+            headers.append((b'content-range', f'bytes {start}-{start + length - 1}/{size}'.encode()))
+        sampler = ThroughputSampler() if on_complete is not None else None
+        chunks = pool.chunks(start, length)
+        await send({'type': 'http.response.start', 'status': 206 if byte_range else 200, 'headers': headers})
+
+    completed = False
+    # Stop generating bytes as soon as the client goes away.
+    disconnected = asyncio.Event()
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, disconnected))
+    try:
+        for chunk in chunks:
+            if disconnected.is_set():
+                return
+            # The server's send() applies transport backpressure.
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await ticket.arecord_egress(len(chunk))
+            if sampler is not None:
+                sampler.record(len(chunk))
+        await send({'type': 'http.response.body', 'body': b''})
+        completed = True
+    finally:
+        watcher.cancel()
+        if on_complete is not None:
+            await in_thread(on_complete)(sampler, completed)
+
+
+async def upload(scope, receive, send):
+    ticket = await _admit(scope, send)
+    if ticket is None:
+        return
+    try:
+        await _upload(scope, receive, send)
+    finally:
+        await ticket.arelease()
+
+
+async def _upload(scope, receive, send):
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    sampler = ThroughputSampler()
+    # With ?duration= we stop reading at the deadline and answer early
+    duration = parse_duration(query.get('duration', [None])[0])
+    deadline = sampler.started_at + duration if duration is not None else None
+    truncated = False
+    more_body = True
+    while more_body:
+        if deadline is not None:
+            try:
+                message = await asyncio.wait_for(receive(), max(0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                truncated = True
+                break
+        else:
+            message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        sampler.record(len(message.get('body', b'')))
+        more_body = message.get('more_body', False)
+
+    test_id = query.get('test_id', [None])[0]
+    if is_valid_stream_id(test_id):
+        await in_thread(record_load_window)(test_id, 'upload', sampler)
+
+    body = json.dumps({
+        "received_bytes": sampler.total_bytes,
+        "truncated": truncated,
+        **sampler.summary()
+    }).encode()
+    headers = _cors_headers(scope) + [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+    ]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def probe_limits(query):
+    """
+    (loaded, rate, count) for a probe request. Both modes are capped at
+    SPEEDTEST_PROBE_MAX_COUNT frames and at a maximum run time
+    (SPEEDTEST_PROBE_MAX_SECONDS, or SPEEDTEST_LOADED_PROBE_MAX_SECONDS
+    when loaded), however slow the requested rate.
+    """
+    max_rate = getattr(settings, 'SPEEDTEST_PROBE_MAX_RATE', 500)
+    max_count = getattr(settings, 'SPEEDTEST_PROBE_MAX_COUNT', 5000)
+    loaded = query.get('mode', [''])[0] == 'loaded'
+    if loaded:
+        rate = _query_int(query, 'rate', getattr(settings, 'SPEEDTEST_LOADED_PROBE_RATE', 10), 1, max_rate)
+        count = rate * getattr(settings, 'SPEEDTEST_LOADED_PROBE_MAX_SECONDS', 300)
+    else:
+        rate = _query_int(query, 'rate', getattr(settings, 'SPEEDTEST_PROBE_RATE', 50), 1, max_rate)
+        count = _query_int(query, 'count', getattr(settings, 'SPEEDTEST_PROBE_COUNT', 100), 1, max_count)
+        count = min(count, rate * getattr(settings, 'SPEEDTEST_PROBE_MAX_SECONDS', 60))
+    return loaded, rate, min(count, max_count)
+
+
+async def probe(scope, receive, send):
+    """
+    WebSocket latency probe.
+
+    The server sends frames ``{"type": "probe", "seq": n, "t": ms}`` at
+    ``rate`` per second; the client echoes each frame back unchanged. RTTs
+    are measured against the server's own send times, so neither Django's
+    middleware nor the client's clock adds noise. When probing is over (and
+    outstanding echoes have arrived or the grace period expired) the server
+    sends a ``summary`` frame with RTT percentiles, jitter and loss, then
+    closes the socket.
+
+    By default the probe stops after ``count`` frames. With ``mode=loaded``
+    it runs at a low rate until the client sends ``{"type": "done"}``, and
+    samples are split into idle/download/upload phases using the load
+    windows of streams that passed the same ``test_id``. That summary is
+    kept for SpeedTestResultViewSet to store on the result.
+
+    A probe holds an admission slot like any download or upload stream.
+    """
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    ticket = await _admit(scope, send)
+    if ticket is None:
+        return
+    try:
+        await _probe(scope, receive, send)
+    finally:
+        await ticket.arelease()
+
+
+async def _probe(scope, receive, send):
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    loaded, rate, count = probe_limits(query)
+    test_id = query.get('test_id', [None])[0]
+    await send({'type': 'websocket.accept'})
+
+    # samples[i] is [wall-clock send time, RTT in ms or None while unanswered].
+    samples = []
+    sent_at = {}
+    done = asyncio.Event()
+    all_echoed = asyncio.Event()
+
+    async def receiver():
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            now = time.monotonic()
+            try:
+                frame = json.loads(message.get('text') or message.get('bytes') or b'')
+                if frame.get('type') == 'done':
+                    done.set()
+                    continue
+                seq = frame['seq']
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+            pending = sent_at.pop(seq, None)
+            if pending is not None:
+                started, index = pending
+                samples[index][1] = (now - started) * 1000
+                if done.is_set() and not sent_at:
+                    all_echoed.set()
+
+    receiving = asyncio.ensure_future(receiver())
+    try:
+        origin = time.monotonic()
+        wall_offset = time.time() - origin
+        for seq in range(count):
+            if receiving.done() or done.is_set():
+                break
+            now = time.monotonic()
+            sent_at[seq] = (now, len(samples))
+            samples.append([now + wall_offset, None])
+            await send({'type': 'websocket.send', 'text': json.dumps({"type": "probe", "seq": seq, "t": now * 1000})})
+            # Pace against the start time so scheduling delays don't accumulate.
+            await asyncio.sleep(max(0, origin + (seq + 1) / rate - time.monotonic()))
+
+        done.set()
+        if not sent_at:
+            all_echoed.set()
+        waiters = [receiving, asyncio.ensure_future(all_echoed.wait())]
+        await asyncio.wait(waiters, timeout=getattr(settings, 'SPEEDTEST_PROBE_GRACE_SECONDS', 2),
+                           return_when=asyncio.FIRST_COMPLETED)
+        waiters[1].cancel()
+
+        summary = {"type": "summary", **LatencyStats.from_samples(samples).summary()}
+        if loaded:
+            windows = await in_thread(get_load_windows)(test_id) if is_valid_stream_id(test_id) else []
+            summary['phases'] = split_by_load(samples, windows)
+            if is_valid_stream_id(test_id):
+                await in_thread(store_probe_summary)(test_id, summary)
+        if receiving.done():
+            return
+        await send({'type': 'websocket.send', 'text': json.dumps(summary)})
+        await send({'type': 'websocket.close', 'code': 1000})
+    finally:
+        receiving.cancel()
+
+
+class SpeedTestASGIMiddleware:
+    """
+    ASGI wrapper that serves the bandwidth test endpoints natively and
+    delegates everything else to the wrapped Django application.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = {}
+        self.probe_path = getattr(settings, 'SPEEDTEST_PROBE_PATH', '/api/probe/')
+        if getattr(settings, 'SPEEDTEST_ASGI_FAST_PATH', True):
+            self.routes = {
+                ('GET', reverse('ping')): ping,
+                ('HEAD', reverse('ping')): ping,
+                ('GET', reverse('download')): download,
+                ('POST', reverse('upload')): upload,
+            }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'websocket' and scope['path'] == self.probe_path:
+            return await probe(scope, receive, send)
+        if scope['type'] == 'http':
+            handler = self.routes.get((scope['method'], scope['path']))
+            if handler is not None:
+                return await handler(scope, receive, send)
+        return await self.app(scope, receive, send)
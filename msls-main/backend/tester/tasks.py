@@ -0,0 +1,30 @@
+from celery import shared_task
+
+from .enrichment import enrich_results, get_enrichment_config
+from .retention import apply_retention
+
+
+@shared_task(bind=True, ignore_result=True)
+def enrich_results_task(self, result_ids):
+    """
+    Celery side of the ISP enrichment backend: resolve a batch of pending
+    results and retry the transient failures with exponential backoff.
+    """
+    config = get_enrichment_config()
+    final = self.request.retries >= config['MAX_RETRIES']
+    retry = enrich_results(result_ids, final=final)
+    if retry:
+        raise self.retry(
+            args=[retry],
+            countdown=config['RETRY_DELAY'] * 2 ** self.request.retries,
+            max_retries=config['MAX_RETRIES'],
+        )
+
+
+@shared_task(ignore_result=True)
+def apply_retention_task():
+    """
+    Periodic retention run (see CELERY_BEAT_SCHEDULE); the same work as
+    ``manage.py apply_retention``.
+    """
+    apply_retention()
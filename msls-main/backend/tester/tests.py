@@ -1,3 +1,1897 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import gzip
+import importlib
+import io
+import json
+import math
+import os
+import random
+import re
+import shutil
+import statistics
+import tempfile
+import time
+import unittest
+from unittest import mock
+from wsgiref.util import FileWrapper
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.http import FileResponse, StreamingHttpResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import admission, aggregates, enrichment, export, geo, ipasn, ispcache, latency, listcache, payload, retention, streaming, tasks, throughput, versions
+from .admission import AdmissionTicket, LocalAdmissionController
+from .columnar import export_columnar
+from .enrichment import enrich_results
+from .ipasn import IPRangeIndex, IPResolver
+from .models import ActivationRequest, SpeedTestResult, SpeedTestRollup, SpeedTestSketch, StarlinkKit, Ticket
+from .retention import apply_retention
+from .rollups import rebuild_rollups
+from .serializers import SpeedTestResultSerializer, StarlinkKitSerializer, ValuesListSerializer
+from .sketches import MAX_BINS, RELATIVE_ACCURACY, DDSketch, rebuild_sketches
+from .latency import get_probe_summary, loaded_latency_fields, split_by_load
+from .throughput import ThroughputSampler, get_stream_stats, recommend_streams, steady_state_mbps
+
+
+# --- Query Plans ---
+
+def explain(sql):
+    """
+    Plan lines for an already-executed query. On Postgres, sequential scans
+    and sorts are disabled for the statement, so the planner falls back to
+    them only when no index path exists at all.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute('EXPLAIN ' + sql)
+        else:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    """
+    Full table scans and explicit sorts in an EXPLAIN plan.
+    """
+    if connection.vendor == 'postgresql':
+        return [line for line in plan if 'Seq Scan' in line or re.search(r'(^|->)\s*(Incremental )?Sort\b', line)]
+    return [line for line in plan if line.startswith('SCAN ') or 'TEMP B-TREE' in line]
+
+
+@unittest.skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'EXPLAIN checks cover SQLite and Postgres')
+class QueryPlanTests(TestCase):
+    """
+    Runs each hot list endpoint, EXPLAINs every query it issued against the
+    app's tables and fails if any of them scans a whole table or sorts.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', password='x')
+        other = User.objects.create_user('other', password='x')
+        cls.kits = [
+            StarlinkKit.objects.create(kit_id=f'KIT{owner.id}{i}', nickname=f'Kit {i}', assigned_user=owner)
+            for owner in (cls.user, other) for i in range(2)
+        ]
+        SpeedTestResult.objects.bulk_create([
+            SpeedTestResult(
+                starlink_kit=kit, download_speed_mbps=100, upload_speed_mbps=10,
+                latency_ms=30, jitter_ms=2, isp_name='SpaceX Starlink', is_starlink=True,
+            )
+            for kit in cls.kits for _ in range(5)
+        ])
+        for owner in (cls.user, other):
+            Ticket.objects.create(user=owner, subject='Slow', description='Slow at night')
+            ActivationRequest.objects.create(user=owner, kit_id='KITNEW')
+
+    def setUp(self):
+        # Cached list responses would skip the queries under test.
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertIndexedPlans(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200, response.content)
+        queries = [q['sql'] for q in captured.captured_queries if q['sql'].startswith('SELECT') and 'tester_' in q['sql']]
+        self.assertTrue(queries, f'{url} issued no queries')
+        for sql in queries:
+            plan = explain(sql)
+            self.assertFalse(plan_problems(plan), f'{url}\n{sql}\n' + '\n'.join(plan))
+        return response
+
+    def test_kit_list(self):
+        self.assertIndexedPlans('/api/kits/')
+
+    def test_result_list(self):
+        self.assertIndexedPlans('/api/results/')
+
+    def test_result_list_for_kit(self):
+        self.assertIndexedPlans(f'/api/results/?starlink_kit={self.kits[0].id}')
+
+    def test_result_list_time_window(self):
+        self.assertIndexedPlans(f'/api/results/?starlink_kit={self.kits[0].id}&since=2020-01-01&until=2100-01-01')
+
+    def test_result_list_later_pages(self):
+        response = self.assertIndexedPlans(f'/api/results/?starlink_kit={self.kits[0].id}&page_size=2')
+        response = self.assertIndexedPlans(response.data['next'])
+        self.assertIndexedPlans(response.data['previous'])
+        response = self.assertIndexedPlans('/api/results/?page_size=2')
+        self.assertIndexedPlans(response.data['next'])
+
+    def test_ticket_list(self):
+        self.assertIndexedPlans('/api/tickets/')
+        self.assertIndexedPlans('/api/tickets/?status=Open')
+
+    def test_activation_request_list(self):
+        self.assertIndexedPlans('/api/activation-requests/')
+        self.assertIndexedPlans('/api/activation-requests/?status=Pending')
+
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Walks the result list with cursors, merged across kits and for one kit,
+    with many rows sharing a created_at.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pager', password='x')
+        cls.kits = [StarlinkKit.objects.create(kit_id=f'KITK{i}', assigned_user=cls.user) for i in range(3)]
+        other = StarlinkKit.objects.create(kit_id='KITKX', assigned_user=User.objects.create_user('stranger'))
+        moment = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+        SpeedTestResult.objects.bulk_create([
+            SpeedTestResult(
+                starlink_kit=kit, download_speed_mbps=i, upload_speed_mbps=1, latency_ms=1, jitter_ms=1,
+                # Runs of four rows share a timestamp, across kits as well
+                created_at=moment + datetime.timedelta(minutes=i // 4),
+            )
+            for i in range(40) for kit in (cls.kits[i % 3], other)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def expected_ids(self, **filters):
+        return list(
+            SpeedTestResult.objects.filter(starlink_kit__assigned_user=self.user, **filters)
+            .order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+
+    def walk(self, url):
+        pages = [self.get(url)]
+        while pages[-1]['next']:
+            pages.append(self.get(pages[-1]['next']))
+        return pages
+
+    def assertRoundTrip(self, url, expected):
+        pages = self.walk(url)
+        self.assertEqual([row['id'] for page in pages for row in page['results']], expected)
+        self.assertIsNone(pages[0]['previous'])
+        # Walking back from the last page yields the same pages in reverse.
+        back = [pages[-1]]
+        while back[-1]['previous']:
+            back.append(self.get(back[-1]['previous']))
+        self.assertEqual([page['results'] for page in reversed(back)], [page['results'] for page in pages])
+
+    def test_merged_across_kits(self):
+        self.assertRoundTrip('/api/results/?page_size=7', self.expected_ids())
+
+    def test_single_kit(self):
+        kit = self.kits[1]
+        self.assertRoundTrip(f'/api/results/?starlink_kit={kit.id}&page_size=3', self.expected_ids(starlink_kit=kit))
+
+    def test_page_size_one_through_ties(self):
+        self.assertRoundTrip('/api/results/?page_size=1', self.expected_ids())
+
+    def test_limit_all_is_capped(self):
+        kit = self.kits[0]
+        SpeedTestResult.objects.bulk_create([
+            SpeedTestResult(starlink_kit=kit, download_speed_mbps=1, upload_speed_mbps=1, latency_ms=1, jitter_ms=1)
+            for _ in range(1000)
+        ])
+        page = self.get('/api/results/?limit=all')
+        self.assertEqual(len(page['results']), 1000)
+        self.assertIn('page_size=1000', page['next'])
+        self.assertEqual(len(self.get(page['next'])['results']), 40)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/results/?cursor=bm9wZQ', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 404)
+
+
+# --- Fast Read Serializers ---
+
+class ValuesListSerializerTests(TestCase):
+    """
+    The values_list() read path must render byte-for-byte what the
+    ModelSerializer renders for the same rows.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('reader', email='r\u00e9ader@example.com', password='x')
+        kits = [
+            StarlinkKit.objects.create(kit_id='KITA', nickname='Caf\u00e9 "roof"', assigned_user=owner, latitude=-33.8688, longitude=151.2093, slug='kita'),
+            StarlinkKit.objects.create(kit_id='KITB', nickname='Boat', assigned_user=owner, status='Online'),
+        ]
+        moment = datetime.datetime(2024, 3, 1, 12, 0, tzinfo=datetime.timezone.utc)
+        SpeedTestResult.objects.bulk_create([
+            SpeedTestResult(
+                starlink_kit=kits[0], download_speed_mbps=123.456, upload_speed_mbps=7, latency_ms=31.5, jitter_ms=0.1,
+                isp_name='SpaceX Starlink', is_starlink=True, client_ip='2001:db8::1', created_at=moment,
+                idle_latency_p50_ms=25.0, download_latency_p95_ms=1e-7,
+            ),
+            SpeedTestResult(
+                starlink_kit=kits[1], download_speed_mbps=0, upload_speed_mbps=0.5, latency_ms=1000, jitter_ms=0,
+                isp_name='', enrichment_status=SpeedTestResult.ENRICHMENT_PENDING,
+                created_at=moment + datetime.timedelta(microseconds=123456),
+            ),
+            SpeedTestResult(
+                starlink_kit=None, download_speed_mbps=1, upload_speed_mbps=1, latency_ms=1, jitter_ms=1,
+                isp_name='Comcast \u2603', client_ip='10.0.0.1', created_at=timezone.now(),
+            ),
+        ])
+
+    def assertSameJSON(self, serializer_class, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        read_serializer = ValuesListSerializer(serializer_class)
+        actual = JSONRenderer().render(read_serializer.to_representation(read_serializer.values(queryset)))
+        self.assertEqual(actual, expected)
+
+    def test_results(self):
+        self.assertSameJSON(SpeedTestResultSerializer, SpeedTestResult.objects.order_by('id'))
+
+    def test_kits(self):
+        self.assertSameJSON(StarlinkKitSerializer, StarlinkKit.objects.order_by('id'))
+
+    def test_list_endpoints(self):
+        cache.clear()
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username='reader'))
+        response = client.get('/api/results/', HTTP_HOST='localhost')
+        expected = SpeedTestResultSerializer(
+            SpeedTestResult.objects.filter(starlink_kit__isnull=False).order_by('-created_at', '-id'), many=True
+        ).data
+        self.assertEqual(JSONRenderer().render(response.data['results']), JSONRenderer().render(expected))
+
+
+# --- Download Tests ---
+
+class PayloadFileTestCase(TestCase):
+    """
+    Runs with SPEEDTEST_PAYLOAD_FILE pointing at a fresh payload file and
+    fresh process-wide pool and admission state.
+    """
+    payload_bytes = 256 * 1024
+
+    def setUp(self):
+        cache.clear()
+        handle, self.payload_path = tempfile.mkstemp()
+        with os.fdopen(handle, 'wb') as f:
+            f.write(os.urandom(self.payload_bytes))
+        settings_override = override_settings(SPEEDTEST_PAYLOAD_FILE=self.payload_path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(os.remove, self.payload_path)
+        self.addCleanup(self.reset_globals)
+        self.reset_globals()
+        self.client = APIClient()
+
+    def reset_globals(self):
+        payload._pool = None
+        admission._controller = None
+
+    def download(self, size, *, sendfile=True, client_ip='127.0.0.1', **params):
+        extra = {'REMOTE_ADDR': client_ip}
+        if sendfile:
+            extra['wsgi.file_wrapper'] = FileWrapper
+        response = self.client.get('/api/download/', {'size': size, **params}, HTTP_HOST='localhost', **extra)
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content)
+        response.close()
+        return response, body
+
+
+class DownloadTestViewTests(PayloadFileTestCase):
+
+    def test_sendfile_path(self):
+        response, body = self.download(1000)
+        self.assertIsInstance(response, FileResponse)
+        with open(self.payload_path, 'rb') as f:
+            self.assertEqual(body, f.read(1000))
+
+    def test_stream_stats_with_payload_file(self):
+        for sendfile in (True, False):
+            stream_id = f'stream-{sendfile}'
+            response, body = self.download(1000, sendfile=sendfile, stream_id=stream_id)
+            self.assertNotIsInstance(response, FileResponse)
+            self.assertEqual(len(body), 1000)
+            stats = self.client.get('/api/download/stats/', {'stream_id': stream_id}, HTTP_HOST='localhost')
+            self.assertEqual(stats.status_code, 200)
+            self.assertEqual(stats.data['sent_bytes'], 1000)
+            self.assertTrue(stats.data['completed'])
+
+    def test_stream_stats_bound_to_client(self):
+        self.download(1000, sendfile=False, stream_id='mine', client_ip='198.51.100.20')
+        stats = self.client.get('/api/download/stats/', {'stream_id': 'mine'}, HTTP_HOST='localhost', REMOTE_ADDR='198.51.100.20')
+        self.assertEqual(stats.status_code, 200)
+        self.assertEqual(stats.data['sent_bytes'], 1000)
+        self.assertNotIn('client_ip', stats.data)
+        # Another client that knows or guesses the id gets nothing
+        for extra in ({'REMOTE_ADDR': '198.51.100.21'}, {}):
+            stats = self.client.get('/api/download/stats/', {'stream_id': 'mine'}, HTTP_HOST='localhost', **extra)
+            self.assertEqual(stats.status_code, 404)
+            self.assertEqual(stats.data, {'error': 'Unknown stream'})
+
+    def test_streams_shared_blocks(self):
+        response, body = self.download(3 * self.payload_bytes + 1000, sendfile=False)
+        self.assertNotIsInstance(response, FileResponse)
+        pool = payload.get_payload_pool()
+        with open(self.payload_path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(body, data * 3 + data[:1000])
+
+        response = self.client.get('/api/download/', {'size': 3 * self.payload_bytes}, HTTP_HOST='localhost')
+        chunks = list(response.streaming_content)
+        response.close()
+        # Every chunk is the pool's own block, not a copy of it.
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(all(chunk is pool.blocks(self.payload_bytes)[0] for chunk in chunks))
+
+    def test_range_requests(self):
+        with open(self.payload_path, 'rb') as f:
+            data = f.read()
+        size = 2 * self.payload_bytes
+        cases = {
+            'bytes=1000-1999': (1000, 1000),
+            'bytes=-500': (size - 500, 500),
+            # Crosses the end of the pool: bytes wrap round to its start
+            f'bytes={self.payload_bytes - 100}-': (self.payload_bytes - 100, self.payload_bytes + 100),
+            f'bytes=100-{size * 2}': (100, size - 100),
+        }
+        for header, (start, length) in cases.items():
+            for sendfile in (True, False):
+                extra = {'wsgi.file_wrapper': FileWrapper} if sendfile else {}
+                response = self.client.get('/api/download/', {'size': size}, HTTP_HOST='localhost', HTTP_RANGE=header, **extra)
+                self.assertEqual(response.status_code, 206, header)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{start + length - 1}/{size}')
+                self.assertEqual(int(response['Content-Length']), length)
+                self.assertEqual(b''.join(response.streaming_content), (data * 2)[start:start + length])
+                response.close()
+        self.assertEqual(admission.get_admission_controller().active, 0)
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=1000-', 'bytes=-0', 'bytes=500-400'):
+            response = self.client.get('/api/download/', {'size': 1000}, HTTP_HOST='localhost', HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], 'bytes */1000')
+        # Refused ranges hand their admission slot straight back
+        self.assertEqual(admission.get_admission_controller().active, 0)
+
+        # A malformed or multi-range header is ignored: the whole body, 200
+        response = self.client.get('/api/download/', {'size': 1000}, HTTP_HOST='localhost', HTTP_RANGE='bytes=0-1,5-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content)), 1000)
+        response.close()
+
+
+class SpeedTestSessionTests(PayloadFileTestCase):
+
+    def test_session_end_to_end(self):
+        user = User.objects.create_user('tester', password='x')
+        kit = StarlinkKit.objects.create(kit_id='KITS', assigned_user=user)
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/sessions/', {'starlink_kit': kit.id}, format='json', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 201)
+        session_id = response.data['session_id']
+
+        for _ in range(2):
+            self.download(self.payload_bytes, test_id=session_id)
+        response = self.client.post(
+            f'/api/upload/?test_id={session_id}', os.urandom(64 * 1024),
+            content_type='application/octet-stream', HTTP_HOST='localhost',
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(f'/api/sessions/{session_id}/finalize/', {'latency_ms': 40}, format='json', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['throughput']['download']['streams'], 2)
+        self.assertEqual(response.data['throughput']['download']['bytes'], 2 * self.payload_bytes)
+        self.assertEqual(response.data['throughput']['upload']['bytes'], 64 * 1024)
+        self.assertEqual(SpeedTestResult.objects.get(id=response.data['id']).starlink_kit, kit)
+
+
+# --- Native ASGI Endpoints ---
+
+class ASGIConnection:
+    """
+    Minimal ASGI server side for one connection: hands the app queued
+    messages and records what it sends. ``on_send`` may queue replies.
+    """
+
+    def __init__(self, scope_type, path, query='', client='203.0.113.9', on_send=None):
+        self.scope = {
+            'type': scope_type, 'path': path, 'method': 'GET', 'headers': [],
+            'query_string': query.encode(), 'client': (client, 50000),
+        }
+        self.inbox = asyncio.Queue()
+        self.sent = []
+        self.on_send = on_send
+
+    async def receive(self):
+        return await self.inbox.get()
+
+    async def send(self, message):
+        self.sent.append(message)
+        if self.on_send is not None:
+            self.on_send(self, message)
+
+    def body(self):
+        return b''.join(m.get('body', b'') for m in self.sent if m['type'] == 'http.response.body')
+
+
+class CountingController(LocalAdmissionController):
+    def __init__(self, config):
+        super().__init__(config)
+        self.egress_calls = []
+
+    def record_egress(self, nbytes):
+        self.egress_calls.append(nbytes)
+        super().record_egress(nbytes)
+
+
+class ASGIEndpointTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        payload._pool = None
+        self.controller = CountingController({**admission.DEFAULTS, 'EGRESS_BYTES_PER_SECOND': 10 ** 12})
+        admission._controller = self.controller
+        self.addCleanup(setattr, admission, '_controller', None)
+
+    def test_ticket_batches_egress(self):
+        ticket = AdmissionTicket(self.controller)
+        chunk = 64 * 1024
+        for _ in range(40):
+            ticket.record_egress(chunk)
+        self.assertEqual(self.controller.egress_calls, [16 * chunk, 16 * chunk])
+        ticket.release()
+        self.assertEqual(self.controller.egress_calls, [16 * chunk, 16 * chunk, 8 * chunk])
+        self.assertEqual(self.controller.active, 0)
+
+    async def test_download(self):
+        size = 3 * 1024 * 1024 + 5
+        client = ASGIConnection('http', '/api/download/', f'size={size}&stream_id=asgi-1')
+        await client.inbox.put({'type': 'http.request', 'body': b'', 'more_body': False})
+        await streaming.download(client.scope, client.receive, client.send)
+        self.assertEqual(client.sent[0]['status'], 200)
+        self.assertEqual(len(client.body()), size)
+        # Whole blocks go to the server as the pool's own objects.
+        blocks = payload.get_payload_pool().blocks(payload.STREAM_CHUNK_BYTES)
+        bodies = [message['body'] for message in client.sent[1:4]]
+        self.assertTrue(all(body is block for body, block in zip(bodies, blocks)))
+        self.assertEqual(sum(self.controller.egress_calls), size)
+        self.assertEqual(self.controller.active, 0)
+        self.assertIsNone(get_stream_stats('asgi-1', '198.51.100.1'))
+        stats = get_stream_stats('asgi-1', '203.0.113.9')
+        self.assertEqual(stats['sent_bytes'], size)
+        self.assertTrue(stats['completed'])
+
+    def echo_probes(self, client, message, done_after=None):
+        if message['type'] != 'websocket.send':
+            return
+        frame = json.loads(message['text'])
+        if frame['type'] == 'probe':
+            client.inbox.put_nowait({'type': 'websocket.receive', 'text': message['text']})
+            if done_after is not None and frame['seq'] + 1 == done_after:
+                client.inbox.put_nowait({'type': 'websocket.receive', 'text': json.dumps({'type': 'done'})})
+
+    async def run_probe(self, query, **echo):
+        client = ASGIConnection('websocket', '/api/probe/', query,
+                                on_send=lambda client, message: self.echo_probes(client, message, **echo))
+        await client.inbox.put({'type': 'websocket.connect'})
+        await streaming.probe(client.scope, client.receive, client.send)
+        return client
+
+    async def test_probe_ping_pong(self):
+        client = await self.run_probe('rate=500&count=5')
+        self.assertEqual(client.sent[0], {'type': 'websocket.accept'})
+        frames = [json.loads(m['text']) for m in client.sent if m['type'] == 'websocket.send']
+        self.assertEqual([f['seq'] for f in frames[:-1]], [0, 1, 2, 3, 4])
+        summary = frames[-1]
+        self.assertEqual(summary['type'], 'summary')
+        self.assertEqual((summary['sent'], summary['received'], summary['loss_percent']), (5, 5, 0.0))
+        self.assertLessEqual(summary['min_ms'], summary['p50_ms'])
+        self.assertEqual(client.sent[-1], {'type': 'websocket.close', 'code': 1000})
+        self.assertEqual(self.controller.active, 0)
+
+    async def test_loaded_probe_stores_summary(self):
+        client = await self.run_probe('mode=loaded&rate=500&test_id=probe-1', done_after=3)
+        summary = json.loads(client.sent[-2]['text'])
+        self.assertEqual(summary['sent'], 3)
+        self.assertEqual(summary['phases']['idle']['received'], 3)
+        self.assertEqual(get_probe_summary('probe-1'), summary)
+
+    async def test_loaded_probe_uses_load_windows(self):
+        # A download stream of the same test that runs for the whole probe
+        sampler = ThroughputSampler()
+        sampler.record(10 ** 6)
+        sampler.record(10 ** 6, now=time.monotonic() + 100)
+        await sync_to_async(throughput.record_load_window)('probe-2', 'download', sampler)
+        client = await self.run_probe('mode=loaded&rate=500&test_id=probe-2', done_after=4)
+        phases = get_probe_summary('probe-2')['phases']
+        self.assertEqual((phases['idle']['sent'], phases['download']['sent'], phases['upload']['sent']), (0, 4, 0))
+        self.assertIsNotNone(phases['download']['throughput_mbps'])
+        self.assertEqual(loaded_latency_fields({'phases': phases})['download_latency_p50_ms'], phases['download']['p50_ms'])
+
+    async def test_probe_admission(self):
+        admission._controller = LocalAdmissionController({**admission.DEFAULTS, 'BURST_PER_IP': 1, 'RATE_PER_IP': 0.001})
+        await self.run_probe('rate=500&count=1')
+        client = await self.run_probe('rate=500&count=1')
+        self.assertEqual(client.sent, [{'type': 'websocket.close', 'code': 1013}])
+
+    def test_probe_limits(self):
+        self.assertEqual(streaming.probe_limits({'rate': ['1'], 'count': ['1000000']}), (False, 1, 60))
+        self.assertEqual(streaming.probe_limits({'rate': ['100000'], 'count': ['1000000']}), (False, 500, 5000))
+        self.assertEqual(streaming.probe_limits({'mode': ['loaded'], 'rate': ['500']}), (True, 500, 5000))
+        self.assertEqual(streaming.probe_limits({'mode': ['loaded']}), (True, 10, 3000))
+
+
+# --- List Versions ---
+
+class ListVersionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('poller', password='x')
+        cls.kit = StarlinkKit.objects.create(kit_id='KITP', assigned_user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        listcache._list_cache = None
+        self.addCleanup(setattr, listcache, '_list_cache', None)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_result(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            SpeedTestResult.objects.create(
+                starlink_kit=self.kit, download_speed_mbps=100, upload_speed_mbps=10, latency_ms=30, jitter_ms=2,
+            )
+
+    @override_settings(LIST_VERSIONS={'ENABLED': True})
+    def test_conditional_get(self):
+        response = self.client.get('/api/results/', HTTP_HOST='localhost')
+        etag = response['ETag']
+        response = self.client.get('/api/results/', HTTP_HOST='localhost', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.add_result()
+        response = self.client.get('/api/results/', HTTP_HOST='localhost', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertNotEqual(response['ETag'], etag)
+        # A client without the ETag gets the cached page, not a stale one.
+        response = self.client.get('/api/results/', HTTP_HOST='localhost')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(listcache.get_list_cache().stats['result']['hits'], 1)
+
+    def test_off_over_process_local_cache(self):
+        self.assertFalse(versions.get_versions_config()['ENABLED'])
+        self.assertFalse(versions.check_versions_cache(None))
+        self.add_result()
+        response = self.client.get('/api/results/', HTTP_HOST='localhost')
+        self.assertNotIn('ETag', response)
+        self.assertFalse(cache.get(versions.CACHE_KEY.format(versions.user_scope(self.user.pk))))
+        self.assertEqual(listcache.get_list_cache().stats['result'], {'hits': 0, 'misses': 0})
+        with override_settings(LIST_VERSIONS={'ENABLED': True}):
+            self.assertEqual([w.id for w in versions.check_versions_cache(None)], ['tester.W001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}):
+            self.assertTrue(versions.get_versions_config()['ENABLED'])
+
+
+# --- Rollups ---
+
+class RollupDeleteTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='x')
+        self.kits = [StarlinkKit.objects.create(kit_id=f'KITR{i}', assigned_user=self.user) for i in range(2)]
+        for kit in self.kits:
+            for i in range(30):
+                SpeedTestResult.objects.create(
+                    starlink_kit=kit, download_speed_mbps=100 + i, upload_speed_mbps=10, latency_ms=30, jitter_ms=2,
+                )
+
+    def test_single_result_delete_updates_summaries(self):
+        kit = self.kits[0]
+        kit.speed_tests.first().delete()
+        self.assertEqual(kit.rollups.get(period='day').count, 29)
+        self.assertEqual(kit.sketches.get().count, 29)
+
+    def test_kit_delete_drops_summaries_in_bulk(self):
+        kit, other = self.kits
+        with CaptureQueriesContext(connection) as captured:
+            kit.delete()
+        self.assertLess(len(captured), 15, '\n'.join(q['sql'] for q in captured.captured_queries))
+        self.assertFalse(SpeedTestRollup.objects.filter(starlink_kit_id=kit.pk).exists())
+        self.assertFalse(SpeedTestSketch.objects.filter(starlink_kit_id=kit.pk).exists())
+        self.assertEqual(other.rollups.get(period='day').count, 30)
+        self.assertEqual(other.sketches.get().count, 30)
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        self.kit = StarlinkKit.objects.create(kit_id='KITU', assigned_user=User.objects.create_user('roller'))
+        self.start = datetime.datetime(2026, 4, 6, 22, tzinfo=datetime.timezone.utc)
+
+    def result(self, minutes, download, **fields):
+        # Whole numbers keep the sums exact whatever order they are added in
+        return SpeedTestResult.objects.create(
+            starlink_kit=self.kit, download_speed_mbps=download, upload_speed_mbps=10, latency_ms=30, jitter_ms=2,
+            created_at=self.start + datetime.timedelta(minutes=minutes), **fields,
+        )
+
+    def rollups(self):
+        return {
+            (period, bucket.isoformat()): (count, download_sum, download_sum_sq)
+            for period, bucket, count, download_sum, download_sum_sq in SpeedTestRollup.objects.order_by('period', 'bucket_start').values_list(
+                'period', 'bucket_start', 'count', 'download_sum', 'download_sum_sq',
+            )
+        }
+
+    def test_create_and_edit(self):
+        self.result(10, 100)
+        moving = self.result(20, 200)
+        self.result(70, 50)  # 23:10, same day, next hour
+        self.assertEqual(self.rollups(), {
+            ('day', '2026-04-06T00:00:00+00:00'): (3, 350, 100 ** 2 + 200 ** 2 + 50 ** 2),
+            ('hour', '2026-04-06T22:00:00+00:00'): (2, 300, 100 ** 2 + 200 ** 2),
+            ('hour', '2026-04-06T23:00:00+00:00'): (1, 50, 50 ** 2),
+        })
+
+        # Edit the value: the sums follow, the counts don't move
+        moving.download_speed_mbps = 120
+        moving.save()
+        self.assertEqual(self.rollups()[('hour', '2026-04-06T22:00:00+00:00')], (2, 220, 100 ** 2 + 120 ** 2))
+
+        # Move it across midnight: it leaves both of its old buckets
+        moving.created_at = self.start + datetime.timedelta(hours=2, minutes=5)
+        moving.save()
+        self.assertEqual(self.rollups(), {
+            ('day', '2026-04-06T00:00:00+00:00'): (2, 150, 100 ** 2 + 50 ** 2),
+            ('day', '2026-04-07T00:00:00+00:00'): (1, 120, 120 ** 2),
+            ('hour', '2026-04-06T22:00:00+00:00'): (1, 100, 100 ** 2),
+            ('hour', '2026-04-06T23:00:00+00:00'): (1, 50, 50 ** 2),
+            ('hour', '2026-04-07T00:00:00+00:00'): (1, 120, 120 ** 2),
+        })
+
+        # Saving without a change to the rolled-up fields leaves them alone
+        with CaptureQueriesContext(connection) as captured:
+            moving.isp_name = 'renamed'
+            moving.save()
+        self.assertFalse([q for q in captured.captured_queries if 'rollup' in q['sql']])
+
+    def test_rebuild_matches_incremental(self):
+        rng = random.Random(16)
+        for i in range(60):
+            self.result(rng.randrange(0, 3 * 24 * 60), rng.randrange(20, 300))
+        SpeedTestResult.objects.order_by('pk').first().delete()
+        incremental = self.rollups()
+        # Rebuilt in the database; the buckets must stay UTC like
+        # bucket_start's, whatever the local time zone.
+        for time_zone in ('UTC', 'America/New_York', 'Asia/Kolkata'):
+            with self.subTest(time_zone=time_zone), override_settings(TIME_ZONE=time_zone):
+                self.assertEqual(rebuild_rollups(), len(incremental))
+                self.assertEqual(self.rollups(), incremental)
+
+    def test_series_buckets_in_utc(self):
+        self.result(10, 100)   # Monday 6 April, 22:10 UTC
+        self.result(150, 200)  # Tuesday 7 April, 00:30 UTC
+        client = APIClient()
+        client.force_authenticate(self.kit.assigned_user)
+        for time_zone in ('UTC', 'America/New_York'):
+            with self.subTest(time_zone=time_zone), override_settings(TIME_ZONE=time_zone):
+                response = client.get('/api/results/rollups/', {'interval': 'day'}, HTTP_HOST='localhost')
+                self.assertEqual(
+                    [(r['bucket'].astimezone(datetime.timezone.utc).day, r['count']) for r in response.data['results']],
+                    [(6, 1), (7, 1)],
+                )
+                response = client.get('/api/results/rollups/', {'interval': 'week'}, HTTP_HOST='localhost')
+                self.assertEqual(len(response.data['results']), 1)
+                self.assertEqual(response.data['results'][0]['bucket'], datetime.datetime(2026, 4, 6, tzinfo=datetime.timezone.utc))
+                self.assertEqual(response.data['results'][0]['download']['mean'], 150)
+
+
+# --- Columnar Export ---
+
+class ColumnarExportTests(TestCase):
+
+    def test_in_place_updates_rewrite_the_day(self):
+        kit = StarlinkKit.objects.create(kit_id='KITC', assigned_user=User.objects.create_user('exporter'))
+        moment = datetime.datetime(2024, 3, 1, 12, 0, tzinfo=datetime.timezone.utc)
+        results = SpeedTestResult.objects.bulk_create([
+            SpeedTestResult(
+                starlink_kit=kit, download_speed_mbps=100, upload_speed_mbps=10, latency_ms=30, jitter_ms=2,
+                client_ip='127.0.0.1', isp_name='', enrichment_status=SpeedTestResult.ENRICHMENT_PENDING,
+                created_at=moment + datetime.timedelta(minutes=i),
+            )
+            for i in range(3)
+        ])
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.assertEqual(export_columnar(root), [moment.date()])
+        self.assertEqual(export_columnar(root), [])
+
+        enrich_results([result.pk for result in results])
+        self.assertEqual(export_columnar(root), [moment.date()])
+        with open(os.path.join(root, 'day=2024-03-01', 'isp_name.json')) as f:
+            self.assertEqual(json.load(f), ['Localhost Development'])
+        self.assertEqual(export_columnar(root), [])
+
+
+# --- Offline IP-to-ASN Resolver ---
+
+class IPRangeIndexTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.index = IPRangeIndex.from_file(ipasn.BUNDLED_DATASET)
+
+    def assertASN(self, ip, asn):
+        match = self.index.lookup(ip)
+        self.assertEqual(match[0] if match else None, asn, ip)
+
+    def test_ipv4(self):
+        self.assertEqual(self.index.lookup('98.97.12.3'), (14593, 'SPACEX-STARLINK', 'US'))
+        self.assertASN('102.89.1.1', 29465)
+        self.assertASN('10.0.0.1', None)
+
+    def test_ipv6(self):
+        self.assertEqual(self.index.lookup('2605:59c8:1234::1'), (14593, 'SPACEX-STARLINK', 'US'))
+        self.assertASN('2001:4860::8888', 15169)
+        self.assertASN('2001:db8::1', None)
+
+    def test_range_boundaries(self):
+        # First and last address of a range, and the neighbours either side
+        self.assertASN('1.1.1.0', 13335)
+        self.assertASN('1.1.1.255', 13335)
+        self.assertASN('1.1.0.255', None)
+        self.assertASN('1.1.2.0', None)
+        self.assertASN('2001:4860:ffff:ffff:ffff:ffff:ffff:ffff', 15169)
+        self.assertASN('2001:4861::', None)
+        # Before the first and after the last range of each family
+        self.assertASN('0.0.0.0', None)
+        self.assertASN('255.255.255.255', None)
+        self.assertASN('::', None)
+        self.assertASN('ffff::1', None)
+
+    def test_unrouted_and_invalid(self):
+        self.assertASN('192.0.2.10', None)
+        self.assertASN('not-an-ip', None)
+        self.assertASN('', None)
+
+    def test_csv_layout(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('range_start,range_end,as_number,country_code,as_description\n')
+            f.write('203.0.113.0,203.0.113.127,64500,AU,EXAMPLE\n')
+        self.addCleanup(os.remove, f.name)
+        index = IPRangeIndex.from_file(f.name)
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.lookup('203.0.113.127'), (64500, 'EXAMPLE', 'AU'))
+        self.assertIsNone(index.lookup('203.0.113.128'))
+
+
+class IPResolverTests(SimpleTestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.tsv')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        shutil.copyfile(ipasn.BUNDLED_DATASET, self.path)
+        self.mtime = os.path.getmtime(self.path)
+
+    def replace_dataset(self, content):
+        with open(self.path, 'wb') as f:
+            f.write(content)
+        self.mtime += 10
+        os.utime(self.path, (self.mtime, self.mtime))
+
+    def test_malformed_reload_keeps_previous_index(self):
+        resolver = IPResolver(self.path, reload_interval=0)
+        malformed = (
+            b'\xff\xfe\x00garbage',
+            b'',
+            b'1.0.0.0\t1.0.0.255\t-5\tUS\tNEGATIVE\n',
+            b'1.0.0.0\t::1\t1\tUS\tMIXED\n',
+            b'1.0.0.255\t1.0.0.0\t1\tUS\tREVERSED\n',
+        )
+        for content in malformed:
+            self.replace_dataset(content)
+            with self.assertLogs('tester.ipasn', 'ERROR'):
+                self.assertEqual(resolver.lookup('98.97.0.1')[0], 14593)
+
+        self.replace_dataset(b'198.51.100.0\t198.51.100.255\t64501\tNZ\tFIXED\n')
+        self.assertEqual(resolver.lookup('198.51.100.1'), (64501, 'FIXED', 'NZ'))
+        self.assertIsNone(resolver.lookup('98.97.0.1'))
+
+    def test_offline_lookup_shape(self):
+        with override_settings(ISP_DATASET_PATH=self.path):
+            ipasn._resolver = None
+            self.addCleanup(setattr, ipasn, '_resolver', None)
+            info = ipasn.lookup_isp_offline('98.97.0.1')
+        self.assertEqual(info['status'], 'success')
+        self.assertEqual(info['as'], 'AS14593 SPACEX-STARLINK')
+        self.assertEqual(info['source'], 'offline')
+        self.assertIsNone(ipasn.lookup_isp_offline('10.0.0.1'))
+
+
+# --- Quantile Sketches ---
+
+class DDSketchTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = random.Random(17)
+        # Speed-like values spanning a few decades, plus exact zeros
+        self.values = [rng.lognormvariate(4, 1) for _ in range(20000)] + [0.0] * 100
+        rng.shuffle(self.values)
+
+    def sketch(self, values, weight=1):
+        sketch = DDSketch()
+        for value in values:
+            sketch.add(value, weight)
+        return sketch
+
+    def assertSameSketch(self, actual, expected):
+        self.assertEqual(
+            (actual.count, actual.zero_count, actual.bins),
+            (expected.count, expected.zero_count, expected.bins),
+        )
+
+    def test_relative_accuracy(self):
+        sketch = self.sketch(self.values)
+        ordered = sorted(self.values)
+        reference = statistics.quantiles(self.values, n=100, method='inclusive')
+        for percentile, expected in enumerate(reference, 1):
+            q = percentile / 100
+            estimate = sketch.quantile(q)
+            rank = q * (len(ordered) - 1)
+            low, high = ordered[math.floor(rank)], ordered[math.ceil(rank)]
+            self.assertGreaterEqual(estimate, low * (1 - RELATIVE_ACCURACY), percentile)
+            self.assertLessEqual(estimate, high * (1 + RELATIVE_ACCURACY), percentile)
+            self.assertLessEqual(abs(estimate - expected), RELATIVE_ACCURACY * expected, percentile)
+        self.assertEqual(sketch.quantile(0), 0.0)
+        self.assertIsNone(DDSketch().quantile(0.5))
+
+    def test_serialize_round_trip(self):
+        sketch = self.sketch(self.values)
+        restored = DDSketch.from_bytes(sketch.to_bytes())
+        self.assertSameSketch(restored, sketch)
+        self.assertEqual(restored.quantile(0.95), sketch.quantile(0.95))
+        self.assertSameSketch(DDSketch.from_bytes(b''), DDSketch())
+        with self.assertRaises(ValueError):
+            DDSketch.from_bytes(b'\x02' + sketch.to_bytes()[1:])
+
+    def test_merge_and_remove(self):
+        first, second = self.values[:7000], self.values[7000:]
+        merged = self.sketch(first)
+        merged.merge(DDSketch.from_bytes(self.sketch(second).to_bytes()))
+        self.assertSameSketch(merged, self.sketch(self.values))
+        for value in second:
+            merged.add(value, -1)
+        self.assertSameSketch(merged, self.sketch(first))
+        with self.assertRaises(ValueError):
+            merged.merge(DDSketch(relative_accuracy=0.02))
+
+    def test_remove_after_collapse(self):
+        # Wider than MAX_BINS buckets: the lowest ones fold together.
+        values = [10 ** (exponent / 50) for exponent in range(-400, 2000)]
+        sketch = self.sketch(values)
+        self.assertLessEqual(len(sketch.bins), MAX_BINS)
+        self.assertAlmostEqual(sketch.quantile(1) / values[-1], 1, delta=RELATIVE_ACCURACY)
+        for value in values:
+            sketch.add(value, -1)
+        self.assertSameSketch(sketch, DDSketch())
+
+
+# --- Bulk Upload ---
+
+class BulkUploadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('uploader', password='x')
+        cls.kit = StarlinkKit.objects.create(kit_id='KITU', assigned_user=cls.user)
+        cls.foreign_kit = StarlinkKit.objects.create(kit_id='KITF', assigned_user=User.objects.create_user('neighbour'))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def item(self, kit=None, **overrides):
+        return {
+            'starlink_kit': (kit or self.kit).id, 'download_speed_mbps': 150.5, 'upload_speed_mbps': 12,
+            'latency_ms': 40, 'jitter_ms': 3, 'created_at': '2024-03-01T10:00:00Z', **overrides,
+        }
+
+    def post(self, body, content_type='application/json'):
+        if not isinstance(body, (str, bytes)):
+            body = json.dumps(body)
+        return self.client.post('/api/results/bulk/', body, content_type=content_type, HTTP_HOST='localhost')
+
+    def test_json_list_and_object(self):
+        response = self.post([self.item(), self.item(latency_ms=55)])
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((response.data['created'], response.data['errors']), (2, []))
+        ids = response.data['ids']
+        response = self.post({'results': [self.item()]})
+        self.assertEqual(response.data['created'], 1)
+        ids += response.data['ids']
+
+        results = SpeedTestResult.objects.filter(starlink_kit=self.kit)
+        self.assertEqual(sorted(results.values_list('id', flat=True)), sorted(ids))
+        self.assertTrue(all(r.enrichment_status == SpeedTestResult.ENRICHMENT_PENDING for r in results))
+        self.assertEqual(self.kit.rollups.get(period='day').count, 3)
+        self.assertEqual(self.kit.sketches.get().count, 3)
+
+    def test_ndjson(self):
+        body = '\n'.join(json.dumps(item) for item in (self.item(), self.item(jitter_ms=9))) + '\n\n'
+        response = self.post(body, 'application/x-ndjson')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(
+            sorted(SpeedTestResult.objects.filter(pk__in=response.data['ids']).values_list('jitter_ms', flat=True)), [3, 9]
+        )
+
+        response = self.post(json.dumps(self.item()) + '\n{broken\n', 'application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('line 2', str(response.data['detail']))
+
+    def test_per_item_errors(self):
+        items = [
+            self.item(),
+            self.item(download_speed_mbps='fast'),
+            {'starlink_kit': self.kit.id},
+            self.item(created_at='2999-01-01T00:00:00Z'),
+            self.item(),
+        ]
+        response = self.post(items)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3])
+        self.assertIn('download_speed_mbps', response.data['errors'][0]['errors'])
+        self.assertIn('created_at', response.data['errors'][2]['errors'])
+
+    def test_other_users_kit(self):
+        response = self.post([self.item(self.foreign_kit), self.item(), self.item(starlink_kit=999999)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'], [
+            {'index': 0, 'errors': {'starlink_kit': ['Kit not found.']}},
+            {'index': 2, 'errors': {'starlink_kit': ['Kit not found.']}},
+        ])
+        self.assertFalse(SpeedTestResult.objects.filter(starlink_kit=self.foreign_kit).exists())
+
+        response = self.post([self.item(self.foreign_kit)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], 0)
+
+    @override_settings(SPEEDTEST_BULK_MAX_ITEMS=2)
+    def test_rejected_bodies(self):
+        self.assertEqual(self.post({'items': []}).status_code, 400)
+        self.assertEqual(self.post([self.item()] * 3).status_code, 400)
+        self.assertFalse(SpeedTestResult.objects.exists())
+
+
+# --- Retention ---
+
+class Rollback(Exception):
+    pass
+
+
+class RetentionTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.kit = StarlinkKit.objects.create(kit_id='KITO', assigned_user=User.objects.create_user('archivist'))
+        old_day = retention.utc_midnight(self.now) - datetime.timedelta(days=200)
+
+        def result(day, i):
+            # Whole numbers keep the rollup sums exact whichever order they are added in.
+            return SpeedTestResult(
+                starlink_kit=self.kit, download_speed_mbps=100 + i, upload_speed_mbps=10 + i, latency_ms=30 + i,
+                jitter_ms=1, created_at=day + datetime.timedelta(hours=i),
+            )
+
+        for d in range(3):
+            day = old_day + datetime.timedelta(days=d)
+            for i in range(2):
+                result(day, i).save()  # summarized as it arrives
+            # Loaded before the rollups existed: in the raw table only
+            SpeedTestResult.objects.bulk_create([result(day, i) for i in range(2, 5)])
+        for i in range(2):
+            result(retention.utc_midnight(self.now), i).save()
+
+    def summaries(self):
+        rollups = set(SpeedTestRollup.objects.values_list(
+            'starlink_kit', 'period', 'bucket_start', 'count', 'download_sum', 'upload_sum_sq', 'latency_sum',
+        ))
+        sketches = {
+            (kit_id, day): (count, *(DDSketch.from_bytes(blob).bins for blob in blobs))
+            for kit_id, day, count, *blobs in SpeedTestSketch.objects.values_list(
+                'starlink_kit', 'day', 'count', 'download', 'upload', 'latency',
+            )
+        }
+        return rollups, sketches
+
+    def rebuilt_summaries(self):
+        try:
+            with transaction.atomic():
+                rebuild_rollups()
+                rebuild_sketches()
+                expected = self.summaries()
+                raise Rollback
+        except Rollback:
+            return expected
+
+    def test_dry_run_and_delete(self):
+        config = {**retention.get_retention_config(), 'RAW_DAYS': 90, 'BATCH_SIZE': 2, 'BATCH_PAUSE': 0}
+        expected = self.rebuilt_summaries()
+        before = self.summaries()
+        self.assertNotEqual(before, expected)
+
+        stats = apply_retention(now=self.now, dry_run=True, config=config)
+        self.assertEqual((stats['days'], stats['deleted'], stats['downsampled_kit_days']), (3, 15, 3))
+        self.assertEqual(SpeedTestResult.objects.count(), 17)
+        self.assertEqual(self.summaries(), before)
+
+        stats = apply_retention(now=self.now, config=config)
+        self.assertEqual((stats['days'], stats['deleted'], stats['downsampled_kit_days']), (3, 15, 3))
+        self.assertEqual(SpeedTestResult.objects.count(), 2)
+        # Every expired result is still counted in the summaries, exactly as
+        # a rebuild from the raw rows would have counted it.
+        self.assertEqual(self.summaries(), expected)
+
+        stats = apply_retention(now=self.now, config=config)
+        self.assertEqual((stats['deleted'], stats['downsampled_kit_days']), (0, 0))
+        self.assertEqual(self.summaries(), expected)
+
+    def test_summary_horizons(self):
+        config = {**retention.get_retention_config(), 'RAW_DAYS': None, 'HOURLY_DAYS': 100, 'BATCH_SIZE': 2, 'BATCH_PAUSE': 0}
+        stats = apply_retention(now=self.now, config=config)
+        self.assertEqual(stats['hourly_rollups'], 6)
+        self.assertEqual(SpeedTestResult.objects.count(), 17)
+        self.assertEqual(SpeedTestRollup.objects.filter(period='hour').count(), 2)
+        self.assertEqual(SpeedTestRollup.objects.filter(period='day').count(), 4)
+
+
+# --- Kit Locations ---
+
+class GeohashTests(SimpleTestCase):
+
+    def test_encode_decode_round_trip(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        rng = random.Random(25)
+        for _ in range(200):
+            latitude, longitude = rng.uniform(-90, 90), rng.uniform(-180, 180)
+            for precision in (1, 5, geo.PRECISION):
+                south, west, north, east = geo.decode(geo.encode(latitude, longitude, precision))
+                self.assertTrue(south <= latitude <= north and west <= longitude <= east)
+                self.assertEqual((north - south, east - west), geo.cell_size(precision))
+                self.assertEqual(geo.encode((south + north) / 2, (west + east) / 2, precision), geo.encode(latitude, longitude, precision))
+
+    def test_migration_encoder_matches(self):
+        migration = importlib.import_module('tester.migrations.0013_starlinkkit_geohash')
+        rng = random.Random(13)
+        for _ in range(200):
+            latitude, longitude = rng.uniform(-90, 90), rng.uniform(-180, 180)
+            self.assertEqual(migration.encode(latitude, longitude), geo.encode(latitude, longitude))
+
+
+class KitLocationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('mapper')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def kit(self, name, latitude, longitude):
+        return StarlinkKit.objects.create(kit_id=name, nickname=name, assigned_user=self.user, latitude=latitude, longitude=longitude)
+
+    def get(self, action, **params):
+        return self.client.get(f'/api/kits/{action}/', params, HTTP_HOST='localhost')
+
+    def test_bbox_across_cell_boundaries(self):
+        # The box straddles the equator and the prime meridian, the edges
+        # of the four top-level cells s, k, e and 7.
+        inside = [self.kit(name, *point).id for name, point in
+                  [('NE', (0.5, 0.5)), ('NW', (0.5, -0.5)), ('SE', (-0.5, 0.5)), ('SW', (-0.5, -0.5))]]
+        self.kit('OUTSIDE', 2.0, 0.5)
+        self.kit('FAR', 40.0, 100.0)
+        StarlinkKit.objects.create(kit_id='NOWHERE', nickname='', assigned_user=self.user)
+        self.assertGreater(len({cell[0] for cell in geo.covering_cells(-1, -1, 1, 1)}), 1)
+
+        response = self.get('bbox', bbox='-1,-1,1,1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([kit['id'] for kit in response.data['results']], sorted(inside))
+        self.assertFalse(response.data['truncated'])
+
+        response = self.get('bbox', bbox='-1,-1,1,1', limit=2)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertTrue(response.data['truncated'])
+
+    def test_bbox_across_antimeridian(self):
+        east = self.kit('EAST', 0.0, 179.5)
+        west = self.kit('WEST', 0.0, -179.5)
+        self.kit('AWAY', 0.0, 178.0)
+        response = self.get('bbox', bbox='179,-1,-179,1')
+        self.assertEqual({kit['id'] for kit in response.data['results']}, {east.id, west.id})
+
+    def test_bbox_required(self):
+        self.assertEqual(self.get('bbox').status_code, 400)
+        self.assertEqual(self.get('bbox', bbox='1,2,3').status_code, 400)
+        self.assertEqual(self.get('bbox', bbox='-1,1,1,-1').status_code, 400)
+
+    def test_nearest_ordering(self):
+        rng = random.Random(7)
+        origin = (48.8566, 2.3522)
+        for i in range(40):
+            self.kit(f'K{i}', origin[0] + rng.uniform(-2, 2), origin[1] + rng.uniform(-2, 2))
+        # The closest kit sits just over the east edge of the point's cell,
+        # so the search cannot stop at the point's own cell.
+        _, _, _, edge = geo.decode(geo.encode(*origin, 8))
+        self.kit('CLOSEST', origin[0], edge + 1e-6)
+        self.assertNotEqual(geo.encode(origin[0], edge + 1e-6, 8), geo.encode(*origin, 8))
+        expected = sorted(
+            StarlinkKit.objects.values_list('kit_id', 'latitude', 'longitude'),
+            key=lambda kit: geo.haversine_km(*origin, kit[1], kit[2]),
+        )
+
+        response = self.get('nearest', lat=origin[0], lng=origin[1], n=5)
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([kit['kit_id'] for kit in results], [kit[0] for kit in expected[:5]])
+        self.assertEqual(results[0]['kit_id'], 'CLOSEST')
+        distances = [kit['distance_km'] for kit in results]
+        self.assertEqual(distances, sorted(distances))
+
+        response = self.get('nearest', lat=origin[0], lng=origin[1], n=100)
+        self.assertEqual([kit['kit_id'] for kit in response.data['results']], [kit[0] for kit in expected])
+        self.assertEqual(self.get('nearest', lat=origin[0]).status_code, 400)
+
+    def test_clusters(self):
+        for i in range(3):
+            self.kit(f'A{i}', 10.0 + i * 0.01, 10.0)
+        lone = self.kit('B', -30.0, 120.0)
+        response = self.get('clusters', zoom=4)
+        self.assertEqual(response.status_code, 200)
+        markers = {marker['geohash']: marker for marker in response.data['results']}
+        self.assertEqual(response.data['precision'], geo.ZOOM_PRECISION[4])
+        self.assertEqual(sorted(marker['count'] for marker in markers.values()), [1, 3])
+        self.assertEqual(markers[geo.encode(-30.0, 120.0, response.data['precision'])]['kit'], lone.id)
+
+
+# --- Time-Series Aggregation ---
+
+class AggregateTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('aggregator')
+        self.kits = [StarlinkKit.objects.create(kit_id=f'AGG{i}', assigned_user=self.user) for i in range(2)]
+        stranger = StarlinkKit.objects.create(kit_id='AGGX', assigned_user=User.objects.create_user('stranger'))
+        # A Monday, so the two days share one week bucket
+        monday = datetime.datetime(2026, 3, 2, tzinfo=datetime.timezone.utc)
+        rng = random.Random(15)
+        self.rows = []
+        for kit in self.kits:
+            for day in (0, 1):
+                for hour in (10, 11):
+                    for minute in range(0, 60, 10):
+                        self.rows.append(SpeedTestResult(
+                            starlink_kit=kit, download_speed_mbps=rng.uniform(50, 250), upload_speed_mbps=rng.uniform(5, 30),
+                            latency_ms=rng.uniform(20, 80), jitter_ms=rng.uniform(0, 10), isp_name='SpaceX Starlink',
+                            created_at=monday + datetime.timedelta(days=day, hours=hour, minutes=minute),
+                        ))
+        SpeedTestResult.objects.bulk_create(self.rows)
+        SpeedTestResult.objects.create(
+            starlink_kit=stranger, download_speed_mbps=1, upload_speed_mbps=1, latency_ms=1, jitter_ms=1,
+            created_at=monday + datetime.timedelta(hours=10),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected(self, truncate):
+        groups = {}
+        for row in self.rows:
+            groups.setdefault((row.starlink_kit_id, truncate(row.created_at)), []).append(row)
+        return groups
+
+    def test_buckets_match_python(self):
+        truncations = {
+            'hour': lambda t: t.replace(minute=0),
+            'day': lambda t: t.replace(hour=0, minute=0),
+            'week': lambda t: (t - datetime.timedelta(days=t.weekday())).replace(hour=0, minute=0),
+        }
+        for interval, truncate in truncations.items():
+            response = self.client.get('/api/results/aggregate/', {'interval': interval}, HTTP_HOST='localhost')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['interval'], interval)
+            groups = self.expected(truncate)
+            results = response.data['results']
+            self.assertEqual([(r['starlink_kit'], r['bucket']) for r in results], sorted(groups))
+            self.assertEqual({r['starlink_kit'] for r in results}, {kit.id for kit in self.kits})
+            for result in results:
+                rows = groups[(result['starlink_kit'], result['bucket'])]
+                self.assertEqual(result['count'], len(rows))
+                for name, field in aggregates.METRICS.items():
+                    values = sorted(getattr(row, field) for row in rows)
+                    expected = {
+                        'mean': statistics.fmean(values), 'min': values[0], 'max': values[-1],
+                        'p50': latency.percentile(values, 50), 'p95': latency.percentile(values, 95),
+                    }
+                    for stat, value in expected.items():
+                        self.assertAlmostEqual(result[name][stat], value, places=6, msg=(interval, name, stat))
+
+    def test_filters(self):
+        kit = self.kits[1]
+        response = self.client.get('/api/results/aggregate/', {
+            'interval': 'hour', 'starlink_kit': kit.id, 'since': '2026-03-03T00:00:00Z',
+        }, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(r['starlink_kit'], r['bucket'].hour, r['count']) for r in response.data['results']],
+            [(kit.id, 10, 6), (kit.id, 11, 6)],
+        )
+
+    def test_bad_interval(self):
+        response = self.client.get('/api/results/aggregate/', {'interval': 'month'}, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('interval', response.data['error'])
+
+    def test_percentile_cont_aggregate(self):
+        # Straight through the ORM, bypassing the view
+        values = sorted(row.latency_ms for row in self.rows if row.starlink_kit_id == self.kits[0].id)
+        result = SpeedTestResult.objects.filter(starlink_kit=self.kits[0]).aggregate(
+            p25=aggregates.PercentileCont('latency_ms', 0.25), p100=aggregates.PercentileCont('latency_ms', 1),
+        )
+        self.assertAlmostEqual(result['p25'], latency.percentile(values, 25))
+        self.assertEqual(result['p100'], values[-1])
+        empty = SpeedTestResult.objects.filter(starlink_kit__isnull=True).aggregate(p=aggregates.PercentileCont('latency_ms', 0.5))
+        self.assertIsNone(empty['p'])
+
+
+# --- Result Export ---
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('exporter')
+        self.kits = [StarlinkKit.objects.create(kit_id=f'EXP{i}', assigned_user=self.user) for i in range(2)]
+        other = StarlinkKit.objects.create(kit_id='EXPX', assigned_user=User.objects.create_user('other'))
+        start = datetime.datetime(2026, 5, 1, tzinfo=datetime.timezone.utc)
+        SpeedTestResult.objects.bulk_create([
+            SpeedTestResult(
+                starlink_kit=kit, download_speed_mbps=100 + i, upload_speed_mbps=10.5, latency_ms=30 + i / 4, jitter_ms=2,
+                isp_name='SpaceX, "Starlink"', is_starlink=True, client_ip='203.0.113.9' if i % 2 else None,
+                created_at=start + datetime.timedelta(days=i),
+            )
+            for kit in (*self.kits, other) for i in range(5)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected(self, queryset):
+        return [
+            {
+                'id': r.id, 'starlink_kit': r.starlink_kit_id, 'download_speed_mbps': r.download_speed_mbps,
+                'latency_ms': r.latency_ms, 'isp_name': r.isp_name, 'is_starlink': r.is_starlink,
+                'client_ip': r.client_ip, 'created_at': r.created_at.isoformat().replace('+00:00', 'Z'),
+            }
+            for r in queryset
+        ]
+
+    def export(self, **params):
+        response = self.client.get('/api/results/export/', params, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertNotIn('Content-Length', response)
+        body = b''.join(response.streaming_content)
+        response.close()
+        if params.get('gzip'):
+            self.assertEqual(response['Content-Type'], 'application/gzip')
+            self.assertTrue(response['Content-Disposition'].endswith('.gz"'))
+            body = gzip.decompress(body)
+        return response, body.decode()
+
+    def parse_csv(self, text):
+        reader = csv.reader(io.StringIO(text))
+        self.assertEqual(tuple(next(reader)), export.EXPORT_FIELDS)
+        rows = []
+        for line in reader:
+            row = dict(zip(export.EXPORT_FIELDS, line))
+            rows.append({
+                'id': int(row['id']), 'starlink_kit': int(row['starlink_kit']),
+                'download_speed_mbps': float(row['download_speed_mbps']), 'latency_ms': float(row['latency_ms']),
+                'isp_name': row['isp_name'], 'is_starlink': row['is_starlink'] == 'True',
+                'client_ip': row['client_ip'] or None, 'created_at': row['created_at'],
+            })
+        return rows
+
+    def parse_ndjson(self, text):
+        rows = [json.loads(line) for line in text.splitlines()]
+        for row in rows:
+            self.assertEqual(tuple(row), export.EXPORT_FIELDS)
+        return [{key: row[key] for key in ('id', 'starlink_kit', 'download_speed_mbps', 'latency_ms', 'isp_name', 'is_starlink', 'client_ip', 'created_at')} for row in rows]
+
+    def test_formats(self):
+        expected = self.expected(SpeedTestResult.objects.filter(starlink_kit__assigned_user=self.user).order_by('-created_at', '-id'))
+        self.assertEqual(len(expected), 10)
+        for compress in ('', '1'):
+            response, text = self.export(type='csv', gzip=compress)
+            self.assertEqual(self.parse_csv(text), expected)
+            if not compress:
+                self.assertEqual(response['Content-Type'], 'text/csv')
+            response, text = self.export(type='ndjson', gzip=compress)
+            self.assertEqual(self.parse_ndjson(text), expected)
+            if not compress:
+                self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+    def test_filters(self):
+        kit = self.kits[0]
+        _, text = self.export(type='ndjson', starlink_kit=kit.id, since='2026-05-02', until='2026-05-04T00:00:00Z')
+        expected = self.expected(SpeedTestResult.objects.filter(
+            starlink_kit=kit, created_at__gte=datetime.datetime(2026, 5, 2, tzinfo=datetime.timezone.utc),
+            created_at__lt=datetime.datetime(2026, 5, 4, tzinfo=datetime.timezone.utc),
+        ).order_by('-created_at', '-id'))
+        self.assertEqual(len(expected), 2)
+        self.assertEqual(self.parse_ndjson(text), expected)
+
+    def test_bad_type(self):
+        response = self.client.get('/api/results/export/', {'type': 'xml'}, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 400)
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'results.csv.gz')
+        call_command('export_results', output=path, gzip=True, kit_ids=[self.kits[1].id], since='2026-05-03', chunk_size=1, stdout=io.StringIO())
+        with gzip.open(path, 'rt') as f:
+            rows = self.parse_csv(f.read())
+        expected = SpeedTestResult.objects.filter(
+            starlink_kit=self.kits[1], created_at__gte=datetime.datetime(2026, 5, 3, tzinfo=datetime.timezone.utc),
+        ).order_by('created_at', 'id')
+        self.assertEqual(rows, self.expected(expected))
+
+        path = os.path.join(directory, 'results.ndjson')
+        call_command('export_results', output=path, export_format='ndjson', user='other', stdout=io.StringIO())
+        with open(path) as f:
+            rows = self.parse_ndjson(f.read())
+        self.assertEqual([row['id'] for row in rows], list(
+            SpeedTestResult.objects.filter(starlink_kit__assigned_user__username='other').order_by('created_at', 'id').values_list('id', flat=True)
+        ))
+        with self.assertRaises(CommandError):
+            call_command('export_results', output=path, since='yesterday', stdout=io.StringIO())
+
+
+# --- ISP Lookup Cache ---
+
+class FakeClock:
+    """
+    Stands in for the time module inside ispcache.py.
+    """
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+class ISPCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.clock = FakeClock()
+        clock_patch = mock.patch.object(ispcache, 'time', self.clock)
+        clock_patch.start()
+        self.addCleanup(clock_patch.stop)
+        self.fetched = []
+
+    def worker(self, **config):
+        return ispcache.ISPCache({**ispcache.DEFAULTS, **config})
+
+    def fetch(self, ip_address):
+        self.fetched.append(ip_address)
+        return {'status': 'success', 'isp': 'SpaceX Starlink', 'query': ip_address}
+
+    def fail(self, ip_address):
+        self.fetched.append(ip_address)
+        return {'status': 'error', 'isp': 'Unknown', 'query': ip_address}
+
+    def test_prefix_shares_entry(self):
+        isp_cache = self.worker()
+        self.assertEqual(isp_cache.get_or_fetch('203.0.113.5', self.fetch)['query'], '203.0.113.5')
+        # Same /24: served from the cache, answered for the caller's address
+        self.assertEqual(isp_cache.get_or_fetch('203.0.113.200', self.fetch)['query'], '203.0.113.200')
+        isp_cache.get_or_fetch('203.0.114.1', self.fetch)
+        isp_cache.get_or_fetch('2001:db8:1:2::1', self.fetch)
+        isp_cache.get_or_fetch('2001:db8:1:ffff::9', self.fetch)
+        self.assertEqual(self.fetched, ['203.0.113.5', '203.0.114.1', '2001:db8:1:2::1'])
+        # Not an address: passed straight through, uncached
+        isp_cache.get_or_fetch('not-an-ip', self.fetch)
+        isp_cache.get_or_fetch('not-an-ip', self.fetch)
+        self.assertEqual(self.fetched[-2:], ['not-an-ip', 'not-an-ip'])
+
+    def test_shared_tier_across_workers(self):
+        first, second = self.worker(), self.worker()
+        first.get_or_fetch('198.51.100.7', self.fetch)
+        second.get_or_fetch('198.51.100.8', self.fetch)
+        self.assertEqual(self.fetched, ['198.51.100.7'])
+        self.assertEqual(second.snapshot()['shared_hits'], 1)
+
+    def test_negative_ttl(self):
+        first, second = self.worker(NEGATIVE_TTL=60), self.worker(NEGATIVE_TTL=60)
+        self.assertEqual(first.get_or_fetch('192.0.2.1', self.fail)['status'], 'error')
+        self.clock.now += 50
+        second.get_or_fetch('192.0.2.2', self.fail)
+        self.assertEqual(len(self.fetched), 1)
+        # The second worker picked the entry up with 10s left and must not
+        # keep it for a fresh NEGATIVE_TTL of its own.
+        self.clock.now += 11
+        self.assertEqual(second.get_or_fetch('192.0.2.3', self.fetch)['status'], 'success')
+        self.assertEqual(first.get_or_fetch('192.0.2.4', self.fetch)['status'], 'success')
+        self.assertEqual(self.fetched, ['192.0.2.1', '192.0.2.3'])
+
+        # Successes live for TTL, not NEGATIVE_TTL
+        self.clock.now += 61
+        first.get_or_fetch('192.0.2.5', self.fetch)
+        self.assertEqual(len(self.fetched), 2)
+
+    def test_lru_eviction_and_stats(self):
+        isp_cache = self.worker(LRU_SIZE=2)
+        isp_cache.get_or_fetch('10.0.1.1', self.fetch)
+        isp_cache.get_or_fetch('10.0.2.1', self.fail)
+        isp_cache.get_or_fetch('10.0.1.2', self.fetch)  # local hit, now most recent
+        isp_cache.get_or_fetch('10.0.3.1', self.fetch)  # evicts 10.0.2.0/24
+        self.assertEqual(list(isp_cache.entries), ['10.0.1.0/24', '10.0.3.0/24'])
+        isp_cache.get_or_fetch('10.0.2.2', self.fail)  # back from the shared tier
+        isp_cache.get_or_fetch('10.0.2.3', self.fail)  # local again
+
+        stats = isp_cache.snapshot()
+        self.assertEqual(
+            {name: stats[name] for name in ('local_hits', 'shared_hits', 'misses', 'negative_hits', 'evictions', 'local_entries')},
+            {'local_hits': 2, 'shared_hits': 1, 'misses': 3, 'negative_hits': 2, 'evictions': 2, 'local_entries': 2},
+        )
+        self.assertEqual(stats['hit_ratio'], 3 / 6)
+        self.assertEqual(len(self.fetched), 3)
+
+
+# --- Re-enrichment Command ---
+
+class ReenrichCommandTests(TestCase):
+    answers = {
+        '198.51.100.1': {'status': 'success', 'isp': 'SpaceX Starlink', 'as': 'AS14593 Space Exploration Technologies'},
+        '198.51.100.2': {'status': 'success', 'isp': 'Example Telecom', 'as': 'AS64500 Example'},
+        '198.51.100.3': {'status': 'fail', 'message': 'reserved range'},
+        '198.51.100.4': {},  # timed out: transient
+    }
+
+    def setUp(self):
+        kit = StarlinkKit.objects.create(kit_id='REEN', assigned_user=User.objects.create_user('reenricher'))
+        ips = list(self.answers)
+        SpeedTestResult.objects.bulk_create([
+            SpeedTestResult(
+                starlink_kit=kit, download_speed_mbps=100, upload_speed_mbps=10, latency_ms=30, jitter_ms=1,
+                isp_name='stale', client_ip=ips[i % len(ips)], enrichment_status=SpeedTestResult.ENRICHMENT_PENDING,
+            )
+            for i in range(13)
+        ])
+        self.ids = list(SpeedTestResult.objects.order_by('pk').values_list('pk', flat=True))
+        self.lookups = []
+        lookup = mock.patch('tester.management.commands.reenrich_results.get_isp_info', side_effect=self.lookup)
+        lookup.start()
+        self.addCleanup(lookup.stop)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.checkpoint = os.path.join(directory, 'checkpoint')
+
+    def lookup(self, client_ip):
+        self.lookups.append(client_ip)
+        return dict(self.answers[client_ip])
+
+    def run_command(self, **options):
+        out = io.StringIO()
+        call_command('reenrich_results', stdout=out, **options)
+        return out.getvalue()
+
+    def rows(self):
+        return {
+            client_ip: set(SpeedTestResult.objects.filter(client_ip=client_ip).values_list('isp_name', 'is_starlink', 'enrichment_status'))
+            for client_ip in self.answers
+        }
+
+    def test_chunks_and_lookups(self):
+        output = self.run_command(chunk_size=5, checkpoint=self.checkpoint)
+        # 13 rows in chunks of 5: three progress lines, the last one ending on the last id
+        progress = [line for line in output.splitlines() if ' rows, ' in line]
+        self.assertEqual([line.split(' rows,')[0] for line in progress], ['5', '10', '13'])
+        self.assertTrue(progress[-1].endswith(f'last id {self.ids[-1]}'))
+        # One lookup per distinct address for the whole run; a transient
+        # failure isn't remembered, so it is tried again in each chunk
+        # (there are three) that holds the address.
+        self.assertEqual(sorted(self.lookups), ['198.51.100.1', '198.51.100.2', '198.51.100.3'] + ['198.51.100.4'] * 3)
+        self.assertEqual(self.rows(), {
+            '198.51.100.1': {('SpaceX Starlink', True, 'Complete')},
+            '198.51.100.2': {('Example Telecom', False, 'Complete')},
+            '198.51.100.3': {('', False, 'Failed')},
+            # The transient failure leaves its rows exactly as they were
+            '198.51.100.4': {('stale', False, 'Pending')},
+        })
+        with open(self.checkpoint) as f:
+            self.assertEqual(int(f.read()), self.ids[-1])
+
+    def test_resume(self):
+        with open(self.checkpoint, 'w') as f:
+            f.write(str(self.ids[7]))
+        self.run_command(chunk_size=5, checkpoint=self.checkpoint)
+        changed = SpeedTestResult.objects.exclude(isp_name='stale').values_list('pk', flat=True)
+        self.assertTrue(set(changed) <= set(self.ids[8:]))
+        self.assertEqual(SpeedTestResult.objects.filter(pk__lte=self.ids[7], isp_name='stale').count(), 8)
+
+        # --start-after wins over the checkpoint file
+        self.run_command(start_after=self.ids[2], checkpoint=self.checkpoint)
+        self.assertEqual(SpeedTestResult.objects.filter(pk__lte=self.ids[2], isp_name='stale').count(), 3)
+        self.assertEqual(SpeedTestResult.objects.filter(pk__gt=self.ids[2], isp_name='stale').exclude(client_ip='198.51.100.4').count(), 0)
+
+        with open(self.checkpoint, 'w') as f:
+            f.write('garbage')
+        with self.assertRaises(CommandError):
+            self.run_command(checkpoint=self.checkpoint)
+
+    def test_dry_run(self):
+        before = list(SpeedTestResult.objects.order_by('pk').values_list('isp_name', 'is_starlink', 'enrichment_status', 'updated_at'))
+        output = self.run_command(chunk_size=5, checkpoint=self.checkpoint, dry_run=True)
+        self.assertIn('Done: 13 rows checked, 10 would change', output)
+        after = list(SpeedTestResult.objects.order_by('pk').values_list('isp_name', 'is_starlink', 'enrichment_status', 'updated_at'))
+        self.assertEqual(after, before)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_pending_only(self):
+        self.run_command(chunk_size=5)
+        self.lookups.clear()
+        output = self.run_command(chunk_size=5, pending=True)
+        # Only the Failed and still Pending rows are read again
+        self.assertIn('Done: 6 rows checked', output)
+        self.assertEqual(sorted(self.lookups), ['198.51.100.3', '198.51.100.4', '198.51.100.4'])
+
+
+# --- Throughput Sampling ---
+
+class SteppingClock:
+    """
+    Monotonic clock that moves on by ``step`` seconds every time it is read.
+    """
+
+    def __init__(self, step):
+        self.now = 100.0
+        self.step = step
+
+    def monotonic(self):
+        self.now += self.step
+        return self.now
+
+
+class ThroughputTests(SimpleTestCase):
+
+    def setUp(self):
+        self.pool = payload.PayloadPool.from_random(1024 * 1024)
+
+    def test_timed_chunks_stop_at_deadline(self):
+        clock = SteppingClock(0.25)
+        with mock.patch.object(payload, 'time', clock):
+            deadline = clock.now + 1
+            chunks = list(self.pool.timed_chunks(deadline, 10 ** 12, lambda: 3 * payload.MIN_STREAM_CHUNK_BYTES))
+            # Checked before each group of blocks: three clock reads fall inside the deadline
+            self.assertEqual(len(chunks), 3 * 3)
+            self.assertGreaterEqual(clock.now, deadline)
+
+    def test_timed_chunks_stop_at_byte_cap(self):
+        cap = 5 * payload.MIN_STREAM_CHUNK_BYTES + 1000
+        chunks = list(self.pool.timed_chunks(time.monotonic() + 3600, cap, lambda: 2 * payload.MIN_STREAM_CHUNK_BYTES))
+        self.assertEqual(sum(map(len, chunks)), cap)
+        self.assertEqual(b''.join(chunks), b''.join(self.pool.chunks(0, cap)))
+
+    def test_timed_chunk_sizes(self):
+        # Odd sizes are rounded down to whole blocks, never below one
+        sizes = iter([1, payload.MIN_STREAM_CHUNK_BYTES * 3 + 5, payload.STREAM_CHUNK_BYTES, 10 ** 9])
+        chunks = list(self.pool.timed_chunks(time.monotonic() + 3600, 6 * payload.STREAM_CHUNK_BYTES, lambda: next(sizes, 1)))
+        blocks = {id(block) for block in self.pool.blocks(payload.MIN_STREAM_CHUNK_BYTES)}
+        self.assertEqual(sum(map(len, chunks)), 6 * payload.STREAM_CHUNK_BYTES)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), payload.STREAM_CHUNK_BYTES)
+            self.assertIn(id(chunk), blocks)
+
+    def test_adaptive_chunk_size_bounds(self):
+        sampler = ThroughputSampler(interval=0.1)
+        self.assertEqual(sampler.adaptive_chunk_size(), payload.MIN_STREAM_CHUNK_BYTES)
+        for mbps in (0.1, 5, 50, 200, 1000, 10000):
+            sampler = ThroughputSampler(interval=0.1)
+            per_bucket = int(mbps * 1e6 / 8 * 0.1)
+            for i in range(5):
+                sampler.record(per_bucket, now=i * 0.1)
+            size = sampler.adaptive_chunk_size()
+            self.assertGreaterEqual(size, payload.MIN_STREAM_CHUNK_BYTES, mbps)
+            self.assertLessEqual(size, payload.STREAM_CHUNK_BYTES, mbps)
+            if payload.MIN_STREAM_CHUNK_BYTES < per_bucket / 2 < payload.STREAM_CHUNK_BYTES:
+                # SPEEDTEST_CHUNK_SECONDS (0.05s) worth at the measured rate
+                self.assertAlmostEqual(size, per_bucket / 2, delta=1)
+
+    def test_steady_state_skips_ramp(self):
+        ramp = [1, 5, 20, 60, 100]
+        samples = ramp + [200] * 14 + [150]
+        # 25% warm-up (5 buckets) and 10% tail (2 buckets) are dropped
+        self.assertEqual(steady_state_mbps(samples), 200)
+        self.assertIsNone(steady_state_mbps([10, 20]))
+
+        sampler = ThroughputSampler(interval=0.1)
+        for i, mbps in enumerate(samples):
+            sampler.record(int(mbps * 1e6 / 8 * 0.1), now=i * 0.1)
+        self.assertAlmostEqual(sampler.steady_state_mbps(), 200)
+        self.assertLess(sampler.summary()['calculated_mbps'], 200)
+
+    def test_recommend_streams(self):
+        with override_settings(SPEEDTEST_MAX_STREAMS=8):
+            # Still climbing in the last third: parallelism is the bottleneck
+            climbing = [10 * i for i in range(1, 20)]
+            self.assertEqual(recommend_streams(climbing, 2), 4)
+            self.assertEqual(recommend_streams(climbing, 6), 8)
+            # Ramped up, then flat: already at steady state
+            flat = [5, 50, 100] + [100] * 15
+            self.assertEqual(recommend_streams(flat, 2), 2)
+            # Too short to tell (the final, partial bucket doesn't count)
+            self.assertEqual(recommend_streams([10, 50, 100], 2), 2)
+
+
+class DurationDownloadTests(PayloadFileTestCase):
+
+    def test_byte_cap(self):
+        cap = 3 * payload.MIN_STREAM_CHUNK_BYTES + 10
+        with override_settings(SPEEDTEST_MAX_DURATION_BYTES=cap):
+            response = self.client.get('/api/download/', {'duration': 10, 'stream_id': 'timed-cap'}, HTTP_HOST='localhost')
+            self.assertNotIn('Content-Length', response)
+            body = b''.join(response.streaming_content)
+            response.close()
+        self.assertEqual(len(body), cap)
+        stats = get_stream_stats('timed-cap', '127.0.0.1')
+        self.assertEqual(stats['sent_bytes'], cap)
+        self.assertTrue(stats['completed'])
+
+    def test_deadline(self):
+        with override_settings(SPEEDTEST_MAX_DURATION_SECONDS=0.2):
+            started = time.monotonic()
+            # Asks for a minute; the server caps it at 0.2s
+            response = self.client.get('/api/download/', {'duration': 60}, HTTP_HOST='localhost')
+            total = 0
+            for chunk in response.streaming_content:
+                total += len(chunk)
+                time.sleep(0.01)
+            response.close()
+        self.assertGreater(total, 0)
+        self.assertLess(time.monotonic() - started, 5)
+
+
+# --- Loaded Latency ---
+
+class LoadedLatencyTests(TestCase):
+    windows = [
+        {'direction': 'download', 'start': 10.0, 'end': 20.0, 'bytes': 50 * 10 ** 6},
+        {'direction': 'download', 'start': 11.0, 'end': 21.0, 'bytes': 50 * 10 ** 6},
+        {'direction': 'upload', 'start': 30.0, 'end': 40.0, 'bytes': 10 ** 7},
+    ]
+
+    def setUp(self):
+        cache.clear()
+        # Idle RTTs around 30ms, download ~ 100ms, upload ~ 300ms: a wrong
+        # attribution shows up in every percentile.
+        self.samples = (
+            [(1.0 + i / 2, 30.0 + i) for i in range(10)]
+            + [(10.0 + i, 100.0 + 3 * i) for i in range(11)]
+            + [(20.5, None)]  # lost while downloading
+            + [(25.0, 31.0)]  # between the phases: idle again
+            + [(30.0 + i, 300.0 + 7 * i) for i in range(11)]
+        )
+
+    def rtts(self, first, last):
+        return sorted(rtt for sent_at, rtt in self.samples if first <= sent_at <= last and rtt is not None)
+
+    def test_split_by_load(self):
+        phases = split_by_load(self.samples, self.windows)
+        self.assertEqual({phase: stats['sent'] for phase, stats in phases.items()}, {'idle': 11, 'download': 12, 'upload': 11})
+        self.assertEqual(phases['download']['received'], 11)
+        expected = {
+            'idle': self.rtts(0, 9.9) + self.rtts(25, 25),
+            'download': self.rtts(10, 21),
+            'upload': self.rtts(30, 40),
+        }
+        for phase, rtts in expected.items():
+            rtts.sort()
+            self.assertEqual(phases[phase]['p50_ms'], latency.percentile(rtts, 50), phase)
+            self.assertEqual(phases[phase]['p95_ms'], latency.percentile(rtts, 95), phase)
+        # Both download streams together: 100 MB over 11 seconds
+        self.assertAlmostEqual(phases['download']['throughput_mbps'], 800 / 11)
+        self.assertAlmostEqual(phases['upload']['throughput_mbps'], 8)
+        self.assertNotIn('throughput_mbps', phases['idle'])
+
+    def test_result_saved_with_loaded_fields(self):
+        user = User.objects.create_user('bloat')
+        kit = StarlinkKit.objects.create(kit_id='BLOAT', assigned_user=user)
+        phases = split_by_load(self.samples, self.windows)
+        latency.store_probe_summary('bloat-1', {'type': 'summary', 'phases': phases})
+
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/results/', {
+            'starlink_kit': kit.id, 'download_speed_mbps': 70, 'upload_speed_mbps': 8, 'latency_ms': 35,
+            'jitter_ms': 1, 'test_id': 'bloat-1',
+        }, format='json', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 201, response.data)
+        result = SpeedTestResult.objects.get(pk=response.data['id'])
+        for phase in latency.LOAD_PHASES:
+            self.assertEqual(getattr(result, f'{phase}_latency_p50_ms'), phases[phase]['p50_ms'], phase)
+            self.assertEqual(getattr(result, f'{phase}_latency_p95_ms'), phases[phase]['p95_ms'], phase)
+        self.assertTrue(100 <= result.download_latency_p50_ms <= 130)
+        self.assertTrue(300 <= result.upload_latency_p50_ms <= 370)
+
+        # No probe under that test_id: the loaded fields stay empty
+        response = client.post('/api/results/', {
+            'starlink_kit': kit.id, 'download_speed_mbps': 70, 'upload_speed_mbps': 8, 'latency_ms': 35,
+            'jitter_ms': 1, 'test_id': 'no-probe',
+        }, format='json', HTTP_HOST='localhost')
+        result = SpeedTestResult.objects.get(pk=response.data['id'])
+        self.assertIsNone(result.download_latency_p50_ms)
+        self.assertIsNone(result.upload_latency_p95_ms)
+
+
+# --- Asynchronous ISP Enrichment ---
+
+class SyncEnrichmentBackend:
+    """
+    Runs each submitted batch straight away and keeps the retries for the
+    test to hand back, in place of the thread pool's timers.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.retries = []
+
+    def submit(self, result_ids, attempt=0):
+        retry = enrich_results(result_ids, final=attempt >= self.config['MAX_RETRIES'])
+        if retry:
+            self.retries.append((retry, attempt + 1))
+
+
+@override_settings(ISP_REMOTE_LOOKUP=True, ISP_ENRICHMENT={'BACKEND': 'tester.tests.SyncEnrichmentBackend', 'MAX_RETRIES': 2})
+class EnrichmentTests(TestCase):
+
+    def setUp(self):
+        enrichment._backend = None
+        self.addCleanup(setattr, enrichment, '_backend', None)
+        self.user = User.objects.create_user('enricher')
+        self.kit = StarlinkKit.objects.create(kit_id='ENR', assigned_user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.answers = []
+        self.lookups = []
+        lookup = mock.patch('tester.enrichment.get_isp_info', side_effect=self.lookup)
+        lookup.start()
+        self.addCleanup(lookup.stop)
+
+    def lookup(self, client_ip):
+        self.lookups.append(client_ip)
+        if isinstance(self.answers, dict):
+            return dict(self.answers[client_ip])
+        return self.answers.pop(0)
+
+    def post(self, client_ip='203.0.113.50'):
+        response = self.client.post('/api/results/', {
+            'starlink_kit': self.kit.id, 'download_speed_mbps': 120, 'upload_speed_mbps': 12, 'latency_ms': 40, 'jitter_ms': 3,
+        }, format='json', HTTP_HOST='localhost', REMOTE_ADDR=client_ip)
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def state(self, pk):
+        return SpeedTestResult.objects.values_list('isp_name', 'is_starlink', 'enrichment_status').get(pk=pk)
+
+    def test_resolved_after_commit(self):
+        self.answers = [{'status': 'success', 'isp': 'SpaceX Starlink', 'as': 'AS14593 Space Exploration Technologies'}]
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            pk = self.post()
+        # Saved straight away; nothing is looked up until the commit
+        self.assertEqual(self.state(pk), ('', False, 'Pending'))
+        self.assertEqual((len(callbacks), self.lookups), (1, []))
+        callbacks[0]()
+        self.assertEqual(self.state(pk), ('SpaceX Starlink', True, 'Complete'))
+        self.assertEqual(self.lookups, ['203.0.113.50'])
+
+    def test_transient_failure_is_retried(self):
+        self.answers = [{}, {'status': 'success', 'isp': 'Example Telecom'}]
+        with self.captureOnCommitCallbacks(execute=True):
+            pk = self.post()
+        self.assertEqual(self.state(pk), ('', False, 'Pending'))
+        backend = enrichment.get_enrichment_backend()
+        self.assertEqual(backend.retries, [([pk], 1)])
+        backend.submit(*backend.retries.pop())
+        self.assertEqual(self.state(pk), ('Example Telecom', False, 'Complete'))
+        self.assertEqual(backend.retries, [])
+
+    def test_failed_after_last_retry(self):
+        self.answers = [{}, {}, {}]
+        with self.captureOnCommitCallbacks(execute=True):
+            pk = self.post()
+        backend = enrichment.get_enrichment_backend()
+        while backend.retries:
+            self.assertEqual(self.state(pk)[2], 'Pending')
+            backend.submit(*backend.retries.pop())
+        # Attempts 0, 1 and 2 (MAX_RETRIES): the last one gives up
+        self.assertEqual(len(self.lookups), 3)
+        self.assertEqual(self.state(pk), ('', False, 'Failed'))
+
+    def test_definitive_failure(self):
+        self.answers = [{'status': 'fail', 'message': 'private range'}]
+        with self.captureOnCommitCallbacks(execute=True):
+            pk = self.post()
+        self.assertEqual(self.state(pk)[2], 'Failed')
+        self.assertEqual(enrichment.get_enrichment_backend().retries, [])
+
+    def test_one_lookup_per_address(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            pks = [self.post('198.51.100.1'), self.post('198.51.100.1'), self.post('198.51.100.2')]
+        self.answers = {'198.51.100.1': {'status': 'success', 'isp': 'A'}, '198.51.100.2': {'status': 'success', 'isp': 'B'}}
+        self.assertEqual(enrich_results(pks), [])
+        self.assertEqual(sorted(self.lookups), ['198.51.100.1', '198.51.100.2'])
+        self.assertEqual([self.state(pk)[0] for pk in pks], ['A', 'A', 'B'])
+        # Already enriched rows are skipped
+        self.assertEqual(enrich_results(pks), [])
+        self.assertEqual(len(self.lookups), 2)
+
+    def test_celery_task_retries(self):
+        self.answers = [{}, {}, {'status': 'success', 'isp': 'SpaceX Starlink'}]
+        with self.captureOnCommitCallbacks(execute=False):
+            pk = self.post()
+        with override_settings(ISP_ENRICHMENT={'RETRY_DELAY': 0, 'MAX_RETRIES': 2}):
+            tasks.enrich_results_task.apply(args=[[pk]])
+        self.assertEqual(len(self.lookups), 3)
+        self.assertEqual(self.state(pk), ('SpaceX Starlink', True, 'Complete'))
+
+    def test_backend_down_leaves_pending(self):
+        with mock.patch.object(SyncEnrichmentBackend, 'submit', side_effect=ConnectionError('broker down')):
+            with self.assertLogs('tester.enrichment', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                pk = self.post()
+        self.assertEqual(self.state(pk)[2], 'Pending')
@@ -0,0 +1,275 @@
+import math
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .payload import MIN_STREAM_CHUNK_BYTES, STREAM_CHUNK_BYTES
+
+# --- Server-side Throughput Sampling ---
+#
+# A single bytes/duration average hides TCP slow-start and the wait for the
+# first byte, which on slowly ramping Starlink links underreports the real
+# capacity. ThroughputSampler buckets bytes into fixed intervals on the
+# monotonic clock so we can return the whole curve plus a steady-state rate.
+
+STREAM_ID_RE = re.compile(r'^[\w-]{1,64}$')
+STREAM_STATS_KEY = 'speedtest:stream:{}'
+LOAD_WINDOW_COUNT_KEY = 'speedtest:load:{}:n'
+LOAD_WINDOW_KEY = 'speedtest:load:{}:{}'
+
+
+def steady_state_mbps(samples):
+    """
+    Mean of a throughput curve once warm-up and tail buckets are discarded,
+    or None if nothing is left. The final bucket is always partial, so at
+    least one tail bucket is always dropped.
+    """
+    warmup = getattr(settings, 'SPEEDTEST_WARMUP_FRACTION', 0.25)
+    tail = getattr(settings, 'SPEEDTEST_TAIL_FRACTION', 0.1)
+    head = max(1, math.ceil(len(samples) * warmup))
+    end = len(samples) - max(1, math.ceil(len(samples) * tail))
+    steady = samples[head:end]
+    if not steady:
+        return None
+    return sum(steady) / len(steady)
+
+
+class ThroughputSampler:
+    """
+    Records bytes transferred per fixed interval, anchored at the first byte.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or getattr(settings, 'SPEEDTEST_SAMPLE_INTERVAL_SECONDS', 0.1)
+        self.started_at = time.monotonic()
+        # Converts monotonic readings to wall-clock time for cross-worker correlation.
+        self.wall_offset = time.time() - self.started_at
+        self.first_byte_at = None
+        self.last_byte_at = None
+        self.total_bytes = 0
+        self.buckets = []
+
+    def record(self, nbytes, now=None):
+        if not nbytes:
+            return
+        if now is None:
+            now = time.monotonic()
+        if self.first_byte_at is None:
+            self.first_byte_at = now
+        index = int((now - self.first_byte_at) / self.interval)
+        if index >= len(self.buckets):
+            self.buckets.extend([0] * (index + 1 - len(self.buckets)))
+        self.buckets[index] += nbytes
+        self.total_bytes += nbytes
+        self.last_byte_at = now
+
+    def current_bps(self):
+        """
+        Rate over the last complete bucket, or since the first byte while
+        the first bucket is still filling.
+        """
+        if len(self.buckets) >= 2:
+            return (self.buckets[-2] * 8) / self.interval
+        if self.first_byte_at is None or self.last_byte_at == self.first_byte_at:
+            return None
+        return (self.total_bytes * 8) / (self.last_byte_at - self.first_byte_at)
+
+    def adaptive_chunk_size(self):
+        """
+        Chunk size worth SPEEDTEST_CHUNK_SECONDS at the current rate, so
+        chunks grow with the ramp and a deadline is never overshot by much.
+        """
+        rate = self.current_bps()
+        if rate is None:
+            return MIN_STREAM_CHUNK_BYTES
+        target = int(rate / 8 * getattr(settings, 'SPEEDTEST_CHUNK_SECONDS', 0.05))
+        return max(MIN_STREAM_CHUNK_BYTES, min(target, STREAM_CHUNK_BYTES))
+
+    def samples_mbps(self):
+        return [(b * 8) / (self.interval * 1000000) for b in self.buckets]
+
+    def steady_state_mbps(self):
+        """
+        Mean rate once warm-up and tail buckets are discarded.
+
+        Falls back to the first-byte-to-last-byte average when the transfer
+        is too short to have a steady state.
+        """
+        steady = steady_state_mbps(self.samples_mbps())
+        if steady is not None:
+            return steady
+        if self.first_byte_at is None or self.last_byte_at == self.first_byte_at:
+            return None
+        return (self.total_bytes * 8) / ((self.last_byte_at - self.first_byte_at) * 1000000)
+
+    def summary(self):
+        end = self.last_byte_at or time.monotonic()
+        duration = end - self.started_at
+        if duration == 0: duration = 0.0001
+        first_byte = self.first_byte_at - self.started_at if self.first_byte_at is not None else None
+        return {
+            "duration_seconds": duration,
+            "calculated_mbps": (self.total_bytes * 8) / (duration * 1000000),
+            "first_byte_seconds": first_byte,
+            "interval_ms": self.interval * 1000,
+            "samples_mbps": self.samples_mbps(),
+            "steady_state_mbps": self.steady_state_mbps(),
+        }
+
+
+def sample_stream(chunks, sampler, on_complete=None):
+    """
+    Wrap a response iterator so every chunk is recorded once the server has
+    taken it. ``on_complete(sampler, completed)`` runs when the stream ends,
+    including when the client disconnects part way through.
+    """
+    completed = False
+    try:
+        for chunk in chunks:
+            yield chunk
+            sampler.record(len(chunk))
+        completed = True
+    finally:
+        if on_complete is not None:
+            on_complete(sampler, completed)
+
+
+def store_stream_stats(stream_id, client_ip):
+    """
+    Completion callback that caches a download stream's summary under its
+    client-supplied ``stream_id`` for DownloadStatsView to return. The id
+    is the client's choice, so the stats are kept with the address that
+    ran the stream and only handed back to it (see get_stream_stats).
+    """
+    def on_complete(sampler, completed):
+        stats = {"stream_id": stream_id, "sent_bytes": sampler.total_bytes, "completed": completed}
+        stats.update(sampler.summary())
+        timeout = getattr(settings, 'SPEEDTEST_STREAM_STATS_TTL', 300)
+        cache.set(STREAM_STATS_KEY.format(stream_id), (client_ip, stats), timeout)
+    return on_complete
+
+
+def record_load_window(test_id, direction, sampler):
+    """
+    Remember when a download/upload stream of ``test_id`` was loading the
+    link, so a concurrent latency probe can attribute its samples to it.
+    Each stream gets its own key; the counter is the only shared write.
+    """
+    timeout = getattr(settings, 'SPEEDTEST_STREAM_STATS_TTL', 300)
+    count_key = LOAD_WINDOW_COUNT_KEY.format(test_id)
+    cache.add(count_key, 0, timeout)
+    index = cache.incr(count_key)
+    end = sampler.last_byte_at or time.monotonic()
+    first_byte = sampler.first_byte_at + sampler.wall_offset if sampler.first_byte_at is not None else None
+    cache.set(LOAD_WINDOW_KEY.format(test_id, index), {
+        "direction": direction,
+        "start": sampler.started_at + sampler.wall_offset,
+        "end": end + sampler.wall_offset,
+        "bytes": sampler.total_bytes,
+        "first_byte": first_byte,
+        "interval": sampler.interval,
+        "buckets": sampler.buckets,
+    }, timeout)
+
+
+def get_load_windows(test_id):
+    count = cache.get(LOAD_WINDOW_COUNT_KEY.format(test_id)) or 0
+    keys = [LOAD_WINDOW_KEY.format(test_id, i) for i in range(1, count + 1)]
+    return list(cache.get_many(keys).values())
+
+
+def recommend_streams(samples, streams):
+    """
+    Suggest a stream count for the next run from a throughput curve.
+
+    If the last third of the curve is still clearly above the middle third
+    the link never reached steady state, which on high-latency links like
+    Starlink usually means per-stream TCP windows are the bottleneck, so
+    we double the parallelism (up to SPEEDTEST_MAX_STREAMS).
+    """
+    samples = samples[:-1]  # final bucket is partial
+    if len(samples) < 3:
+        return streams
+    third = len(samples) // 3
+    middle = samples[third:2 * third]
+    late = samples[2 * third:]
+    if sum(late) / len(late) > 1.1 * sum(middle) / len(middle):
+        return min(streams * 2, getattr(settings, 'SPEEDTEST_MAX_STREAMS', 8))
+    return streams
+
+
+def aggregate_windows(windows):
+    """
+    Combine the load windows of parallel streams into one throughput result.
+
+    Per-stream buckets are aligned on wall-clock time and summed, so the
+    curve and steady-state rate describe the link rather than one stream.
+    """
+    if not windows:
+        return None
+    interval = windows[0]['interval']
+    started = [w['first_byte'] for w in windows if w['first_byte'] is not None]
+    combined = []
+    if started:
+        origin = min(started)
+        for window in windows:
+            if window['first_byte'] is None:
+                continue
+            offset = int(round((window['first_byte'] - origin) / interval))
+            needed = offset + len(window['buckets'])
+            if needed > len(combined):
+                combined.extend([0] * (needed - len(combined)))
+            for i, nbytes in enumerate(window['buckets']):
+                combined[offset + i] += nbytes
+
+    total = sum(w['bytes'] for w in windows)
+    duration = max(w['end'] for w in windows) - min(w['start'] for w in windows)
+    if duration <= 0: duration = 0.0001
+    samples = [(b * 8) / (interval * 1000000) for b in combined]
+    return {
+        "streams": len(windows),
+        "recommended_streams": recommend_streams(samples, len(windows)),
+        "bytes": total,
+        "duration_seconds": duration,
+        "calculated_mbps": (total * 8) / (duration * 1000000),
+        "interval_ms": interval * 1000,
+        "samples_mbps": samples,
+        "steady_state_mbps": steady_state_mbps(samples),
+    }
+
+
+def download_complete_callback(stream_id=None, test_id=None, client_ip=None):
+    """
+    Per-stream completion callback for DownloadTestView, or None when the
+    client asked for neither stream stats nor loaded-latency correlation.
+    """
+    callbacks = []
+    if is_valid_stream_id(stream_id):
+        callbacks.append(store_stream_stats(stream_id, client_ip))
+    if is_valid_stream_id(test_id):
+        callbacks.append(lambda sampler, completed: record_load_window(test_id, 'download', sampler))
+    if not callbacks:
+        return None
+
+    def on_complete(sampler, completed):
+        for callback in callbacks:
+            callback(sampler, completed)
+    return on_complete
+
+
+def get_stream_stats(stream_id, client_ip):
+    """
+    The stats stored for ``stream_id``, or None if there are none or they
+    belong to a stream run from another address.
+    """
+    stored = cache.get(STREAM_STATS_KEY.format(stream_id))
+    # Entries cached before stats were bound to an address are plain dicts.
+    if not isinstance(stored, tuple) or stored[0] != client_ip:
+        return None
+    return stored[1]
+
+
+def is_valid_stream_id(stream_id):
+    return bool(stream_id) and STREAM_ID_RE.match(stream_id) is not None
@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    PingView, DownloadTestView, UploadTestView, NetworkInfoView, RegisterView,
+    PingView, DownloadTestView, DownloadStatsView, UploadTestView, NetworkInfoView, RegisterView,
     StarlinkKitViewSet, SpeedTestResultViewSet, TicketViewSet, ActivationRequestViewSet,
-    AdminUserViewSet, ChangePasswordView, UserInfoView
+    AdminUserViewSet, ChangePasswordView, UserInfoView, SpeedTestSessionView, SpeedTestSessionDetailView,
+    SpeedTestSessionFinalizeView, ISPCacheStatsView, ListCacheStatsView
 )
 
 router = DefaultRouter()
@@ -17,8 +18,14 @@ urlpatterns = [
     path('', include(router.urls)),
     path('ping/', PingView.as_view(), name='ping'),
     path('download/', DownloadTestView.as_view(), name='download'),
+    path('download/stats/', DownloadStatsView.as_view(), name='download-stats'),
     path('upload/', UploadTestView.as_view(), name='upload'),
+    path('sessions/', SpeedTestSessionView.as_view(), name='session'),
+    path('sessions/<str:session_id>/', SpeedTestSessionDetailView.as_view(), name='session-detail'),
+    path('sessions/<str:session_id>/finalize/', SpeedTestSessionFinalizeView.as_view(), name='session-finalize'),
     path('network-info/', NetworkInfoView.as_view(), name='network-info'),
+    path('isp-cache/stats/', ISPCacheStatsView.as_view(), name='isp-cache-stats'),
+    path('list-cache/stats/', ListCacheStatsView.as_view(), name='list-cache-stats'),
     path('register/', RegisterView.as_view(), name='register'),
     path('me/', UserInfoView.as_view(), name='me'),
     path('change-password/', ChangePasswordView.as_view(), name='change-password'),
@@ -0,0 +1,192 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import checks
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .models import SpeedTestResult, StarlinkKit
+from .rollups import is_cascade
+
+# --- List Versions ---
+#
+# A version token per user, bumped whenever one of the user's kits or
+# results changes, plus one for the fleet-wide kit list staff see. List
+# endpoints derive ETag/Last-Modified from the token, so a poll that finds
+# nothing changed is a cache read and a 304, with no query or serializer.
+#
+# Tokens are time.time_ns() of the last change and live in the cache named
+# by LIST_VERSIONS['CACHE_ALIAS']. Every process that writes kits/results
+# or serves their lists (web workers, the enrichment worker) must see the
+# same tokens, or a bump in one leaves the others answering 304 with stale
+# data. So versions are off over a process-local cache (locmem, dummy)
+# unless LIST_VERSIONS['ENABLED'] forces them on, which the tester.W001
+# check flags. A token that expires (TTL) or is evicted is simply
+# re-created, which only costs clients one full response. Bumps run on
+# commit: bumping before the data is visible could tag old data with the
+# new token.
+
+DEFAULTS = {
+    'ENABLED': None,  # None: on when the cache is shared between processes
+    'CACHE_ALIAS': 'default',
+    'TTL': 24 * 60 * 60,
+}
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+CACHE_KEY = 'listver:{}'
+FLEET_KITS = 'kits'
+
+
+def is_shared_cache(alias):
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def get_versions_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'LIST_VERSIONS', {}))
+    if config['ENABLED'] is None:
+        config['ENABLED'] = is_shared_cache(config['CACHE_ALIAS'])
+    return config
+
+
+@checks.register(checks.Tags.caches)
+def check_versions_cache(app_configs, **kwargs):
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'LIST_VERSIONS', {}))
+    if config['ENABLED'] and not is_shared_cache(config['CACHE_ALIAS']):
+        return [checks.Warning(
+            f"LIST_VERSIONS is enabled over the process-local cache '{config['CACHE_ALIAS']}'.",
+            hint='List versions bumped in one process are invisible to the others; use a shared cache such as Redis.',
+            id='tester.W001',
+        )]
+    return []
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def get_version(scope, config=None):
+    config = config or get_versions_config()
+    cache = caches[config['CACHE_ALIAS']]
+    key = CACHE_KEY.format(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), config['TTL'])
+        version = cache.get(key)
+    return version
+
+
+def bump_versions(scopes):
+    config = get_versions_config()
+    scopes = {scope for scope in scopes if scope is not None}
+    if not scopes or not config['ENABLED']:
+        return
+    version = time.time_ns()
+
+    def bump():
+        caches[config['CACHE_ALIAS']].set_many({CACHE_KEY.format(scope): version for scope in scopes}, config['TTL'])
+
+    transaction.on_commit(bump)
+
+
+def bump_kit_owners(kit_ids):
+    """
+    Mark the result lists of the owners of ``kit_ids`` as changed, for
+    writes that bypass model signals (bulk_create, queryset.update).
+    """
+    kit_ids = {kit_id for kit_id in kit_ids if kit_id is not None}
+    if not kit_ids or not get_versions_config()['ENABLED']:
+        return
+    owners = StarlinkKit.objects.filter(pk__in=kit_ids).values_list('assigned_user_id', flat=True).distinct()
+    bump_versions(user_scope(owner) for owner in owners)
+
+
+@receiver(pre_save, sender=StarlinkKit)
+def remember_kit_owner(sender, instance, raw, **kwargs):
+    # A reassigned kit leaves the previous owner's list too.
+    instance._previous_owner_id = None
+    if not raw and instance.pk and not instance._state.adding:
+        instance._previous_owner_id = StarlinkKit.objects.filter(pk=instance.pk).values_list('assigned_user_id', flat=True).first()
+
+
+@receiver(post_save, sender=StarlinkKit)
+@receiver(post_delete, sender=StarlinkKit)
+def kit_changed(sender, instance, **kwargs):
+    scopes = [FLEET_KITS, user_scope(instance.assigned_user_id)]
+    previous_owner_id = getattr(instance, '_previous_owner_id', None)
+    if previous_owner_id is not None:
+        scopes.append(user_scope(previous_owner_id))
+    bump_versions(scopes)
+
+
+@receiver(post_save, sender=SpeedTestResult)
+@receiver(post_delete, sender=SpeedTestResult)
+def result_changed(sender, instance, origin=None, **kwargs):
+    # A cascade from a kit delete is covered by kit_changed.
+    if not is_cascade(origin):
+        bump_kit_owners([instance.starlink_kit_id])
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Kit lists show the owner's email; logging in only touches last_login.
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    bump_versions([FLEET_KITS, user_scope(instance.pk)])
+
+
+class ConditionalListMixin:
+    """
+    Conditional GET for a viewset's list action. Views name the version
+    scope their list depends on with get_list_version_scope(); when the
+    request's If-None-Match/If-Modified-Since still match, the response is
+    a 304 produced before the queryset is touched. With list versions off,
+    lists are plain uncached responses.
+    """
+
+    def get_list_version_scope(self):
+        return user_scope(self.request.user.pk)
+
+    def get_list_version(self):
+        # Read once per request, before querying: a change landing in
+        # between then yields a newer body under the older token, which the
+        # next poll replaces.
+        if getattr(self, '_list_version', None) is None:
+            self._list_version = get_version(self.get_list_version_scope())
+        return self._list_version
+
+    def build_list_response(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if not get_versions_config()['ENABLED']:
+            return self.build_list_response(request, *args, **kwargs)
+        version = self.get_list_version()
+        tag = f'{version}|{request.user.pk}|{request.get_full_path()}|{request.META.get("HTTP_ACCEPT", "")}'
+        etag = f'"{hashlib.md5(tag.encode()).hexdigest()}"'
+        # Last-Modified has one-second resolution, so it is only sent once
+        # the second of the last change is over; otherwise a second change
+        # within that second would look unmodified to If-Modified-Since.
+        changed_at = version // 1_000_000_000
+        last_modified = changed_at if changed_at < int(time.time()) else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.build_list_response(request, *args, **kwargs)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
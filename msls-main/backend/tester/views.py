@@ -1,19 +1,42 @@
-import os
+import json
 import time
-import requests
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.parsers import BaseParser
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import BaseParser, JSONParser
 from django.contrib.auth.models import User
-from .models import SpeedTestResult, StarlinkKit, Ticket, ActivationRequest, UserProfile
+from .models import SpeedTestResult, SpeedTestRollup, SpeedTestSketch, StarlinkKit, Ticket, ActivationRequest, UserProfile
 from .serializers import (
-    SpeedTestResultSerializer, StarlinkKitSerializer, NetworkInfoSerializer, 
-    TicketSerializer, ActivationRequestSerializer, UserSerializer, UserCreateSerializer
+    SpeedTestResultSerializer, SpeedTestResultBulkItemSerializer, StarlinkKitSerializer, NetworkInfoSerializer, 
+    TicketSerializer, ActivationRequestSerializer, UserSerializer, UserCreateSerializer, ValuesListSerializer
 )
 from .permissions import IsKitOwner
+from .pagination import KeysetPagination, filter_time_window, parse_time_bound
+from .aggregates import BUCKETS, aggregate_results
+from .rollups import apply_results, rollup_series
+from .sketches import RELATIVE_ACCURACY, merged_quantiles
+from .isp import classify_isp, get_isp_info
+from .ispcache import get_isp_cache
+from .enrichment import schedule_enrichment
+from .export import FORMATS as EXPORT_FORMATS, stream_export
+from .geo import clusters, in_bbox, nearest, parse_bbox
+from .versions import FLEET_KITS, bump_versions, user_scope
+from .listcache import CachedListMixin, get_list_cache
+from .admission import AdmittedStream, SpeedTestAdmissionThrottle
+from .payload import PayloadFile, get_payload_pool, parse_download_size, parse_duration, parse_range_header
+from .latency import get_probe_summary, loaded_latency_fields
+from .sessions import claim_session, create_session, get_session, headline_mbps, summarize_session
+from .throughput import (
+    ThroughputSampler, download_complete_callback, get_stream_stats, is_valid_stream_id,
+    record_load_window, sample_stream
+)
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 
 # --- Utilities ---
@@ -30,31 +53,6 @@ def get_client_ip_address(request):
         ip = request.META.get('REMOTE_ADDR')
     return ip
 
-def get_isp_info(ip_address):
-    """
-    Detects ISP using an external service.
-    Note: For local development (127.0.0.1), this will return mock data.
-    """
-    if ip_address in ('127.0.0.1', '::1'):
-        return {
-            "query": ip_address,
-            "status": "success",
-            "isp": "Localhost Development",
-            "org": "SpaceX Starlink (Mock)", # Mocking for dev verification
-            "as": "AS14593 SpaceX Starlink"  # Mocking ASN
-        }
-    
-    # Use a free API for demo purposes (e.g., ip-api.com).
-    # In production, use a paid/reliable db (MaxMind).
-    try:
-        response = requests.get(f"http://ip-api.com/json/{ip_address}", timeout=3)
-        if response.status_code == 200:
-            return response.json()
-    except Exception:
-        pass
-    
-    return {"isp": "Unknown", "org": "Unknown"}
-
 # --- Parsers ---
 
 class BinaryParser(BaseParser):
@@ -66,24 +64,74 @@ class BinaryParser(BaseParser):
     def parse(self, stream, media_type=None, parser_context=None):
         return stream
 
+class NDJSONParser(BaseParser):
+    """
+    Newline-delimited JSON (one object per line), parsed into a list.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        items = []
+        for number, line in enumerate(stream or [], 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as exc:
+                raise ParseError(f'NDJSON parse error on line {number}: {exc}')
+        return items
+
+# --- Mixins ---
+
+class ValuesListMixin:
+    """
+    Serves the list action from values_list() rows through a
+    ValuesListSerializer built from serializer_class, skipping model
+    instances and per-field DRF serialization. Output is identical.
+    """
+
+    def get_read_serializer(self):
+        cls = type(self)
+        if cls.__dict__.get('_read_serializer') is None:
+            cls._read_serializer = ValuesListSerializer(self.get_serializer_class())
+        return cls._read_serializer
+
+    def get_keyset_row_key(self):
+        return self.get_read_serializer().row_getter('created_at', 'id')
+
+    def list(self, request, *args, **kwargs):
+        read_serializer = self.get_read_serializer()
+        rows = read_serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(read_serializer.to_representation(page))
+        return Response(read_serializer.to_representation(rows))
+
 # --- ViewSets ---
 
-class StarlinkKitViewSet(viewsets.ModelViewSet):
+class StarlinkKitViewSet(CachedListMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing Starlink Kits.
     Admins can see/edit all kits.
     Regular users only see/edit their own kits.
+    Lists are cached and answer 304 when nothing changed (see listcache.py).
     """
     serializer_class = StarlinkKitSerializer
     permission_classes = [IsAuthenticated]
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'bbox', 'nearest', 'clusters']:
             return [IsAuthenticated()]
         if self.request.user.is_staff:
             return [IsAuthenticated()]
         return [IsAuthenticated(), IsKitOwner()]
 
+    def get_list_version_scope(self):
+        if self.request.user.is_staff:
+            return FLEET_KITS
+        return super().get_list_version_scope()
+
     def get_queryset(self):
         if self.request.user.is_staff:
             return StarlinkKit.objects.all()
@@ -95,6 +143,63 @@ class StarlinkKitViewSet(viewsets.ModelViewSet):
         else:
             serializer.save(assigned_user=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def bbox(self, request):
+        """
+        Kits inside ?bbox=west,south,east,north, found through the geohash
+        index. Returns at most ?limit= kits (default 1000, max 5000) and
+        flags the response as truncated when more matched.
+        """
+        south, west, north, east = parse_bbox(request.query_params.get('bbox'))
+        try:
+            limit = min(max(int(request.query_params.get('limit', 1000)), 1), 5000)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        read_serializer = self.get_read_serializer()
+        rows = list(read_serializer.values(in_bbox(self.get_queryset(), south, west, north, east).order_by('id')[:limit + 1]))
+        return Response({
+            'truncated': len(rows) > limit,
+            'results': read_serializer.to_representation(rows[:limit]),
+        })
+
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        """
+        The ?n= (default 10, max 100) kits closest to ?lat=&lng=, nearest
+        first, each with its great-circle distance_km.
+        """
+        try:
+            latitude = float(request.query_params['lat'])
+            longitude = float(request.query_params['lng'])
+            count = min(max(int(request.query_params.get('n', 10)), 1), 100)
+        except (KeyError, ValueError):
+            return Response({'error': 'lat and lng are required numbers; n must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return Response({'error': 'lat/lng out of range'}, status=status.HTTP_400_BAD_REQUEST)
+        read_serializer = self.get_read_serializer()
+        ranked = nearest(self.get_queryset(), latitude, longitude, count, read_serializer.lookups)
+        results = read_serializer.to_representation(row for _, row in ranked)
+        for (distance, _), kit in zip(ranked, results):
+            kit['distance_km'] = round(distance, 3)
+        return Response({'results': results})
+
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """
+        Map markers for ?zoom= (0-20): kits grouped by geohash cell, each
+        marker with its count, mean position and bounds (or the kit id when
+        alone), optionally limited to ?bbox=west,south,east,north.
+        """
+        try:
+            zoom = int(request.query_params.get('zoom', 0))
+        except ValueError:
+            return Response({'error': 'zoom must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.get_queryset()
+        if request.query_params.get('bbox'):
+            queryset = in_bbox(queryset, *parse_bbox(request.query_params['bbox']))
+        precision, markers = clusters(queryset, zoom)
+        return Response({'zoom': zoom, 'precision': precision, 'results': markers})
+
 
 class AdminUserViewSet(viewsets.ModelViewSet):
     """
@@ -128,60 +233,307 @@ class ChangePasswordView(APIView):
         return Response({'message': 'Password updated successfully'}, status=status.HTTP_200_OK)
 
 
-class SpeedTestResultViewSet(viewsets.ModelViewSet):
+class SpeedTestResultViewSet(CachedListMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing speed test results.
     Results must be linked to a Kit owned by the user.
+    Lists are cached and answer 304 when nothing changed (see listcache.py).
     """
     serializer_class = SpeedTestResultSerializer
     permission_classes = [IsAuthenticated, IsKitOwner]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         # Return results for all kits owned by the user, ordered by most recent
-        queryset = SpeedTestResult.objects.filter(starlink_kit__assigned_user=self.request.user).order_by('-created_at')
+        queryset = SpeedTestResult.objects.filter(starlink_kit__assigned_user=self.request.user).order_by('-created_at', '-id')
         
         kit_id = self.request.query_params.get('starlink_kit')
         if kit_id:
             queryset = queryset.filter(starlink_kit__id=kit_id)
         
-        # Pagination / Limit logic
-        limit_param = self.request.query_params.get('limit', '50')
-        if limit_param == 'all':
-            return queryset
-        
+        # ?since= / ?until= time window; paging itself is done by KeysetPagination
+        return filter_time_window(queryset, self.request.query_params)
+
+    def get_keyset_partitions(self, queryset):
+        # Without a kit filter, KeysetPagination pages each of the user's kits
+        # on its (starlink_kit, created_at, id) index and merges the pages.
+        if self.request.query_params.get('starlink_kit'):
+            return None
+        kit_ids = StarlinkKit.objects.filter(assigned_user=self.request.user).values_list('id', flat=True)
+        return [queryset.filter(starlink_kit_id=kit_id) for kit_id in kit_ids]
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Batch upload of buffered measurements, as a JSON list (or
+        {"results": [...]}) or as NDJSON. Kit ownership is checked once per
+        distinct kit and valid items are inserted in one transaction; ISP
+        enrichment then resolves each distinct client_ip once per batch.
+        Invalid items are skipped and reported by their index.
+        """
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get('results')
+        if not isinstance(items, list):
+            return Response({'error': 'Expected a list of results'}, status=status.HTTP_400_BAD_REQUEST)
+        max_items = getattr(settings, 'SPEEDTEST_BULK_MAX_ITEMS', 5000)
+        if len(items) > max_items:
+            return Response({'error': f'At most {max_items} results per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # One serializer instance validates every item; its fields are built once.
+        item_serializer = SpeedTestResultBulkItemSerializer()
+        valid, errors = [], []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, item_serializer.run_validation(item)))
+            except ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+
+        kit_ids = {data['starlink_kit'] for _, data in valid}
+        owned = set(StarlinkKit.objects.filter(assigned_user=request.user, id__in=kit_ids).values_list('id', flat=True))
+        client_ip = get_client_ip_address(request)
+        results, indexes = [], []
+        for index, data in valid:
+            kit_id = data.pop('starlink_kit')
+            if kit_id not in owned:
+                errors.append({'index': index, 'errors': {'starlink_kit': ['Kit not found.']}})
+                continue
+            results.append(SpeedTestResult(
+                starlink_kit_id=kit_id,
+                client_ip=data.pop('client_ip', None) or client_ip,
+                isp_name='',
+                enrichment_status=SpeedTestResult.ENRICHMENT_PENDING,
+                **data
+            ))
+            indexes.append(index)
+
+        with transaction.atomic():
+            created = SpeedTestResult.objects.bulk_create(results, batch_size=500)
+            # bulk_create skips signals; update rollups, sketches and list versions directly
+            apply_results(created)
+            if created:
+                bump_versions([user_scope(request.user.pk)])
+            schedule_enrichment([result.pk for result in created])
+
+        errors.sort(key=lambda error: error['index'])
+        return Response({
+            'created': len(created),
+            'ids': [result.pk for result in created],
+            'errors': errors,
+        }, status=status.HTTP_201_CREATED if created or not errors else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def aggregate(self, request):
+        """
+        Per-kit time buckets (?interval=hour|day|week, default day) with the
+        count and mean/min/max/p50/p95 of each metric, computed in the
+        database. Takes the same starlink_kit/since/until filters as the list.
+        """
+        interval = request.query_params.get('interval', 'day')
+        if interval not in BUCKETS:
+            return Response({'error': f"interval must be one of {', '.join(BUCKETS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'interval': interval,
+            'results': aggregate_results(self.get_queryset(), interval),
+        })
+
+    @action(detail=False, methods=['get'])
+    def rollups(self, request):
+        """
+        Count, mean and standard deviation per kit and bucket
+        (?interval=hour|day|week|month), read only from the rollup tables so
+        the cost depends on the range, not on how many results it holds.
+        since/until select whole buckets by their start time.
+        """
+        interval = request.query_params.get('interval', 'day')
+        if interval not in ('hour', 'day', 'week', 'month'):
+            return Response({'error': 'interval must be one of hour, day, week, month'}, status=status.HTTP_400_BAD_REQUEST)
+        rollups = SpeedTestRollup.objects.filter(starlink_kit__assigned_user=request.user)
+        kit_id = request.query_params.get('starlink_kit')
+        if kit_id:
+            rollups = rollups.filter(starlink_kit__id=kit_id)
+        rollups = filter_time_window(rollups, request.query_params, field='bucket_start')
+        return Response({
+            'interval': interval,
+            'results': rollup_series(rollups, interval),
+        })
+
+    @action(detail=False, methods=['get'])
+    def percentiles(self, request):
+        """
+        Download/upload/latency percentiles (?q=50,95,99) merged from the
+        daily quantile sketches, within RELATIVE_ACCURACY of the exact value.
+        starlink_kit takes a comma-separated kit group (default: every kit
+        the user owns, or the whole fleet for staff); since/until select
+        whole UTC days; ?group=kit answers per kit instead of merged.
+        """
         try:
-            limit = int(limit_param)
-            return queryset[:limit]
+            quantiles = [float(q) / 100 for q in request.query_params.get('q', '50,95,99').split(',')]
         except ValueError:
-            return queryset[:50]
+            quantiles = []
+        if not quantiles or not all(0 <= q <= 1 for q in quantiles):
+            return Response({'error': 'q must be a comma-separated list of percentiles between 0 and 100'}, status=status.HTTP_400_BAD_REQUEST)
+
+        sketches = SpeedTestSketch.objects.all()
+        if not request.user.is_staff:
+            sketches = sketches.filter(starlink_kit__assigned_user=request.user)
+        kit_ids = request.query_params.get('starlink_kit')
+        if kit_ids:
+            try:
+                sketches = sketches.filter(starlink_kit__id__in=[int(k) for k in kit_ids.split(',')])
+            except ValueError:
+                return Response({'error': 'starlink_kit must be a comma-separated list of kit ids'}, status=status.HTTP_400_BAD_REQUEST)
+        if request.query_params.get('since'):
+            sketches = sketches.filter(day__gte=parse_time_bound(request.query_params['since'], 'since').date())
+        if request.query_params.get('until'):
+            sketches = sketches.filter(day__lt=parse_time_bound(request.query_params['until'], 'until').date())
+
+        data = {'relative_accuracy': RELATIVE_ACCURACY}
+        if request.query_params.get('group') == 'kit':
+            per_kit = {}
+            for kit_id, *row in sketches.order_by('starlink_kit').values_list('starlink_kit', 'count', 'download', 'upload', 'latency'):
+                per_kit.setdefault(kit_id, []).append(row)
+            data['results'] = [{'starlink_kit': kit_id, **merged_quantiles(rows, quantiles)} for kit_id, rows in per_kit.items()]
+        else:
+            data.update(merged_quantiles(sketches.values_list('count', 'download', 'upload', 'latency'), quantiles))
+        return Response(data)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Full result history as a download (?type=csv|ndjson, ?gzip=1),
+        streamed straight from a database cursor so memory stays flat
+        however many rows match. Takes the same starlink_kit/since/until
+        filters as the list.
+        """
+        export_format = request.query_params.get('type', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'error': f"type must be one of {', '.join(EXPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get('gzip') in ('1', 'true')
+
+        filename = f"speedtest-results-{timezone.now():%Y%m%d}.{export_format}"
+        content_type = EXPORT_FORMATS[export_format]
+        if compress:
+            filename += '.gz'
+            content_type = 'application/gzip'
+        response = StreamingHttpResponse(
+            stream_export(self.get_queryset(), export_format, compress=compress),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
     def perform_create(self, serializer):
         # Ensure the kit ID passed belongs to the user
         kit_id = self.request.data.get('starlink_kit')
         kit = get_object_or_404(StarlinkKit, id=kit_id, assigned_user=self.request.user)
         
-        # Auto-detect IP info if not provided
+        # ISP info is filled in afterwards by the enrichment worker
         client_ip = get_client_ip_address(self.request)
-        isp_data = get_isp_info(client_ip)
-        isp_name = isp_data.get('isp', '') or isp_data.get('org', '')
-        is_starlink = "Starlink" in isp_name or "SpaceX" in isp_name or "14593" in isp_data.get('as', '')
 
-        serializer.save(
+        # Pull loaded-latency percentiles measured server-side by the probe
+        test_id = serializer.validated_data.pop('test_id', None)
+        probe = get_probe_summary(test_id) if test_id else None
+
+        result = serializer.save(
             starlink_kit=kit,
             client_ip=client_ip,
-            isp_name=isp_name,
-            is_starlink=is_starlink
+            isp_name='',
+            enrichment_status=SpeedTestResult.ENRICHMENT_PENDING,
+            **loaded_latency_fields(probe)
         )
+        schedule_enrichment([result.pk])
+
+class SpeedTestSessionView(APIView):
+    """
+    Starts a server-coordinated speed test for one of the user's kits.
+    Every download/upload stream (and the loaded probe) of the run passes
+    the returned session_id as ?test_id= so the server can aggregate them.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        kit = get_object_or_404(StarlinkKit, id=request.data.get('starlink_kit'), assigned_user=request.user)
+        session_id, expires_in = create_session(request.user, kit)
+        return Response({'session_id': session_id, 'expires_in': expires_in}, status=status.HTTP_201_CREATED)
+
+class SpeedTestSessionDetailView(APIView):
+    """
+    Aggregates of the streams completed so far. After a short warm-up run,
+    clients read download.recommended_streams to size the main run.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, session_id):
+        session = get_session(session_id)
+        if session is None or session['user_id'] != request.user.id:
+            return Response({'error': 'Unknown or expired session'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'session_id': session_id, **summarize_session(session_id)})
+
+class SpeedTestSessionFinalizeView(APIView):
+    """
+    Aggregates every stream of a session into a server-measured result and
+    saves it. Latency comes from the session's loaded probe when one ran,
+    otherwise from latency_ms/jitter_ms in the request body.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, session_id):
+        session = get_session(session_id)
+        if session is None or session['user_id'] != request.user.id:
+            return Response({'error': 'Unknown or expired session'}, status=status.HTTP_404_NOT_FOUND)
+        kit = get_object_or_404(StarlinkKit, id=session['kit_id'], assigned_user=request.user)
+
+        summary = summarize_session(session_id)
+        download_mbps = headline_mbps(summary['download'])
+        upload_mbps = headline_mbps(summary['upload'])
+        if download_mbps is None or upload_mbps is None:
+            return Response({'error': 'Session has no completed download and upload streams'}, status=status.HTTP_400_BAD_REQUEST)
+
+        idle = ((summary['probe'] or {}).get('phases') or {}).get('idle') or {}
+        try:
+            latency_ms = idle.get('latency_ms')
+            if latency_ms is None:
+                latency_ms = float(request.data['latency_ms'])
+            jitter_ms = idle.get('jitter_ms')
+            if jitter_ms is None:
+                jitter_ms = float(request.data.get('jitter_ms', 0))
+        except (KeyError, TypeError, ValueError):
+            return Response({'error': 'latency_ms is required when no latency probe ran'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not claim_session(session_id):
+            return Response({'error': 'Session already finalized'}, status=status.HTTP_409_CONFLICT)
+
+        result = SpeedTestResult.objects.create(
+            starlink_kit=kit,
+            download_speed_mbps=download_mbps,
+            upload_speed_mbps=upload_mbps,
+            latency_ms=latency_ms,
+            jitter_ms=jitter_ms,
+            client_ip=get_client_ip_address(request),
+            isp_name='',
+            enrichment_status=SpeedTestResult.ENRICHMENT_PENDING,
+            **loaded_latency_fields(summary['probe'])
+        )
+        schedule_enrichment([result.pk])
+        data = SpeedTestResultSerializer(result).data
+        data['throughput'] = {'download': summary['download'], 'upload': summary['upload']}
+        return Response(data, status=status.HTTP_201_CREATED)
 
 class TicketViewSet(viewsets.ModelViewSet):
     """
     API endpoint for managing support tickets.
+    Supports filtering by status (e.g., ?status=Open).
     """
     serializer_class = TicketSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Ticket.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = Ticket.objects.filter(user=self.request.user).order_by('-created_at')
+        status_filter = self.request.query_params.get('status')
+        if status_filter:
+            queryset = queryset.filter(status=status_filter)
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -235,35 +587,72 @@ class PingView(APIView):
 class DownloadTestView(APIView):
     authentication_classes = []
     permission_classes = []
+    throttle_classes = [SpeedTestAdmissionThrottle]
 
     def get(self, request):
+        size = parse_download_size(request.query_params.get('size'))
+
+        # All streams share one pre-generated pool (see payload.py), so a
+        # request costs no os.urandom and no fresh megabyte per stream.
+        pool = get_payload_pool()
+        duration = parse_duration(request.query_params.get('duration'))
+        if duration is not None:
+            return self.timed_response(request, pool, duration)
         try:
-            size = int(request.query_params.get('size', 10 * 1024 * 1024))
-            size = min(size, 100 * 1024 * 1024) 
+            byte_range = parse_range_header(request.META.get('HTTP_RANGE'), size)
         except ValueError:
-            size = 10 * 1024 * 1024
-
-        # Optimization: Pre-generate a chunk of data to reuse
-        # os.urandom is CPU intensive. We'll generate 1MB once and cycle it.
-        chunk_size = 1024 * 1024  # 1 MB
-        static_chunk = os.urandom(chunk_size)
-
-        def file_iterator(file_size):
-            bytes_generated = 0
-            while bytes_generated < file_size:
-                needed = file_size - bytes_generated
-                if needed >= chunk_size:
-                    yield static_chunk
-                    bytes_generated += chunk_size
-                else:
-                    yield static_chunk[:needed]
-                    bytes_generated += needed
+            request.admission.release()
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        start, length = byte_range or (0, size)
+        on_complete = download_complete_callback(
+            request.query_params.get('stream_id'), request.query_params.get('test_id'), get_client_ip_address(request)
+        )
+        # sendfile() never hands the bytes back to Python, so streams that
+        # record a throughput curve (stream_id/test_id) always take the
+        # sampled path below.
+        if on_complete is None and request.META.get('wsgi.file_wrapper') and pool.covers(start, length):
+            # Let the server sendfile() straight from the payload file.
+            request.admission.record_egress(length)
+            payload = PayloadFile(pool.path, start, length, on_close=request.admission.release)
+            response = FileResponse(payload, content_type='application/octet-stream')
+        else:
+            chunks = pool.chunks(start, length)
+            if on_complete is not None:
+                chunks = sample_stream(chunks, ThroughputSampler(), on_complete)
+            response = StreamingHttpResponse(
+                AdmittedStream(chunks, request.admission),
+                content_type='application/octet-stream'
+            )
+        if byte_range:
+            response.status_code = status.HTTP_206_PARTIAL_CONTENT
+            response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+        response['Content-Length'] = length
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        return response
 
+    def timed_response(self, request, pool, duration):
+        """
+        Duration-bounded mode (?duration=seconds): stream until a server-side
+        deadline with chunk sizes following the measured rate. The length
+        isn't known up front, so the response is sent chunked.
+        """
+        sampler = ThroughputSampler()
+        chunks = pool.timed_chunks(
+            sampler.started_at + duration,
+            getattr(settings, 'SPEEDTEST_MAX_DURATION_BYTES', 2 * 1024 * 1024 * 1024),
+            sampler.adaptive_chunk_size
+        )
+        on_complete = download_complete_callback(
+            request.query_params.get('stream_id'), request.query_params.get('test_id'), get_client_ip_address(request)
+        )
         response = StreamingHttpResponse(
-            file_iterator(size),
+            AdmittedStream(sample_stream(chunks, sampler, on_complete), request.admission),
             content_type='application/octet-stream'
         )
-        response['Content-Length'] = size
         response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         return response
 
@@ -271,31 +660,60 @@ class UploadTestView(APIView):
     authentication_classes = []
     permission_classes = []
     parser_classes = [BinaryParser]
+    throttle_classes = [SpeedTestAdmissionThrottle]
 
     def post(self, request):
-        start_time = time.time()
+        try:
+            return self.receive(request)
+        finally:
+            request.admission.release()
+
+    def receive(self, request):
+        sampler = ThroughputSampler()
         stream = request.data
-        total_bytes = 0
+        # With ?duration= we stop reading at the deadline and answer early
+        duration = parse_duration(request.query_params.get('duration'))
+        deadline = sampler.started_at + duration if duration is not None else None
+        truncated = False
         
         if hasattr(stream, 'read'):
             while True:
+                if deadline is not None and time.monotonic() >= deadline:
+                    truncated = True
+                    break
                 chunk = stream.read(65536)
                 if not chunk: break
-                total_bytes += len(chunk)
+                sampler.record(len(chunk))
         elif isinstance(stream, bytes):
-            total_bytes = len(stream)
-        
-        duration = time.time() - start_time
-        if duration == 0: duration = 0.0001
-        
-        mbps = (total_bytes * 8) / (duration * 1000000)
+            sampler.record(len(stream))
+
+        test_id = request.query_params.get('test_id')
+        if is_valid_stream_id(test_id):
+            record_load_window(test_id, 'upload', sampler)
         
         return Response({
-            "received_bytes": total_bytes,
-            "duration_seconds": duration,
-            "calculated_mbps": mbps
+            "received_bytes": sampler.total_bytes,
+            "truncated": truncated,
+            **sampler.summary()
         }, status=status.HTTP_200_OK)
 
+class DownloadStatsView(APIView):
+    """
+    Server-side throughput curve for a finished download stream.
+    Streams opt in by passing ?stream_id=<id> to the download endpoint.
+    Only the address that ran the stream can read its stats; to anyone
+    else the stream is unknown.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        stream_id = request.query_params.get('stream_id', '')
+        stats = get_stream_stats(stream_id, get_client_ip_address(request)) if is_valid_stream_id(stream_id) else None
+        if stats is None:
+            return Response({'error': 'Unknown stream'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(stats)
+
 class UserInfoView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -303,6 +721,24 @@ class UserInfoView(APIView):
         serializer = UserSerializer(request.user)
         return Response(serializer.data)
 
+class ISPCacheStatsView(APIView):
+    """
+    Hit/miss counters of this worker's ISP lookup cache, for sizing it.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return Response(get_isp_cache().snapshot())
+
+class ListCacheStatsView(APIView):
+    """
+    Hit/miss counters of this worker's kit/result list cache.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return Response(get_list_cache().snapshot())
+
 class NetworkInfoView(APIView):
     authentication_classes = []
     permission_classes = []
@@ -310,9 +746,7 @@ class NetworkInfoView(APIView):
     def get(self, request):
         ip = get_client_ip_address(request)
         isp_data = get_isp_info(ip)
-        isp_name = isp_data.get('isp', '') or isp_data.get('org', '')
-        is_starlink = "Starlink" in isp_name or "SpaceX" in isp_name
-        if "14593" in isp_data.get('as', ''): is_starlink = True
+        isp_name, is_starlink = classify_isp(isp_data)
 
         data = {
             "ip": ip,
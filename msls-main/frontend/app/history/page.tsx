@@ -41,26 +41,32 @@ function HistoryContent() {
         const controller = new AbortController();
         const timeout = setTimeout(() => controller.abort(), 10000); // 10s timeout
 
-        fetch(`http://localhost:8000/api/results/?starlink_kit=${kitId}&limit=all`, {
-            headers: { 'Authorization': `Bearer ${token}` },
-            signal: controller.signal
-        })
-            .then(res => {
+        // Results are cursor-paginated; follow `next` until the kit's history is exhausted.
+        const fetchAllResults = async (): Promise<SpeedTestResult[]> => {
+            const collected: SpeedTestResult[] = [];
+            let url: string | null = `http://localhost:8000/api/results/?starlink_kit=${kitId}&page_size=1000`;
+            while (url) {
+                const res: Response = await fetch(url, {
+                    headers: { 'Authorization': `Bearer ${token}` },
+                    signal: controller.signal
+                });
                 if (!res.ok) {
                     if (res.status === 401) throw new Error('Unauthorized');
                     throw new Error('Failed to fetch');
                 }
-                return res.json();
-            })
+                const page = await res.json();
+                collected.push(...(Array.isArray(page.results) ? page.results : []));
+                url = page.next;
+            }
+            return collected;
+        };
+
+        fetchAllResults()
             .then(data => {
                 clearTimeout(timeout);
                 if (isMounted) {
-                    if (Array.isArray(data)) {
-                        const sorted = data.sort((a: any, b: any) => new Date(a.created_at).getTime() - new Date(b.created_at).getTime());
-                        setResults(sorted);
-                    } else {
-                        setResults([]);
-                    }
+                    const sorted = data.sort((a: any, b: any) => new Date(a.created_at).getTime() - new Date(b.created_at).getTime());
+                    setResults(sorted);
                     setLoading(false);
                 }
             })
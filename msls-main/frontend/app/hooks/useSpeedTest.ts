@@ -13,6 +13,47 @@ export interface SpeedTestMetrics {
   progress: number; // 0-100
 }
 
+interface ProbeSummary {
+  latency_ms: number | null;
+  jitter_ms: number | null;
+  loss_percent: number;
+}
+
+// Server-driven WebSocket probe: the backend sends timestamped frames, we echo
+// them, and it replies with RTT/jitter/loss measured against its own clock.
+// Resolves null when the backend has no probe endpoint (e.g. WSGI deploys).
+function runLatencyProbe(signal: AbortSignal, onProgress: (fraction: number) => void): Promise<ProbeSummary | null> {
+  const PROBE_COUNT = 100;
+  return new Promise((resolve) => {
+    let ws: WebSocket;
+    try {
+      ws = new WebSocket(`${API_ENDPOINTS.PROBE}?rate=50&count=${PROBE_COUNT}`);
+    } catch {
+      resolve(null);
+      return;
+    }
+    let settled = false;
+    const finish = (summary: ProbeSummary | null) => {
+      if (settled) return;
+      settled = true;
+      ws.close();
+      resolve(summary);
+    };
+    signal.addEventListener("abort", () => finish(null));
+    ws.onmessage = (event) => {
+      const frame = JSON.parse(event.data);
+      if (frame.type === "probe") {
+        ws.send(event.data);
+        onProgress((frame.seq + 1) / PROBE_COUNT);
+      } else if (frame.type === "summary") {
+        finish(frame);
+      }
+    };
+    ws.onerror = () => finish(null);
+    ws.onclose = () => finish(null);
+  });
+}
+
 export function useSpeedTest() {
   const [phase, setPhase] = useState<TestPhase>("idle");
   const [metrics, setMetrics] = useState<SpeedTestMetrics>({
@@ -48,39 +89,53 @@ export function useSpeedTest() {
 
     try {
       // --- PING PHASE ---
-      const pings: number[] = [];
-      const MAX_PINGS = 5;
-
-      for (let i = 0; i < MAX_PINGS; i++) {
-        if (signal.aborted) return;
-        const start = performance.now();
-        try {
-          await fetch(API_ENDPOINTS.PING, {
-            cache: "no-store",
-            signal,
-          });
-          const end = performance.now();
-          pings.push(end - start);
-        } catch (e) {
-          console.warn("Ping failed", e);
-          pings.push(100);
+      const probe = await runLatencyProbe(signal, (fraction) =>
+        setMetrics((m) => ({ ...m, progress: 5 + fraction * 15 }))
+      );
+
+      if (probe && probe.latency_ms !== null) {
+        setMetrics((m) => ({
+          ...m,
+          latency: probe.latency_ms,
+          jitter: probe.jitter_ms,
+          progress: 20,
+        }));
+      } else {
+        // Fallback: time HTTP round-trips to the ping endpoint.
+        const pings: number[] = [];
+        const MAX_PINGS = 5;
+
+        for (let i = 0; i < MAX_PINGS; i++) {
+          if (signal.aborted) return;
+          const start = performance.now();
+          try {
+            await fetch(API_ENDPOINTS.PING, {
+              cache: "no-store",
+              signal,
+            });
+            const end = performance.now();
+            pings.push(end - start);
+          } catch (e) {
+            console.warn("Ping failed", e);
+            pings.push(100);
+          }
+          setMetrics((m) => ({ ...m, progress: 5 + (i / MAX_PINGS) * 15 }));
         }
-        setMetrics((m) => ({ ...m, progress: 5 + (i / MAX_PINGS) * 15 }));
-      }
 
-      const validPings = pings.length > 0 ? pings : [0];
-      const avgLatency = validPings.reduce((a, b) => a + b, 0) / validPings.length;
-      const variance =
-        validPings.reduce((a, b) => a + Math.pow(b - avgLatency, 2), 0) /
-        validPings.length;
-      const jitter = Math.sqrt(variance);
-
-      setMetrics((m) => ({
-        ...m,
-        latency: avgLatency,
-        jitter: jitter,
-        progress: 20,
-      }));
+        const validPings = pings.length > 0 ? pings : [0];
+        const avgLatency = validPings.reduce((a, b) => a + b, 0) / validPings.length;
+        const variance =
+          validPings.reduce((a, b) => a + Math.pow(b - avgLatency, 2), 0) /
+          validPings.length;
+        const jitter = Math.sqrt(variance);
+
+        setMetrics((m) => ({
+          ...m,
+          latency: avgLatency,
+          jitter: jitter,
+          progress: 20,
+        }));
+      }
 
       if (signal.aborted) return;
 
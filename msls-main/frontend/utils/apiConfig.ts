@@ -1,5 +1,6 @@
 
 export const API_BASE_URL = 'https://msls-bend.vercel.app';
+export const WS_BASE_URL = API_BASE_URL.replace(/^http/, 'ws');
 
 export const API_ENDPOINTS = {
     TOKEN: `${API_BASE_URL}/api/token/`,
@@ -9,6 +10,7 @@ export const API_ENDPOINTS = {
     TICKETS: `${API_BASE_URL}/api/tickets/`,
     ACTIVATION_REQUESTS: `${API_BASE_URL}/api/activation-requests/`,
     PING: `${API_BASE_URL}/api/ping/`,
+    PROBE: `${WS_BASE_URL}/api/probe/`,
     DOWNLOAD: `${API_BASE_URL}/api/download/`,
     UPLOAD: `${API_BASE_URL}/api/upload/`,
     USERS: `${API_BASE_URL}/api/users/`,